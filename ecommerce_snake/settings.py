@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # lookups de pg_trgm (nombre__trigram_similar) en snake_shop.search
     'snake_shop',
     'django_extensions',
     'widget_tweaks',
@@ -102,6 +103,10 @@ DATABASES = {
 #     )
 }
 
+# Conexión propia en autocommit para reservar bloques de folios (ver generar_folio en snake_shop/models.py):
+# misma base que 'default'; en los tests apunta a la base de prueba de 'default'
+DATABASES['folios'] = {**DATABASES['default'], 'ATOMIC_REQUESTS': False, 'TEST': {'MIRROR': 'default'}}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -129,10 +134,64 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Derivados de imágenes de productos (snake_shop.images)
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 1024)
+IMAGE_DERIVATIVE_FORMATS = ('avif', 'webp')
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Redimensionado bajo demanda /media/r/<ancho>x<alto>/<ruta> (snake_shop.resize_cache)
+IMAGE_RESIZE_MAX_DIM = 2048
+IMAGE_RESIZE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Carpetas de MEDIA_ROOT que se pueden redimensionar (las de soporte/ no son públicas)
+IMAGE_RESIZE_CARPETAS = ('productos',)
+
+# Configuración de texto de PostgreSQL para la búsqueda (snake_shop.search y la migración 0021)
+SEARCH_CONFIG = 'spanish'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# CACHÉ
+# LocMem en desarrollo (por proceso). En producción definir REDIS_URL para que todos los
+# workers de gunicorn compartan la caché y las versiones del catálogo (requiere el paquete redis).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'snake-shop',
+        }
+    }
+
+# Caché del catálogo (snake_shop.catalog_cache)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_CACHE_STATS = True
+
+# Contadores de dashboard_admin (snake_shop/dashboard_metrics.py): segundos en caché y, en Postgres,
+# desde cuántas filas se usa la estimación de pg_class en vez de COUNT(*)
+DASHBOARD_METRICS_TTL = 30
+DASHBOARD_METRICS_ESTIMATES = True
+DASHBOARD_ESTIMATE_MIN_ROWS = 100_000
+
 # Configuración de Sesión y Carrito
 CART_SESSION_ID = 'cart'
+# 'session' (carrito dentro de la sesión) o 'db' (tablas Carrito/LineaCarrito, ver snake_shop/cart_store.py)
+CART_BACKEND = os.environ.get('CART_BACKEND', 'session')
+# Días sin actividad tras los que `manage.py expirar_carritos` borra un carrito persistente
+CART_EXPIRY_DAYS = 30
+# Segundos que vale la cotización firmada del checkout (snake_shop/checkout_quote.py)
+CHECKOUT_QUOTE_TTL = 15 * 60
+# Folios SS-YYYY-00001 reservados por bloque en cada proceso (ver generar_folio en snake_shop/models.py)
+FOLIO_BLOCK_SIZE = 20
+FOLIO_DB_ALIAS = 'folios'
+# Horas que un pedido puede quedar sin pagar antes de que `manage.py expirar_pedidos` devuelva su stock
+PENDING_ORDER_TTL_HOURS = 24
 LOGIN_REDIRECT_URL = 'lista_productos'
 LOGOUT_REDIRECT_URL = 'login'
 
@@ -146,6 +205,15 @@ DEFAULT_FROM_EMAIL = 'soporte@snakeshop.com'
 FLOW_API_KEY = os.environ.get('FLOW_API_KEY')
 FLOW_SECRET_KEY = os.environ.get('FLOW_SECRET_KEY')
 FLOW_URL_BASE = os.environ.get('FLOW_URL_BASE', 'https://sandbox.flow.cl/api')
+# Cliente HTTP (snake_shop/flow.py): timeouts en segundos, reintentos y circuit breaker
+FLOW_CONNECT_TIMEOUT = 3.05
+FLOW_READ_TIMEOUT = 10
+FLOW_MAX_RETRIES = 2
+FLOW_BREAKER_THRESHOLD = 5
+FLOW_BREAKER_COOLDOWN = 30
+# Conciliación de pagos pendientes (manage.py reconcile_payments)
+FLOW_RECONCILE_WORKERS = 4
+FLOW_RECONCILE_RPS = 5
 
 
 
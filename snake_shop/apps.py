@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SnakeShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'snake_shop'
+
+    def ready(self):
+        # Registra las señales del índice de búsqueda, la caché del catálogo y los derivados de imágenes
+        from . import catalog_cache, images, search  # noqa: F401
@@ -1,31 +1,48 @@
 # snake_shop/cart.py
 from decimal import Decimal
-from django.conf import settings
+from .cart_store import calcular_resumen, get_almacen
 from .models import Producto
 
+# Campos pesados que el carrito no muestra: se cargan solo si alguien los pide
+CAMPOS_DIFERIDOS = ('descripcion', 'search_vector')
+
+
+class ItemCarrito:
+    # Línea del carrito ya resuelta (producto + precio efectivo). Con __slots__ para que sea liviana.
+    __slots__ = ('producto', 'cantidad', 'precio', 'total_precio', 'update_cantidad_form')
+
+    def __init__(self, producto, cantidad):
+        self.producto = producto
+        self.cantidad = cantidad
+        self.precio = producto.calcular_precio_efectivo()
+        self.total_precio = self.precio * cantidad
+        self.update_cantidad_form = None
+
+
 class Cart:
     def __init__(self, request):
 
-        # Inicializa el carrito.
+        # Inicializa el carrito. El contenido lo guarda el almacén configurado (ver cart_store.py).
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # guarda un carrito vacío en la sesión
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.almacen = get_almacen(request)
+        self.cart = self.almacen.cargar()
+        # Items resueltos y totales; se calculan una sola vez por request (ver _resolver)
+        self._items = None
+        self._subtotal = None
 
     def add(self, producto, cantidad=1, override_cantidad=False):
 
         # Agrega un producto al carrito o actualiza su cantidad.
         producto_id = str(producto.id)
-        
+
         if producto_id not in self.cart:
             self.cart[producto_id] = {
                 'cantidad': 0,
-                # Convertimos el Decimal a string aquí
-                'precio': str(producto.precio)
             }
-        
+        # Precio efectivo al momento de agregar (Decimal como string). Solo alimenta el resumen
+        # (subtotal aproximado del encabezado); los totales reales se calculan con el precio actual.
+        self.cart[producto_id]['precio'] = str(producto.calcular_precio_efectivo())
+
         # Obtenemos la cantidad actual, asegurando que sea un número (o 0 si es None)
         current_cantidad = self.cart[producto_id].get('cantidad')
         if current_cantidad is None:
@@ -36,11 +53,20 @@ class Cart:
         else:
             self.cart[producto_id]['cantidad'] = current_cantidad + cantidad
 
+        # Solo se persiste la línea modificada
+        self.almacen.guardar_linea(producto_id, self.cart[producto_id])
         self.save()
 
     def save(self):
-        # marca la sesión como "modificada" para asegurar que se guarde
-        self.session.modified = True
+        # el contenido cambió: los items resueltos ya no sirven y el resumen se recalcula
+        # (en memoria, sin consultas) para que leerlo después sea O(1)
+        self._items = None
+        self._subtotal = None
+        self.almacen.guardar_resumen(calcular_resumen(self.cart))
+
+    def resumen(self):
+        # {'cantidad': int, 'subtotal': Decimal} mantenido en cada add/remove/clear
+        return self.almacen.resumen()
 
     def remove(self, producto):
 
@@ -48,57 +74,50 @@ class Cart:
         producto_id = str(producto.id)
         if producto_id in self.cart:
             del self.cart[producto_id]
+            self.almacen.eliminar_linea(producto_id)
             self.save()
 
+    def _resolver(self):
+        # Una sola consulta por PK para todos los productos y una sola pasada para subtotal.
+        # Los items no se persisten (no son serializables); el almacén solo guarda id -> cantidad/precio.
+        if self._items is not None:
+            return self._items
+        productos = Producto.objects.defer(*CAMPOS_DIFERIDOS).in_bulk(
+            [int(producto_id) for producto_id in self.cart]
+        )
+        items = []
+        subtotal = Decimal('0')
+        for producto_id, datos in self.cart.items():
+            producto = productos.get(int(producto_id))
+            if producto is None:
+                continue  # el producto se eliminó del catálogo
+            item = ItemCarrito(producto, datos.get('cantidad') or 0)
+            subtotal += item.total_precio
+            items.append(item)
+        self._items = items
+        self._subtotal = subtotal
+        return items
+
     def __iter__(self):
 
-        # Itera sobre los items del carrito y obtiene los productos de la base de datos.
-        producto_ids = self.cart.keys()
-        productos = Producto.objects.filter(id__in=producto_ids)
-        cart = self.cart.copy()
-        for producto in productos:
-            cart[str(producto.id)]['producto'] = producto
-
-        for item in cart.values():
-            # Convertimos el string de vuelta a Decimal para los cálculos
-            precio = (
-                producto.precio_promocion
-                if producto.en_promocion and producto.precio_promocion
-                else producto.precio
-            )
-            item['precio'] = precio
-            item['total_precio'] = precio * item['cantidad']
-
-            yield item
-            
-            # Precio promocional si aplica
-            precio = producto.precio_promocion if producto.en_promocion and producto.precio_promocion else producto.precio
-            item['precio'] = precio
-            item['total_precio'] = precio * item['cantidad']
-            # yield item
+        # Itera sobre los items del carrito (en el orden en que se agregaron).
+        return iter(self._resolver())
 
     def __len__(self):
 
-        # Cuenta todos los items en el carrito.
-        return sum(item['cantidad'] for item in self.cart.values())
+        # Cuenta todos los items en el carrito (sin consultar la base de datos).
+        return sum(item.get('cantidad') or 0 for item in self.cart.values())
 
     def get_total_precio(self):
-        total = Decimal('0')
-        for item in self:
-            # Usa precio_promocion si está en promoción
-            precio = (
-                item['producto'].precio_promocion
-                if item['producto'].en_promocion and item['producto'].precio_promocion
-                else item['producto'].precio
-            )
-            total += precio * item['cantidad']
-        return total
-
-    
+        self._resolver()
+        return self._subtotal
+
+
     def get_costo_envio(request):
         return 3990 if request.session.get("tipo_envio") == "despacho" else 0
 
     def clear(self):
-        # elimina el carrito de la sesión
-        del self.session[settings.CART_SESSION_ID]
+        # vacía el carrito (sesión o tablas, según el almacén)
+        self.almacen.vaciar()
+        self.cart = {}
         self.save()
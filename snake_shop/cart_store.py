@@ -0,0 +1,253 @@
+# snake_shop/cart_store.py
+# Dónde vive el contenido del carrito. Cart (cart.py) trabaja siempre con un dict
+# {producto_id (str): {'cantidad': int, 'precio': str}} y delega la persistencia en un almacén:
+# - AlmacenSesion (CART_BACKEND = 'session', por defecto): el dict va dentro de la sesión, como siempre.
+# - AlmacenBD (CART_BACKEND = 'db'): tablas Carrito/LineaCarrito. Cada cambio toca solo su línea
+#   (sin reescribir la sesión completa) y el carrito del usuario se comparte entre dispositivos.
+#   A los invitados se les guarda en la sesión solo el id de su carrito.
+# Además cada almacén guarda un resumen (cantidad de unidades y subtotal) que se actualiza al escribir,
+# así el contador del encabezado (context_processors.cart_counter) no recorre las líneas en cada página.
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Carrito, LineaCarrito
+
+BACKEND = getattr(settings, 'CART_BACKEND', 'session')
+SESION_CARRITO_ID = 'carrito_id'
+SESION_RESUMEN = f'{settings.CART_SESSION_ID}_resumen'
+RESUMEN_VACIO = {'cantidad': 0, 'subtotal': Decimal('0')}
+
+
+def calcular_resumen(lineas):
+    cantidad = 0
+    subtotal = Decimal('0')
+    for linea in lineas.values():
+        unidades = linea.get('cantidad') or 0
+        cantidad += unidades
+        subtotal += Decimal(linea.get('precio') or 0) * unidades
+    return {'cantidad': cantidad, 'subtotal': subtotal}
+
+
+class AlmacenSesion:
+    def __init__(self, request):
+        self.session = request.session
+
+    def cargar(self):
+        cart = self.session.get(settings.CART_SESSION_ID)
+        if not cart:
+            # guarda un carrito vacío en la sesión
+            cart = self.session[settings.CART_SESSION_ID] = {}
+        return cart
+
+    def guardar_linea(self, producto_id, linea):
+        # El dict de Cart es el mismo objeto que está en la sesión: basta con marcarla modificada
+        self.session.modified = True
+
+    def eliminar_linea(self, producto_id):
+        self.session.modified = True
+
+    def vaciar(self):
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.session.modified = True
+
+    def guardar_resumen(self, resumen):
+        self.session[SESION_RESUMEN] = {'cantidad': resumen['cantidad'], 'subtotal': str(resumen['subtotal'])}
+
+    def resumen(self):
+        guardado = self.session.get(SESION_RESUMEN)
+        if guardado is None:
+            cart = self.session.get(settings.CART_SESSION_ID)
+            if not cart:
+                return dict(RESUMEN_VACIO)
+            # Sesiones anteriores al resumen: se calcula una vez y queda guardado
+            resumen = calcular_resumen(cart)
+            self.guardar_resumen(resumen)
+            return resumen
+        return {'cantidad': guardado['cantidad'], 'subtotal': Decimal(guardado['subtotal'])}
+
+    def firma(self):
+        return self.session.get(settings.CART_SESSION_ID) or {}
+
+
+class AlmacenBD:
+    def __init__(self, request):
+        self.session = request.session
+        self.usuario = request.user if request.user.is_authenticated else None
+        self._carrito_id = None
+        self._verificado = False
+
+    def _buscar_carrito_id(self):
+        if self._carrito_id is None:
+            if self.usuario is not None:
+                self._carrito_id = (
+                    Carrito.objects.filter(usuario=self.usuario).values_list('pk', flat=True).first()
+                )
+            else:
+                self._carrito_id = self.session.get(SESION_CARRITO_ID)
+        return self._carrito_id
+
+    def _carrito_id_para_escribir(self):
+        # El carrito se crea recién con la primera línea: las visitas sin compra no generan filas
+        carrito_id = self._buscar_carrito_id()
+        if carrito_id is not None and self.usuario is None and not self._verificado:
+            # El id de la sesión puede apuntar a un carrito que expirar_carritos ya borró
+            if not Carrito.objects.filter(pk=carrito_id).exists():
+                self.session.pop(SESION_CARRITO_ID, None)
+                carrito_id = self._carrito_id = None
+            self._verificado = True
+        if carrito_id is None:
+            if self.usuario is not None:
+                carrito, _ = Carrito.objects.get_or_create(usuario=self.usuario)
+            else:
+                carrito = Carrito.objects.create()
+                self.session[SESION_CARRITO_ID] = carrito.pk
+            carrito_id = self._carrito_id = carrito.pk
+            self._verificado = True
+        return carrito_id
+
+    def cargar(self):
+        carrito_id = self._buscar_carrito_id()
+        if carrito_id is None:
+            return {}
+        lineas = LineaCarrito.objects.filter(carrito_id=carrito_id).order_by('pk')
+        return {
+            str(producto_id): {'cantidad': cantidad, 'precio': str(precio)}
+            for producto_id, cantidad, precio in lineas.values_list('producto_id', 'cantidad', 'precio')
+        }
+
+    def guardar_linea(self, producto_id, linea):
+        carrito_id = self._carrito_id_para_escribir()
+        valores = {'cantidad': linea['cantidad'], 'precio': linea['precio']}
+        actualizadas = LineaCarrito.objects.filter(
+            carrito_id=carrito_id, producto_id=producto_id
+        ).update(**valores)
+        if not actualizadas:
+            try:
+                with transaction.atomic():
+                    LineaCarrito.objects.create(carrito_id=carrito_id, producto_id=producto_id, **valores)
+            except IntegrityError:
+                # Otro request creó la misma línea en paralelo (linea_carrito_unica). Si no hay línea que
+                # actualizar el error era otro (p. ej. el carrito se borró entremedio) y no se oculta.
+                if not LineaCarrito.objects.filter(
+                    carrito_id=carrito_id, producto_id=producto_id
+                ).update(**valores):
+                    raise
+
+    def eliminar_linea(self, producto_id):
+        carrito_id = self._buscar_carrito_id()
+        if carrito_id is not None:
+            LineaCarrito.objects.filter(carrito_id=carrito_id, producto_id=producto_id).delete()
+
+    def vaciar(self):
+        carrito_id = self._buscar_carrito_id()
+        if carrito_id is not None:
+            LineaCarrito.objects.filter(carrito_id=carrito_id).delete()
+
+    def guardar_resumen(self, resumen):
+        # Se llama después de cada escritura: `actualizado` marca la última actividad (para expirar
+        # abandonados) y el resumen queda en la misma fila, sin pasar por save()
+        carrito_id = self._buscar_carrito_id()
+        if carrito_id is None:
+            return
+        Carrito.objects.filter(pk=carrito_id).update(
+            actualizado=timezone.now(),
+            cantidad_items=resumen['cantidad'],
+            subtotal=resumen['subtotal'],
+        )
+
+    def _carritos(self):
+        # Una consulta por PK (o por usuario) y solo si alguien lo pide; los invitados sin carrito no consultan
+        if self.usuario is not None:
+            return Carrito.objects.filter(usuario=self.usuario)
+        if self.session.get(SESION_CARRITO_ID) is not None:
+            return Carrito.objects.filter(pk=self.session[SESION_CARRITO_ID])
+        return None
+
+    def resumen(self):
+        carritos = self._carritos()
+        fila = carritos.values_list('cantidad_items', 'subtotal').first() if carritos is not None else None
+        if fila is None:
+            return dict(RESUMEN_VACIO)
+        return {'cantidad': fila[0], 'subtotal': fila[1]}
+
+    def firma(self):
+        # Sale de la fila del carrito: guardar_resumen cambia `actualizado` en cada escritura
+        carritos = self._carritos()
+        fila = carritos.values_list('pk', 'actualizado').first() if carritos is not None else None
+        return list(fila) if fila else None
+
+
+ALMACENES = {
+    'session': AlmacenSesion,
+    'db': AlmacenBD,
+}
+
+def get_almacen(request):
+    return ALMACENES[BACKEND](request)
+
+def resumen_carrito(request):
+    return get_almacen(request).resumen()
+
+# Login: el carrito de invitado pasa al carrito del usuario
+def fusionar_carrito_invitado(request, usuario):
+    # Llamar antes de login(): después la sesión puede vaciarse (flush) si había otro usuario.
+    # Si un producto está en ambos carritos se queda la cantidad mayor (no se suman, para no
+    # duplicar lo que el usuario vuelve a agregar en otro dispositivo).
+    if BACKEND != 'db':
+        return  # con sesiones el carrito de invitado sobrevive al cambio de clave de sesión
+    invitado_id = request.session.pop(SESION_CARRITO_ID, None)
+    if invitado_id is None:
+        return
+    with transaction.atomic():
+        lineas_invitado = list(LineaCarrito.objects.filter(carrito_id=invitado_id))
+        if lineas_invitado:
+            carrito, _ = Carrito.objects.get_or_create(usuario=usuario)
+            existentes = {
+                linea.producto_id: linea
+                for linea in LineaCarrito.objects.select_for_update().filter(carrito=carrito)
+            }
+            nuevas, modificadas = [], []
+            for linea in lineas_invitado:
+                actual = existentes.get(linea.producto_id)
+                if actual is None:
+                    nuevas.append(LineaCarrito(
+                        carrito=carrito, producto_id=linea.producto_id,
+                        cantidad=linea.cantidad, precio=linea.precio,
+                    ))
+                elif linea.cantidad > actual.cantidad:
+                    actual.cantidad = linea.cantidad
+                    modificadas.append(actual)
+            LineaCarrito.objects.bulk_create(nuevas)
+            LineaCarrito.objects.bulk_update(modificadas, ['cantidad'])
+            totales = LineaCarrito.objects.filter(carrito=carrito).aggregate(
+                unidades=Sum('cantidad'), monto=Sum(F('cantidad') * F('precio')),
+            )
+            Carrito.objects.filter(pk=carrito.pk).update(
+                actualizado=timezone.now(),
+                cantidad_items=totales['unidades'] or 0,
+                subtotal=totales['monto'] or 0,
+            )
+        Carrito.objects.filter(pk=invitado_id, usuario__isnull=True).delete()
+
+# Limpieza de carritos abandonados
+def expirar_carritos(dias=None, batch_size=1000):
+    # Borra por lotes de PKs los carritos sin actividad en `dias` días. Devuelve la cantidad borrada.
+    dias = getattr(settings, 'CART_EXPIRY_DAYS', 30) if dias is None else dias
+    limite = timezone.now() - timedelta(days=dias)
+    total = 0
+    while True:
+        ids = list(
+            Carrito.objects.filter(actualizado__lt=limite).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        with transaction.atomic():
+            # Primero las líneas en una sola sentencia, así el borrado de carritos no las recorre
+            LineaCarrito.objects.filter(carrito_id__in=ids).delete()
+            Carrito.objects.filter(pk__in=ids).delete()
+        total += len(ids)
@@ -0,0 +1,173 @@
+# snake_shop/catalog_cache.py
+# Caché versionada para lecturas del catálogo (categorías, carrusel de promociones, tarjetas de producto).
+# En vez de borrar claves, cada cambio sube un número de versión y las claves viejas simplemente dejan de leerse:
+# - versión global: cambia con cualquier Producto/Categoria guardado o eliminado.
+# - versión por categoría: cambia solo con los productos de esa categoría (listados por categoría, ETags).
+# Con LocMemCache (desarrollo) cada proceso tiene su propia caché; en producción usar REDIS_URL.
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Categoria, Producto
+
+PREFIJO = 'catalogo'
+TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+REGISTRAR_ESTADISTICAS = getattr(settings, 'CATALOG_CACHE_STATS', True)
+KEY_GLOBAL = f'{PREFIJO}:v:global'
+KEY_HITS = f'{PREFIJO}:stats:hits'
+KEY_MISSES = f'{PREFIJO}:stats:misses'
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+def _key_categoria(categoria_id):
+    return f'{PREFIJO}:v:cat:{categoria_id}'
+
+# Versiones
+def _versiones(keys):
+    cache = get_cache()
+    valores = cache.get_many(keys)
+    for key in keys:
+        if key not in valores:
+            # Si la versión se perdió (expulsión o reinicio) se inicia con el reloj para no
+            # reutilizar un número viejo que todavía tenga entradas cacheadas.
+            cache.add(key, time.time_ns(), timeout=None)
+            valores[key] = cache.get(key)
+    return valores
+
+def version_global():
+    return _versiones([KEY_GLOBAL])[KEY_GLOBAL]
+
+def version_categoria(categoria_id):
+    key = _key_categoria(categoria_id)
+    return _versiones([key])[key]
+
+def version_catalogo(categoria_id=None):
+    # Versión que identifica el estado de un listado (todo el catálogo o una categoría).
+    if categoria_id is None:
+        return str(version_global())
+    return f'c{categoria_id}.{version_categoria(categoria_id)}'
+
+def _subir_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+def invalidar_catalogo(categoria_ids=()):
+    _subir_version(KEY_GLOBAL)
+    for categoria_id in set(categoria_ids):
+        if categoria_id is not None:
+            _subir_version(_key_categoria(categoria_id))
+
+# Lectura con contadores de aciertos
+def _registrar(acierto):
+    if not REGISTRAR_ESTADISTICAS:
+        return
+    key = KEY_HITS if acierto else KEY_MISSES
+    try:
+        get_cache().incr(key)
+    except ValueError:
+        get_cache().add(key, 1, timeout=None)
+
+def obtener(key, calcular, timeout=TIMEOUT):
+    cache = get_cache()
+    valor = cache.get(key)
+    if valor is not None:
+        _registrar(True)
+        return valor
+    _registrar(False)
+    valor = calcular()
+    cache.set(key, valor, timeout)
+    return valor
+
+def estadisticas():
+    valores = get_cache().get_many([KEY_HITS, KEY_MISSES])
+    hits = valores.get(KEY_HITS, 0)
+    misses = valores.get(KEY_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'ratio': round(hits / total, 4) if total else 0,
+        'version_global': version_global(),
+    }
+
+def reiniciar_estadisticas():
+    get_cache().delete_many([KEY_HITS, KEY_MISSES])
+
+# Lecturas del catálogo
+def obtener_categorias():
+    return obtener(
+        f'{PREFIJO}:categorias:{version_global()}',
+        lambda: list(Categoria.objects.all()),
+    )
+
+# Muestras aleatorias (sin ORDER BY RANDOM(), que ordena la tabla completa)
+# Cada proceso guarda en memoria la lista de IDs candidatos y la renueva solo cuando cambia la versión
+# global; por request se sortean los IDs en Python y se traen con una consulta por PK.
+_pools = {}
+
+def pool_ids(nombre, queryset):
+    version = version_global()
+    actual = _pools.get(nombre)
+    if actual is not None and actual[0] == version:
+        return actual[1]
+    ids = obtener(
+        f'{PREFIJO}:pool:{nombre}:{version}',
+        lambda: list(queryset.order_by().values_list('pk', flat=True)),
+    )
+    _pools[nombre] = (version, ids)
+    return ids
+
+def muestra_aleatoria(nombre, queryset, cantidad):
+    ids = pool_ids(nombre, queryset)
+    elegidos = random.sample(ids, min(cantidad, len(ids)))
+    if not elegidos:
+        return []
+    productos = queryset.in_bulk(elegidos)
+    return [productos[pk] for pk in elegidos if pk in productos]
+
+def obtener_promociones(limite=3):
+    # Productos en promoción al azar para el carrusel (home y lista_productos)
+    promociones = Producto.objects.filter(en_promocion=True, disponible=True).select_related('categoria')
+    return muestra_aleatoria('promociones', promociones, limite)
+
+def tarjeta_producto(producto):
+    # El HTML de la tarjeta depende solo del producto; la clave incluye `actualizado`,
+    # así que cualquier cambio del producto genera una clave nueva.
+    key = f'{PREFIJO}:tarjeta:{producto.pk}:{producto.actualizado.timestamp():.6f}'
+    html = obtener(
+        key,
+        lambda: render_to_string('snake_shop/tarjeta_producto.html', {'producto': producto}),
+    )
+    return mark_safe(html)
+
+# Señales: invalidación automática al cambiar el catálogo
+@receiver(post_init, sender=Producto)
+def recordar_categoria_cargada(sender, instance, **kwargs):
+    # Si el producto cambia de categoría, también hay que invalidar la de origen: se anota la categoría con
+    # la que se cargó la instancia (sin consultas; si categoria_id vino diferido no se lee aquí).
+    instance._categoria_cargada_id = instance.__dict__.get('categoria_id')
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_por_producto(sender, instance, **kwargs):
+    categorias = {instance.categoria_id, getattr(instance, '_categoria_cargada_id', None)}
+    # Un segundo save() de la misma instancia compara contra lo que quedó guardado ahora
+    instance._categoria_cargada_id = instance.categoria_id
+    transaction.on_commit(lambda: invalidar_catalogo(categorias))
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_por_categoria(sender, instance, **kwargs):
+    categoria_id = instance.pk
+    transaction.on_commit(lambda: invalidar_catalogo([categoria_id]))
@@ -0,0 +1,278 @@
+# snake_shop/catalog_io.py
+# Importación / exportación masiva del catálogo en CSV o JSONL, en streaming (memoria constante).
+# Usado por los comandos import_productos y export_productos.
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import catalog_cache, search
+from .models import Categoria, Producto
+
+COLUMNAS = [
+    'slug', 'nombre', 'categoria', 'descripcion', 'precio', 'precio_promocion',
+    'en_promocion', 'stock', 'disponible', 'vendedor', 'imagen',
+]
+# Campos que se recalculan en cada producto modificado (además de los que cambiaron en la fila)
+CAMPOS_DERIVADOS = ['precio_efectivo', 'actualizado']
+PRECIO_MAXIMO = Decimal('100000000')  # max_digits=10, decimal_places=2
+BULK_UPDATE_BATCH = 250
+VERDADEROS = {'1', 'true', 'si', 'sí', 'yes', 'y', 'x'}
+
+
+class FilaInvalida(ValueError):
+    pass
+
+
+# Lectura / escritura de formatos
+def detectar_formato(nombre_archivo, formato=None):
+    if formato:
+        return formato
+    return 'jsonl' if str(nombre_archivo).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+def leer_filas(archivo, formato):
+    # Generador de (número de línea, dict) sin cargar el archivo completo
+    if formato == 'jsonl':
+        for numero, linea in enumerate(archivo, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                fila = json.loads(linea)
+            except json.JSONDecodeError as e:
+                yield numero, FilaInvalida(f'JSON inválido: {e}')
+                continue
+            if not isinstance(fila, dict):
+                yield numero, FilaInvalida('se esperaba un objeto JSON por línea')
+                continue
+            yield numero, fila
+    else:
+        lector = csv.DictReader(archivo)
+        for numero, fila in enumerate(lector, start=2):  # la línea 1 es el encabezado
+            yield numero, fila
+
+def escribir_filas(archivo, filas, formato, progreso=None, cada=10000):
+    # Escribe las filas a medida que llegan. Devuelve la cantidad escrita.
+    if formato == 'jsonl':
+        escribir = lambda fila: archivo.write(json.dumps(fila, ensure_ascii=False, default=str) + '\n')
+    else:
+        escritor = csv.DictWriter(archivo, fieldnames=COLUMNAS)
+        escritor.writeheader()
+        escribir = escritor.writerow
+    total = 0
+    for fila in filas:
+        escribir(fila)
+        total += 1
+        if progreso and total % cada == 0:
+            progreso(total)
+    return total
+
+def lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+# Conversión de valores
+def _texto(fila, campo, default=''):
+    valor = fila.get(campo)
+    return default if valor is None else str(valor).strip()
+
+def _decimal(valor, campo, opcional=False):
+    if valor in (None, ''):
+        if opcional:
+            return None
+        raise FilaInvalida(f'{campo} es obligatorio')
+    try:
+        numero = Decimal(str(valor).replace(',', '.'))
+    except InvalidOperation:
+        raise FilaInvalida(f'{campo} no es un número válido: {valor!r}')
+    if numero < 0 or numero >= PRECIO_MAXIMO:
+        raise FilaInvalida(f'{campo} fuera de rango: {valor!r}')
+    return numero.quantize(Decimal('0.01'))
+
+def _entero(valor, campo, default=0):
+    if valor in (None, ''):
+        return default
+    try:
+        numero = int(str(valor).strip())
+    except ValueError:
+        raise FilaInvalida(f'{campo} no es un entero válido: {valor!r}')
+    if numero < 0:
+        raise FilaInvalida(f'{campo} no puede ser negativo')
+    return numero
+
+def _booleano(valor, default=False):
+    if valor in (None, ''):
+        return default
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() in VERDADEROS
+
+
+class Importador:
+    # Importa filas por lotes: crea con bulk_create y actualiza con bulk_update usando el slug como clave.
+    def __init__(self, vendedor_default=None, crear_categorias=False, dry_run=False, max_errores=50):
+        self.vendedor_default = vendedor_default
+        self.crear_categorias = crear_categorias
+        self.dry_run = dry_run
+        self.creados = 0
+        self.actualizados = 0
+        self.sin_cambios = 0
+        # Solo se guardan los primeros errores para no crecer en memoria con archivos grandes
+        self.max_errores = max_errores
+        self.errores = []
+        self.total_errores = 0
+        self.categorias_tocadas = set()
+        # Mapas en memoria: una sola consulta para categorías, usuarios resueltos bajo demanda
+        self.categorias = {}
+        for categoria in Categoria.objects.all():
+            self.categorias[categoria.slug] = categoria
+            self.categorias.setdefault(categoria.nombre.strip().lower(), categoria)
+        self.vendedores = {}
+
+    def _error(self, numero, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < self.max_errores:
+            self.errores.append((numero, mensaje))
+
+    def _categoria(self, valor):
+        clave = valor.strip()
+        categoria = self.categorias.get(clave) or self.categorias.get(clave.lower())
+        if categoria is None:
+            if not self.crear_categorias:
+                raise FilaInvalida(f'categoría desconocida: {valor!r}')
+            categoria = Categoria(nombre=clave, slug=slugify(clave))
+            if not self.dry_run:
+                categoria.save()
+            self.categorias[categoria.slug] = categoria
+            self.categorias[clave.lower()] = categoria
+        return categoria
+
+    def _cargar_vendedores(self, filas):
+        faltantes = {_texto(f, 'vendedor') for f in filas} - set(self.vendedores) - {''}
+        if faltantes:
+            for user in User.objects.filter(username__in=faltantes):
+                self.vendedores[user.username] = user
+
+    def _vendedor(self, username):
+        if not username:
+            if self.vendedor_default is None:
+                raise FilaInvalida('vendedor es obligatorio (columna vendedor o --vendedor)')
+            return self.vendedor_default
+        if username not in self.vendedores:
+            raise FilaInvalida(f'vendedor desconocido: {username!r}')
+        return self.vendedores[username]
+
+    def _convertir(self, fila):
+        slug = _texto(fila, 'slug') or slugify(_texto(fila, 'nombre'))
+        if not slug:
+            raise FilaInvalida('slug o nombre es obligatorio')
+        nombre = _texto(fila, 'nombre')
+        if not nombre:
+            raise FilaInvalida('nombre es obligatorio')
+        datos = {
+            'slug': slug[:200],
+            'nombre': nombre[:200],
+            'categoria': self._categoria(_texto(fila, 'categoria')),
+            'descripcion': _texto(fila, 'descripcion'),
+            'precio': _decimal(fila.get('precio'), 'precio'),
+            'precio_promocion': _decimal(fila.get('precio_promocion'), 'precio_promocion', opcional=True),
+            'en_promocion': _booleano(fila.get('en_promocion')),
+            'stock': _entero(fila.get('stock'), 'stock'),
+            'disponible': _booleano(fila.get('disponible'), default=True),
+            'vendedor': self._vendedor(_texto(fila, 'vendedor')),
+            'imagen': _texto(fila, 'imagen'),
+        }
+        return datos
+
+    @staticmethod
+    def _aplicar_cambios(producto, datos):
+        # Asigna solo lo que cambió y devuelve esos campos; las filas idénticas no se reescriben
+        cambios = set()
+        for campo, valor in datos.items():
+            if campo in ('categoria', 'vendedor'):
+                actual, nuevo = getattr(producto, f'{campo}_id'), valor.pk
+            elif campo == 'imagen':
+                actual, nuevo = producto.imagen.name or '', valor
+            else:
+                actual, nuevo = getattr(producto, campo), valor
+            if actual != nuevo:
+                setattr(producto, campo, valor)
+                cambios.add(campo)
+        return cambios
+
+    def procesar_lote(self, lote):
+        # lote: lista de (número de línea, fila)
+        filas_validas = [(n, f) for n, f in lote if not isinstance(f, Exception)]
+        for numero, fila in lote:
+            if isinstance(fila, Exception):
+                self._error(numero, str(fila))
+        self._cargar_vendedores([f for _, f in filas_validas])
+
+        por_slug = {}
+        for numero, fila in filas_validas:
+            try:
+                datos = self._convertir(fila)
+            except FilaInvalida as e:
+                self._error(numero, str(e))
+                continue
+            por_slug[datos['slug']] = datos  # si el slug se repite en el lote, gana la última fila
+
+        existentes = {}
+        for producto in Producto.objects.filter(slug__in=por_slug.keys()).order_by('pk'):
+            existentes.setdefault(producto.slug, producto)
+
+        ahora = timezone.now()
+        nuevos, modificados = [], []
+        campos_modificados = set()
+        for slug, datos in por_slug.items():
+            producto = existentes.get(slug)
+            if producto is None:
+                producto = Producto(**datos)
+                nuevos.append(producto)
+            elif cambios := self._aplicar_cambios(producto, datos):
+                modificados.append(producto)
+                campos_modificados |= cambios
+            else:
+                self.sin_cambios += 1
+                continue
+            # bulk_create/bulk_update no pasan por save() ni pre_save
+            producto.precio_efectivo = producto.calcular_precio_efectivo()
+            producto.actualizado = ahora
+            self.categorias_tocadas.add(producto.categoria_id)
+
+        self.creados += len(nuevos)
+        self.actualizados += len(modificados)
+        if self.dry_run:
+            return
+
+        with transaction.atomic():
+            Producto.objects.bulk_create(nuevos)
+            # bulk_update arma un CASE por campo: solo los campos que cambiaron en el lote y lotes chicos
+            if modificados:
+                campos = sorted(campos_modificados) + CAMPOS_DERIVADOS
+                Producto.objects.bulk_update(modificados, campos, batch_size=BULK_UPDATE_BATCH)
+            # Las operaciones masivas no disparan señales: el índice de búsqueda se actualiza por lote
+            search.actualizar_indice([p.pk for p in nuevos + modificados if p.pk])
+
+    def finalizar(self):
+        if not self.dry_run:
+            catalog_cache.invalidar_catalogo(self.categorias_tocadas)
+
+
+def filas_exportacion(chunk_size=2000, categoria=None):
+    # Generador de dicts listo para CSV/JSONL, leyendo la tabla por bloques del cursor
+    productos = Producto.objects.order_by('pk')
+    if categoria:
+        productos = productos.filter(categoria__slug=categoria)
+    valores = productos.values_list(
+        'slug', 'nombre', 'categoria__slug', 'descripcion', 'precio', 'precio_promocion',
+        'en_promocion', 'stock', 'disponible', 'vendedor__username', 'imagen',
+    )
+    for fila in valores.iterator(chunk_size=chunk_size):
+        yield dict(zip(COLUMNAS, fila))
@@ -0,0 +1,103 @@
+# snake_shop/checkout_quote.py
+# Cotización del checkout: los montos (subtotal, envío, descuento, total y precio de cada línea) se
+# calculan una vez en `checkout`, se firman y se guardan en la sesión con un TTL corto.
+# `crear_pedido` reutiliza la cotización si sigue vigente, así cobra exactamente lo que se mostró.
+# Vigente significa:
+#   - firma válida y con menos de CHECKOUT_QUOTE_TTL segundos,
+#   - mismas líneas/cantidades, mismo tipo de envío y mismo usuario (huella sin consultas),
+#   - ningún producto del carrito cambió desde entonces: MAX(actualizado) igual (una consulta agregada).
+# Si algo no calza se recalcula completa. El stock no se congela acá: se valida al reservar.
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Max
+
+from .models import Producto
+
+SESION_COTIZACION = 'cotizacion_checkout'
+SALT = 'snake_shop.checkout_quote'
+TTL = getattr(settings, 'CHECKOUT_QUOTE_TTL', 15 * 60)
+COSTO_DESPACHO = 3990
+DESCUENTO_STAFF = Decimal('0.15')
+
+
+def _tipo_envio(request):
+    return request.session.get('tipo_envio', 'despacho')
+
+def calcular_envio(request):
+    return COSTO_DESPACHO if _tipo_envio(request) == 'despacho' else 0
+
+def huella(request, cart):
+    # Identifica el contenido del carrito y lo que cambia los montos, sin tocar la base de datos
+    lineas = sorted((int(pid), linea.get('cantidad') or 0) for pid, linea in cart.cart.items())
+    base = json.dumps([lineas, _tipo_envio(request), request.user.pk])
+    return hashlib.sha256(base.encode()).hexdigest()
+
+def _ultimo_cambio(producto_ids):
+    ultimo = Producto.objects.filter(pk__in=producto_ids).aggregate(ultimo=Max('actualizado'))['ultimo']
+    return ultimo.isoformat() if ultimo else ''
+
+def calcular(request, cart):
+    # Cálculo completo a partir de los items del carrito (una consulta de productos)
+    lineas = {}
+    subtotal = Decimal('0')
+    ultimo = None
+    for item in cart:
+        lineas[str(item.producto.id)] = [item.cantidad, str(item.precio)]
+        subtotal += item.total_precio
+        if ultimo is None or item.producto.actualizado > ultimo:
+            ultimo = item.producto.actualizado
+    envio = calcular_envio(request)
+    descuento = 0
+    # 15% de descuento solo para usuarios administrativos (staff)
+    if request.user.is_staff:
+        descuento = int(subtotal * DESCUENTO_STAFF)
+    return {
+        'huella': huella(request, cart),
+        'actualizado': ultimo.isoformat() if ultimo else '',
+        'lineas': lineas,
+        'subtotal': str(subtotal),
+        'envio': envio,
+        'descuento': descuento,
+        'total': str(subtotal + envio - descuento),
+    }
+
+def cotizar(request, cart):
+    # Calcula la cotización y la deja firmada en la sesión
+    cotizacion = calcular(request, cart)
+    request.session[SESION_COTIZACION] = signing.dumps(cotizacion, salt=SALT, compress=True)
+    return cotizacion
+
+def cotizacion_vigente(request, cart):
+    # Devuelve la cotización guardada si sigue valiendo para este carrito, o None
+    firmada = request.session.get(SESION_COTIZACION)
+    if not firmada:
+        return None
+    try:
+        cotizacion = signing.loads(firmada, salt=SALT, max_age=TTL)
+    except signing.BadSignature:  # incluye SignatureExpired
+        return None
+    if cotizacion['huella'] != huella(request, cart):
+        return None
+    if cotizacion['actualizado'] != _ultimo_cambio([int(pid) for pid in cotizacion['lineas']]):
+        return None  # cambió algún precio (o el producto) desde que se mostró
+    return cotizacion
+
+def obtener_cotizacion(request, cart):
+    # La vigente si existe; si no, una recalculada (y guardada)
+    return cotizacion_vigente(request, cart) or cotizar(request, cart)
+
+def descartar(request):
+    request.session.pop(SESION_COTIZACION, None)
+
+def montos(cotizacion):
+    # (subtotal, envio, descuento, total) con los tipos que usan las vistas y Pedido
+    return (
+        Decimal(cotizacion['subtotal']),
+        cotizacion['envio'],
+        cotizacion['descuento'],
+        Decimal(cotizacion['total']),
+    )
@@ -0,0 +1,67 @@
+# snake_shop/conditional.py
+# ETags para GET condicional (304) de las páginas del catálogo, usados con django.views.decorators.http.condition.
+# El ETag se arma con datos baratos de obtener (una consulta indexada + versiones de la caché del catálogo)
+# más una firma de lo que cambia por visitante en la misma página: usuario y carrito (badge).
+# El token CSRF no entra: la primera respuesta es la que crea la cookie, así que incluirlo cambiaba el ETag
+# justo en la primera revalidación. El token de la página cacheada sigue siendo válido mientras la cookie
+# (el secreto) no cambie, y solo se rota al iniciar sesión, donde ya cambia el usuario.
+# Si hay mensajes pendientes (django.contrib.messages) no se usa ETag y la página se renderiza siempre.
+import hashlib
+import json
+
+from django.contrib.messages import get_messages
+from django.db.models import Max
+
+from .cart_store import get_almacen
+from .catalog_cache import obtener_categorias, version_catalogo
+from .models import Producto
+
+def _firma_visitante(request):
+    return json.dumps([
+        request.user.pk,
+        get_almacen(request).firma(),
+    ], sort_keys=True, default=str)
+
+def _tiene_mensajes(request):
+    # len() no marca los mensajes como leídos (iterarlos sí)
+    return len(get_messages(request)) > 0
+
+def _etag(*partes):
+    return hashlib.sha1('|'.join(str(p) for p in partes).encode()).hexdigest()
+
+def etag_detalle_producto(request, product_slug):
+    if _tiene_mensajes(request):
+        return None
+    # El stock se muestra en la ficha y puede cambiar sin tocar `actualizado` (descuentos con F())
+    fila = Producto.objects.filter(
+        slug=product_slug, disponible=True
+    ).values_list('actualizado', 'stock').first()
+    if fila is None:
+        return None  # 404: que lo resuelva la vista
+    actualizado, stock = fila
+    return _etag('producto', product_slug, actualizado.isoformat(), stock, _firma_visitante(request))
+
+def etag_lista_productos(request, categoria_slug=None):
+    if _tiene_mensajes(request):
+        return None
+    productos = Producto.objects.filter(disponible=True)
+    categoria_id = None
+    if categoria_slug:
+        categoria = next((c for c in obtener_categorias() if c.slug == categoria_slug), None)
+        if categoria is None:
+            return None
+        categoria_id = categoria.pk
+        productos = productos.filter(categoria_id=categoria_id)
+    # MAX(actualizado) sobre (disponible[, categoria]) se resuelve con el índice compuesto.
+    # La búsqueda no se incluye en el filtro: se usa el conjunto completo (más conservador, igual de barato).
+    ultimo = productos.aggregate(ultimo=Max('actualizado'))['ultimo']
+    return _etag(
+        'lista',
+        categoria_slug or '',
+        ultimo.isoformat() if ultimo else '',
+        # La barra de categorías y el carrusel son globales: se incluyen ambas versiones
+        version_catalogo(),
+        version_catalogo(categoria_id) if categoria_id else '',
+        request.GET.urlencode(),
+        _firma_visitante(request),
+    )
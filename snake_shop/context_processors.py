@@ -1,6 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cart_store import resumen_carrito
+
+
 def cart_counter(request):
-    cart = request.session.get('cart', {})
-    total_items = sum(item['cantidad'] for item in cart.values())
+    # Lectura perezosa del resumen que mantiene el carrito: las páginas que no muestran
+    # {{ cart_count }} no leen nada, y las que sí lo muestran no recorren las líneas.
     return {
-        'cart_count': total_items
-    }
\ No newline at end of file
+        'cart_count': SimpleLazyObject(lambda: resumen_carrito(request)['cantidad'])
+    }
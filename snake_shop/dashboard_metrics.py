@@ -0,0 +1,111 @@
+# snake_shop/dashboard_metrics.py
+# Contadores del dashboard de administración y de estadisticas_vendedor (productos, categorías, pedidos,
+# usuarios, grupos, tickets, monto vendido y pedidos pagados por despachar).
+# - Una sola consulta: cada contador es una subconsulta escalar del mismo SELECT (un viaje a la base).
+# - En Postgres, las tablas grandes usan la estimación del catálogo (pg_class.reltuples, la mantiene
+#   ANALYZE/autovacuum) en vez de COUNT(*), que recorre la tabla completa. Bajo DASHBOARD_ESTIMATE_MIN_ROWS
+#   filas se cuenta exacto; el CASE de Postgres solo evalúa la subconsulta de la rama elegida.
+# - Caché con TTL corto y refresco "single-flight": el valor guarda su propio vencimiento y sigue en caché
+#   un rato más. Cuando vence, el primer request que toma el lock (cache.add) recalcula y el resto sigue
+#   mostrando el valor anterior, así una carga del dashboard nunca espera a la base salvo en frío.
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import caches
+from django.db import connection
+
+from .models import Categoria, Pedido, Producto, TicketSoporte
+
+TTL = getattr(settings, 'DASHBOARD_METRICS_TTL', 30)
+USAR_ESTIMACIONES = getattr(settings, 'DASHBOARD_METRICS_ESTIMATES', True)
+ESTIMAR_DESDE = getattr(settings, 'DASHBOARD_ESTIMATE_MIN_ROWS', 100_000)
+KEY = 'dashboard:metricas'
+KEY_LOCK = f'{KEY}:refrescando'
+LOCK_TIMEOUT = 30      # si el proceso que refresca muere, otro toma el lock después de esto
+ESPERA_EN_FRIO = 2.0   # sin valor previo, los demás requests esperan al que calcula hasta esto
+# Pedido.estado_despacho de los pedidos pagados que todavía hay que enviar
+POR_DESPACHAR = 'en_despacho'
+
+CONTADORES = {
+    'productos': Producto,
+    'categorias': Categoria,
+    'pedidos': Pedido,
+    'usuarios': User,
+    'grupos': Group,
+    'tickets': TicketSoporte,
+}
+
+def get_cache():
+    return caches[getattr(settings, 'DASHBOARD_METRICS_CACHE_ALIAS', 'default')]
+
+def _estimar():
+    return USAR_ESTIMACIONES and connection.vendor == 'postgresql'
+
+def _subconsulta_conteo(modelo):
+    tabla = connection.ops.quote_name(modelo._meta.db_table)
+    exacto = f'(SELECT COUNT(*) FROM {tabla})'
+    if not _estimar():
+        return exacto, []
+    # reltuples es -1 en tablas nunca analizadas: cae en el conteo exacto
+    return (
+        f'(SELECT CASE WHEN c.reltuples >= %s THEN c.reltuples::bigint ELSE {exacto} END '
+        f'FROM pg_class c WHERE c.oid = %s::regclass)',
+        [ESTIMAR_DESDE, modelo._meta.db_table],
+    )
+
+def calcular():
+    columnas, params = [], []
+    for modelo in CONTADORES.values():
+        sql, p = _subconsulta_conteo(modelo)
+        columnas.append(sql)
+        params += p
+    pedidos = connection.ops.quote_name(Pedido._meta.db_table)
+    columnas.append(f'(SELECT COALESCE(SUM(total), 0) FROM {pedidos} WHERE pagado = %s)')
+    columnas.append(f'(SELECT COUNT(*) FROM {pedidos} WHERE pagado = %s AND estado_despacho = %s)')
+    params += [True, True, POR_DESPACHAR]
+    if _estimar():
+        # Qué tablas superan el umbral, para marcar esos contadores como aproximados
+        columnas += ['(SELECT reltuples FROM pg_class WHERE oid = %s::regclass)'] * len(CONTADORES)
+        params += [modelo._meta.db_table for modelo in CONTADORES.values()]
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(columnas), params)
+        fila = cursor.fetchone()
+
+    n = len(CONTADORES)
+    metricas = dict(zip(CONTADORES, (int(valor) for valor in fila[:n])))
+    metricas['total_ventas'] = fila[n]
+    metricas['por_despachar'] = int(fila[n + 1])
+    metricas['aproximados'] = sorted(
+        nombre for nombre, reltuples in zip(CONTADORES, fila[n + 2:]) if reltuples >= ESTIMAR_DESDE
+    )
+    metricas['calculado'] = time.time()
+    return metricas
+
+def _refrescar(cache):
+    metricas = calcular()
+    # Se guarda más allá del TTL para tener un valor que mostrar mientras otro request refresca
+    cache.set(KEY, {'vence': time.time() + TTL, 'metricas': metricas}, TTL * 10)
+    return metricas
+
+def obtener():
+    cache = get_cache()
+    entrada = cache.get(KEY)
+    if entrada is not None and entrada['vence'] > time.time():
+        return entrada['metricas']
+    if cache.add(KEY_LOCK, 1, LOCK_TIMEOUT):
+        try:
+            return _refrescar(cache)
+        finally:
+            cache.delete(KEY_LOCK)
+    if entrada is not None:
+        return entrada['metricas']  # otro request está refrescando: se muestra el valor anterior
+    # En frío: se espera al que está calculando y, si tarda demasiado, se calcula aquí
+    limite = time.monotonic() + ESPERA_EN_FRIO
+    while time.monotonic() < limite:
+        time.sleep(0.05)
+        entrada = cache.get(KEY)
+        if entrada is not None:
+            return entrada['metricas']
+    return calcular()
@@ -0,0 +1,232 @@
+# snake_shop/flow.py
+# Cliente HTTP de la API de Flow (https://www.flow.cl/docs/api.html).
+# - Una sola requests.Session por proceso (keep-alive + pool de conexiones).
+# - Timeouts de conexión y lectura siempre: un Flow lento no puede dejar colgado un worker de gunicorn.
+# - Reintentos acotados con backoff exponencial y jitter. Las consultas (GET) se reintentan ante errores
+#   de red, timeouts y 5xx; payment/create (POST) solo si la conexión no llegó a establecerse,
+#   para no crear el mismo pago dos veces. Si el POST pudo llegar a Flow y no hubo respuesta
+#   (timeout de lectura, conexión cortada, 5xx) el error sale con incierto=True: el pago quizás existe.
+# - Circuit breaker por proceso: tras FLOW_BREAKER_THRESHOLD fallas seguidas deja de llamar a Flow durante
+#   FLOW_BREAKER_COOLDOWN segundos y falla de inmediato con FlowNoDisponible; luego deja pasar una prueba.
+# Para desarrollo: `python manage.py fake_flow_server` y FLOW_URL_BASE=http://127.0.0.1:8765/api
+import hashlib
+import hmac
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+CONNECT_TIMEOUT = getattr(settings, 'FLOW_CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = getattr(settings, 'FLOW_READ_TIMEOUT', 10)
+MAX_REINTENTOS = getattr(settings, 'FLOW_MAX_RETRIES', 2)
+BACKOFF_BASE = 0.25  # segundos
+BREAKER_UMBRAL = getattr(settings, 'FLOW_BREAKER_THRESHOLD', 5)
+BREAKER_ESPERA = getattr(settings, 'FLOW_BREAKER_COOLDOWN', 30)
+
+# Estados de payment/getStatus
+ESTADO_PENDIENTE = 1
+ESTADO_PAGADO = 2
+ESTADO_RECHAZADO = 3
+ESTADO_ANULADO = 4
+
+
+class FlowError(Exception):
+    # Error de negocio (4xx de Flow) o respuesta inválida.
+    # `incierto`: la petición llegó (o pudo llegar) a Flow, así que un POST pudo haberse aplicado.
+    def __init__(self, mensaje, status=None, datos=None, incierto=False):
+        super().__init__(mensaje)
+        self.status = status
+        self.datos = datos or {}
+        self.incierto = incierto
+
+
+class FlowNoDisponible(FlowError):
+    # Flow no respondió (red, timeout, 5xx) o el circuit breaker está abierto
+    pass
+
+
+def _sin_conexion(error):
+    # La conexión no llegó a abrirse (timeout de conexión, rechazo, DNS): la petición nunca salió
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    motivo = getattr(error.args[0] if error.args else None, 'reason', None)
+    return isinstance(motivo, NewConnectionError)
+
+
+def generar_firma_flow(params):
+    # Genera la firma digital (s) requerida por Flow para asegurar la integridad.
+    keys = sorted(params.keys())
+    string_to_sign = "".join(f"{k}{params[k]}" for k in keys)
+    return hmac.new(
+        settings.FLOW_SECRET_KEY.encode(),
+        string_to_sign.encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+
+class CircuitBreaker:
+    def __init__(self, umbral, espera):
+        self.umbral = umbral
+        self.espera = espera
+        self._fallas = 0
+        self._abierto_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        # Cerrado, o abierto con la espera cumplida (medio abierto: pasa un intento de prueba)
+        with self._lock:
+            if self._fallas < self.umbral:
+                return True
+            ahora = time.monotonic()
+            if ahora >= self._abierto_hasta:
+                self._abierto_hasta = ahora + self.espera  # el resto sigue esperando mientras se prueba
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self._fallas = 0
+
+    def falla(self):
+        with self._lock:
+            self._fallas += 1
+            if self._fallas >= self.umbral:
+                self._abierto_hasta = time.monotonic() + self.espera
+
+    @property
+    def abierto(self):
+        with self._lock:
+            return self._fallas >= self.umbral and time.monotonic() < self._abierto_hasta
+
+
+class LimitadorTasa:
+    # Token bucket compartido entre hilos: como máximo `por_segundo` llamadas por segundo en promedio,
+    # con ráfagas de hasta `rafaga`. Para jobs masivos (conciliación) que no deben saturar la API de Flow.
+    def __init__(self, por_segundo, rafaga=None):
+        self.por_segundo = float(por_segundo)
+        self.rafaga = float(rafaga or max(1, por_segundo))
+        self._fichas = self.rafaga
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if self.por_segundo <= 0:
+            return  # sin límite
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.rafaga, self._fichas + (ahora - self._ultimo) * self.por_segundo)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                falta = (1 - self._fichas) / self.por_segundo
+            time.sleep(falta)
+
+
+class FlowClient:
+    def __init__(self, url_base=None, api_key=None, pool=10):
+        self.url_base = (url_base or settings.FLOW_URL_BASE).rstrip('/')
+        self.api_key = api_key or settings.FLOW_API_KEY
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breaker = CircuitBreaker(BREAKER_UMBRAL, BREAKER_ESPERA)
+
+    def _firmar(self, params):
+        if not self.api_key or not settings.FLOW_SECRET_KEY:
+            raise FlowError('Flow no está configurado (FLOW_API_KEY / FLOW_SECRET_KEY)')
+        params = {'apiKey': self.api_key, **params}
+        params['s'] = generar_firma_flow(params)
+        return params
+
+    def _espera(self, intento):
+        # Backoff exponencial con "full jitter"
+        return random.uniform(0, BACKOFF_BASE * (2 ** intento))
+
+    def _llamar(self, metodo, ruta, params, idempotente):
+        if not self.breaker.permitir():
+            raise FlowNoDisponible('Flow no disponible (circuit breaker abierto)')
+        url = f'{self.url_base}/{ruta}'
+        params = self._firmar(params)
+        ultimo_error = None
+        incierto = False
+        for intento in range(MAX_REINTENTOS + 1):
+            if intento:
+                time.sleep(self._espera(intento))
+            try:
+                if metodo == 'GET':
+                    response = self.session.get(url, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+                else:
+                    response = self.session.post(url, data=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                ultimo_error = e
+                if _sin_conexion(e):
+                    continue  # la petición no salió: siempre se puede reintentar
+                incierto = True
+                if idempotente:
+                    continue
+                break
+            if response.status_code >= 500:
+                ultimo_error = FlowNoDisponible(f'Flow respondió {response.status_code}', status=response.status_code)
+                incierto = True
+                if idempotente:
+                    continue
+                break
+            # Flow respondió: el servicio está arriba aunque la respuesta sea un error de negocio
+            self.breaker.exito()
+            try:
+                datos = response.json()
+            except ValueError:
+                raise FlowError(
+                    f'Respuesta inválida de Flow ({response.status_code})',
+                    status=response.status_code, incierto=response.status_code == 200,
+                )
+            if response.status_code != 200:
+                raise FlowError(datos.get('message', 'Error desconocido en Flow'), status=response.status_code, datos=datos)
+            return datos
+        self.breaker.falla()
+        if isinstance(ultimo_error, FlowNoDisponible):
+            ultimo_error.incierto = incierto
+            raise ultimo_error
+        raise FlowNoDisponible(f'Flow no responde: {ultimo_error}', incierto=incierto)
+
+    # Endpoints
+    def crear_pago(self, commerce_order, subject, amount, email, url_return, url_confirmation, currency='CLP'):
+        datos = self._llamar('POST', 'payment/create', {
+            'commerceOrder': str(commerce_order),
+            'subject': subject,
+            'currency': currency,
+            'amount': int(amount),
+            'email': email,
+            'urlReturn': url_return,
+            'urlConfirmation': url_confirmation,
+        }, idempotente=False)
+        if 'url' not in datos or 'token' not in datos:
+            # Respondió 200 sin link: no se sabe si el pago quedó creado
+            raise FlowError(datos.get('message', 'Error desconocido en Flow'), datos=datos, incierto=True)
+        return datos
+
+    def estado_pago(self, token):
+        return self._llamar('GET', 'payment/getStatus', {'token': token}, idempotente=True)
+
+    def estado_por_orden(self, commerce_order):
+        # Para pedidos sin token conocido (p. ej. el webhook nunca llegó)
+        return self._llamar('GET', 'payment/getStatusByCommerceId', {'commerceId': str(commerce_order)}, idempotente=True)
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+def get_client():
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = FlowClient()
+    return _cliente
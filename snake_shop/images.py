@@ -0,0 +1,148 @@
+# snake_shop/images.py
+# Derivados de Producto.imagen: miniaturas de ancho fijo en WebP/AVIF para servir con srcset
+# en lugar del original a tamaño completo.
+# Estructura: MEDIA_ROOT/derivados/<ruta del original sin extensión>/w<ancho>.<formato>
+#   productos/2026/01/04/ssd.jpg -> derivados/productos/2026/01/04/ssd/w320.webp
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import Producto
+
+logger = logging.getLogger(__name__)
+
+ANCHOS = tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 1024)))
+FORMATOS = tuple(
+    f for f in getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', ('avif', 'webp')) if features.check(f)
+)
+CALIDAD = {'webp': 80, 'avif': 60}
+CARPETA = 'derivados'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+_executor = None
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+            thread_name_prefix='derivados',
+        )
+    return _executor
+
+# Rutas
+def carpeta_derivados(nombre):
+    # Ruta relativa a MEDIA_ROOT de la carpeta de derivados de una imagen
+    return Path(CARPETA) / Path(nombre).with_suffix('')
+
+def nombre_derivado(nombre, ancho, formato):
+    return (carpeta_derivados(nombre) / f'w{ancho}.{formato}').as_posix()
+
+# Generación (solo Pillow y rutas absolutas: se puede usar desde procesos hijos)
+def generar_derivados_archivo(origen, destino, anchos=ANCHOS, formatos=FORMATOS, forzar=False):
+    # Genera los derivados de `origen` en la carpeta `destino`. Devuelve la lista de (ancho, formato) disponibles.
+    origen = Path(origen)
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    mtime_origen = origen.stat().st_mtime
+    disponibles = []
+
+    with Image.open(origen) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ('RGB', 'RGBA'):
+            imagen = imagen.convert('RGBA' if 'transparency' in imagen.info else 'RGB')
+        ancho_original = imagen.width
+
+        for ancho in sorted(anchos):
+            # No se agranda la imagen: el ancho mayor al original se omite
+            if ancho > ancho_original and disponibles:
+                break
+            ancho_real = min(ancho, ancho_original)
+            alto = round(imagen.height * ancho_real / ancho_original)
+            redimensionada = None
+            for formato in formatos:
+                archivo = destino / f'w{ancho}.{formato}'
+                if forzar or not archivo.exists() or archivo.stat().st_mtime < mtime_origen:
+                    if redimensionada is None:
+                        redimensionada = imagen.resize((ancho_real, alto), Image.Resampling.LANCZOS)
+                    temporal = archivo.with_suffix(f'.{formato}.tmp')
+                    redimensionada.save(temporal, format=formato.upper(), quality=CALIDAD.get(formato, 80))
+                    os.replace(temporal, archivo)
+                disponibles.append((ancho, formato))
+    return disponibles
+
+def _cache_key(nombre):
+    return f'imagenes:derivados:{nombre}'
+
+def registrar_derivados(nombre, disponibles):
+    cache.set(_cache_key(nombre), disponibles, CACHE_TIMEOUT)
+
+def generar_derivados(nombre, forzar=False):
+    # Genera los derivados de un archivo de MEDIA_ROOT y deja registrada la lista en caché.
+    origen = Path(settings.MEDIA_ROOT) / nombre
+    if not origen.exists():
+        return []
+    destino = Path(settings.MEDIA_ROOT) / carpeta_derivados(nombre)
+    disponibles = generar_derivados_archivo(origen, destino, forzar=forzar)
+    registrar_derivados(nombre, disponibles)
+    return disponibles
+
+def derivados_disponibles(nombre):
+    # Lista de (ancho, formato) ya generados; se consulta el disco solo si no está en caché.
+    disponibles = cache.get(_cache_key(nombre))
+    if disponibles is None:
+        carpeta = Path(settings.MEDIA_ROOT) / carpeta_derivados(nombre)
+        disponibles = []
+        if carpeta.is_dir():
+            for archivo in carpeta.iterdir():
+                ancho, _, formato = archivo.name.partition('.')
+                if ancho.startswith('w') and ancho[1:].isdigit() and formato in FORMATOS:
+                    disponibles.append((int(ancho[1:]), formato))
+        disponibles.sort()
+        # Si aún no hay derivados se vuelve a mirar pronto (los puede estar generando otro proceso)
+        cache.set(_cache_key(nombre), disponibles, CACHE_TIMEOUT if disponibles else 60)
+    return disponibles
+
+def srcsets(nombre):
+    # {formato: "url 320w, url 640w"} con los derivados existentes
+    por_formato = {}
+    for ancho, formato in derivados_disponibles(nombre):
+        url = settings.MEDIA_URL + nombre_derivado(nombre, ancho, formato)
+        por_formato.setdefault(formato, []).append(f'{url} {ancho}w')
+    return {formato: ', '.join(partes) for formato, partes in por_formato.items()}
+
+# Pipeline asíncrono
+def _procesar_producto(producto_id, nombre):
+    try:
+        generar_derivados(nombre)
+        # Se toca `actualizado` sin señales para que las tarjetas cacheadas se regeneren con el srcset nuevo
+        Producto.objects.filter(pk=producto_id, imagen=nombre).update(actualizado=timezone.now())
+    except Exception:
+        logger.exception('No se pudieron generar los derivados de %s', nombre)
+    finally:
+        # El hilo del pool abre su propia conexión; se cierra para no dejarla colgada
+        connection.close()
+
+def encolar_derivados(producto):
+    if not producto.imagen:
+        return None
+    return get_executor().submit(_procesar_producto, producto.pk, producto.imagen.name)
+
+@receiver(post_save, sender=Producto)
+def generar_derivados_producto(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not instance.imagen:
+        return
+    if update_fields is not None and 'imagen' not in update_fields:
+        return
+    if derivados_disponibles(instance.imagen.name):
+        return
+    transaction.on_commit(lambda: encolar_derivados(instance))
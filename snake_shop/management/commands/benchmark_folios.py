@@ -0,0 +1,78 @@
+# snake_shop/management/commands/benchmark_folios.py
+# Mide la asignación de folios con varios procesos compitiendo, como varios workers de gunicorn:
+#   python manage.py benchmark_folios --procesos 8 --folios 500 --bloques 1,20,100 --transaccion-ms 20
+# Cada proceso pide folios dentro de una transacción que dura --transaccion-ms (simula el resto de
+# crear_pedido) y al final se verifica que no haya folios repetidos y cuántos huecos quedaron.
+# Usa un tipo propio ('benchmark' por defecto) y borra su fila de FolioSequence al terminar.
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from snake_shop.models import FolioSequence, generar_folio
+
+
+def _trabajador(tipo, bloque, cantidad, transaccion_ms, cola):
+    folios = []
+    inicio = time.monotonic()
+    try:
+        for _ in range(cantidad):
+            with transaction.atomic():
+                folios.append(generar_folio(tipo, bloque=bloque))
+                if transaccion_ms:
+                    time.sleep(transaccion_ms / 1000)
+        cola.put((folios, time.monotonic() - inicio, None))
+    except Exception as e:
+        cola.put((folios, time.monotonic() - inicio, repr(e)))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de asignación de folios con varios procesos concurrentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=4)
+        parser.add_argument('--folios', type=int, default=200, help='Folios por proceso')
+        parser.add_argument('--bloques', default='1,20', help='Tamaños de bloque a comparar, separados por coma')
+        parser.add_argument('--transaccion-ms', type=float, default=0, help='Duración simulada de la transacción del pedido')
+        parser.add_argument('--tipo', default='benchmark')
+
+    def handle(self, *args, **options):
+        if options['tipo'] in dict(FolioSequence.TIPO_CHOICES):
+            raise CommandError('Usa un tipo que no sea de producción para no consumir folios reales.')
+        contexto = multiprocessing.get_context('fork')
+        for bloque in [int(b) for b in options['bloques'].split(',')]:
+            FolioSequence.objects.filter(tipo=options['tipo']).delete()
+            connections.close_all()  # los hijos no pueden compartir la conexión del padre
+            cola = contexto.Queue()
+            procesos = [
+                contexto.Process(target=_trabajador, args=(
+                    options['tipo'], bloque, options['folios'], options['transaccion_ms'], cola,
+                ))
+                for _ in range(options['procesos'])
+            ]
+            inicio = time.monotonic()
+            for proceso in procesos:
+                proceso.start()
+            resultados = [cola.get() for _ in procesos]
+            for proceso in procesos:
+                proceso.join()
+            segundos = time.monotonic() - inicio
+
+            folios = [folio for lote, _, _ in resultados for folio in lote]
+            errores = [error for _, _, error in resultados if error]
+            correlativos = sorted(int(folio.rsplit('-', 1)[1]) for folio in folios)
+            repetidos = len(folios) - len(set(folios))
+            huecos = (correlativos[-1] - len(set(correlativos))) if correlativos else 0
+            self.stdout.write(
+                f'bloque={bloque:<4} procesos={options["procesos"]} folios={len(folios)} '
+                f'tiempo={segundos:.2f}s ({len(folios) / max(segundos, 1e-6):.0f} folios/s) '
+                f'repetidos={repetidos} huecos={huecos} errores={len(errores)}'
+            )
+            for error in errores[:3]:
+                self.stderr.write(f'  {error}')
+            if repetidos:
+                raise CommandError('Se asignó el mismo folio dos veces.')
+        FolioSequence.objects.filter(tipo=options['tipo']).delete()
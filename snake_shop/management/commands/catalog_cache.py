@@ -0,0 +1,26 @@
+# snake_shop/management/commands/catalog_cache.py
+from django.core.management.base import BaseCommand
+
+from snake_shop import catalog_cache
+
+
+class Command(BaseCommand):
+    help = 'Muestra los contadores de la caché del catálogo o fuerza su invalidación.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invalidar', action='store_true', help='Sube la versión global del catálogo')
+        parser.add_argument('--reset', action='store_true', help='Reinicia los contadores de hits/misses')
+
+    def handle(self, *args, **options):
+        if options['invalidar']:
+            catalog_cache.invalidar_catalogo()
+            self.stdout.write(self.style.SUCCESS('Versión global del catálogo incrementada.'))
+        if options['reset']:
+            catalog_cache.reiniciar_estadisticas()
+            self.stdout.write(self.style.SUCCESS('Contadores reiniciados.'))
+
+        stats = catalog_cache.estadisticas()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} ratio={stats['ratio']} "
+            f"version_global={stats['version_global']}"
+        )
@@ -0,0 +1,17 @@
+# snake_shop/management/commands/expirar_carritos.py
+# Pensado para cron: python manage.py expirar_carritos --dias 30
+from django.core.management.base import BaseCommand
+
+from snake_shop.cart_store import expirar_carritos
+
+
+class Command(BaseCommand):
+    help = 'Borra por lotes los carritos persistentes (CART_BACKEND=db) sin actividad reciente.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None, help='Días sin actividad (por defecto CART_EXPIRY_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        borrados = expirar_carritos(dias=options['dias'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{borrados} carritos expirados eliminados.'))
@@ -0,0 +1,17 @@
+# snake_shop/management/commands/expirar_pedidos.py
+# Pensado para cron (después de reconcile_payments): python manage.py expirar_pedidos --horas 24
+from django.core.management.base import BaseCommand
+
+from snake_shop.stock import expirar_pedidos
+
+
+class Command(BaseCommand):
+    help = 'Marca como expirados por lotes los pedidos sin pagar y devuelve su stock al inventario.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=float, default=None, help='Horas sin pagar (por defecto PENDING_ORDER_TTL_HOURS)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        expirados = expirar_pedidos(horas=options['horas'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{expirados} pedidos expirados; su stock volvió al inventario.'))
@@ -0,0 +1,35 @@
+# snake_shop/management/commands/export_productos.py
+import sys
+
+from django.core.management.base import BaseCommand
+
+from snake_shop.catalog_io import detectar_formato, escribir_filas, filas_exportacion
+
+
+class Command(BaseCommand):
+    help = 'Exporta el catálogo a CSV o JSONL en streaming (mismo formato que acepta import_productos).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="Archivo de salida ('-' = stdout)")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Por defecto se deduce de la extensión')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Filas por bloque del cursor (default: 2000)')
+        parser.add_argument('--categoria', help='Exporta solo el slug de categoría indicado')
+
+    def handle(self, *args, **options):
+        formato = detectar_formato(options['output'], options['formato'])
+        a_stdout = options['output'] == '-'
+        archivo = sys.stdout if a_stdout else open(options['output'], 'w', encoding='utf-8', newline='')
+        # Con stdout el progreso va a stderr para no mezclarlo con los datos
+        salida_progreso = self.stderr if a_stdout else self.stdout
+
+        try:
+            total = escribir_filas(
+                archivo,
+                filas_exportacion(options['chunk_size'], options['categoria']),
+                formato,
+                progreso=lambda n: salida_progreso.write(f'  {n} productos exportados...'),
+            )
+        finally:
+            if not a_stdout:
+                archivo.close()
+        salida_progreso.write(self.style.SUCCESS(f'Exportación terminada: {total} productos.'))
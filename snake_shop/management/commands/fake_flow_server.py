@@ -0,0 +1,205 @@
+# snake_shop/management/commands/fake_flow_server.py
+# Servidor local que imita la API de Flow para desarrollo y pruebas (sin red ni credenciales reales).
+#   python manage.py fake_flow_server --port 8765
+#   FLOW_URL_BASE=http://127.0.0.1:8765/api FLOW_API_KEY=dev FLOW_SECRET_KEY=dev python manage.py runserver
+# Endpoints: POST /api/payment/create, GET /api/payment/getStatus, GET /api/payment/getStatusByCommerceId
+# y una página /app/pagar?token=... para aprobar o rechazar el pago (dispara el webhook y vuelve a urlReturn).
+# --latencia y --tasa-error simulan un Flow lento o inestable (timeouts, reintentos, circuit breaker).
+import hashlib
+import hmac
+import html
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+ESTADOS = {'pendiente': 1, 'pagado': 2, 'rechazado': 3, 'anulado': 4}
+
+
+class FlowFalso:
+    def __init__(self, api_key, secret, url_publica, auto_pagar=False):
+        self.api_key = api_key
+        self.secret = secret
+        self.url_publica = url_publica
+        self.auto_pagar = auto_pagar
+        self.pagos = {}       # token -> dict
+        self.por_orden = {}   # commerceOrder -> token
+        self.flow_orders = count(1000)
+        self.lock = threading.Lock()
+        self.llamadas = {'create': 0, 'getStatus': 0, 'getStatusByCommerceId': 0}
+
+    def firma_valida(self, params):
+        recibida = params.pop('s', '')
+        esperada = hmac.new(
+            self.secret.encode(),
+            ''.join(f'{k}{params[k]}' for k in sorted(params)).encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        return params.get('apiKey') == self.api_key and hmac.compare_digest(recibida, esperada)
+
+    def crear(self, params):
+        with self.lock:
+            self.llamadas['create'] += 1
+            orden = params['commerceOrder']
+            if orden in self.por_orden:
+                return 400, {'code': 1605, 'message': f'commerceOrder {orden} ya fue procesada'}
+            token = uuid.uuid4().hex
+            pago = {
+                'flowOrder': next(self.flow_orders),
+                'commerceOrder': orden,
+                'requestDate': timezone.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'status': ESTADOS['pagado'] if self.auto_pagar else ESTADOS['pendiente'],
+                'subject': params.get('subject', ''),
+                'currency': params.get('currency', 'CLP'),
+                'amount': int(params['amount']),
+                'payer': params.get('email', ''),
+                'urlConfirmation': params.get('urlConfirmation'),
+                'urlReturn': params.get('urlReturn'),
+            }
+            self.pagos[token] = pago
+            self.por_orden[orden] = token
+        return 200, {'url': f'{self.url_publica}/app/pagar', 'token': token, 'flowOrder': pago['flowOrder']}
+
+    def estado(self, token=None, orden=None):
+        with self.lock:
+            self.llamadas['getStatusByCommerceId' if orden else 'getStatus'] += 1
+            if orden is not None:
+                token = self.por_orden.get(orden)
+            pago = self.pagos.get(token)
+            if pago is None:
+                return 400, {'code': 105, 'message': 'No existe el pago'}
+            datos = {k: v for k, v in pago.items() if k not in ('urlConfirmation', 'urlReturn')}
+            datos['token'] = token
+            return 200, datos
+
+    def resolver(self, token, estado):
+        with self.lock:
+            pago = self.pagos.get(token)
+            if pago is None:
+                return None
+            pago['status'] = ESTADOS[estado]
+            return dict(pago)
+
+
+def crear_handler(flow, latencia, tasa_error, stdout):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, formato, *args):
+            stdout.write(f'[flow falso] {self.command} {self.path} -> {formato % args}')
+
+        def _json(self, status, datos):
+            cuerpo = json.dumps(datos).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def _simular_red(self):
+            if latencia:
+                time.sleep(latencia)
+            if tasa_error and random.random() < tasa_error:
+                self._json(500, {'code': 500, 'message': 'Error interno simulado'})
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = dict(parse_qsl(url.query))
+            if url.path == '/app/pagar':
+                return self._pagina_pago(params.get('token', ''))
+            if self._simular_red():
+                return
+            if not flow.firma_valida(params):
+                return self._json(401, {'code': 108, 'message': 'Firma inválida'})
+            if url.path == '/api/payment/getStatus':
+                return self._json(*flow.estado(token=params.get('token')))
+            if url.path == '/api/payment/getStatusByCommerceId':
+                return self._json(*flow.estado(orden=params.get('commerceId')))
+            self._json(404, {'code': 404, 'message': 'No encontrado'})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            largo = int(self.headers.get('Content-Length') or 0)
+            params = dict(parse_qsl(self.rfile.read(largo).decode()))
+            if url.path == '/app/pagar':
+                return self._resolver_pago(params)
+            if self._simular_red():
+                return
+            if not flow.firma_valida(params):
+                return self._json(401, {'code': 108, 'message': 'Firma inválida'})
+            if url.path == '/api/payment/create':
+                return self._json(*flow.crear(params))
+            self._json(404, {'code': 404, 'message': 'No encontrado'})
+
+        def _pagina_pago(self, token):
+            pago = flow.pagos.get(token)
+            if pago is None:
+                return self._json(404, {'message': 'No existe el pago'})
+            cuerpo = (
+                '<html><body><h1>Flow falso</h1>'
+                f'<p>Pedido {html.escape(pago["commerceOrder"])} - ${pago["amount"]} {html.escape(pago["currency"])}</p>'
+                '<form method="post">'
+                f'<input type="hidden" name="token" value="{html.escape(token)}">'
+                '<button name="estado" value="pagado">Pagar</button> '
+                '<button name="estado" value="rechazado">Rechazar</button>'
+                '</form></body></html>'
+            ).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def _resolver_pago(self, params):
+            token = params.get('token', '')
+            pago = flow.resolver(token, params.get('estado', 'pagado'))
+            if pago is None:
+                return self._json(404, {'message': 'No existe el pago'})
+            # Como Flow: notifica al comercio (webhook) y devuelve al cliente a urlReturn
+            try:
+                requests.post(pago['urlConfirmation'], data={'token': token}, timeout=10)
+            except requests.RequestException as e:
+                stdout.write(f'[flow falso] webhook falló: {e}')
+            self.send_response(302)
+            self.send_header('Location', pago['urlReturn'])
+            self.end_headers()
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = 'Levanta un servidor local que imita la API de pagos de Flow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--api-key', default=None, help='Por defecto FLOW_API_KEY')
+        parser.add_argument('--secret', default=None, help='Por defecto FLOW_SECRET_KEY')
+        parser.add_argument('--latencia', type=float, default=0, help='Segundos de espera por llamada a la API')
+        parser.add_argument('--tasa-error', type=float, default=0, help='Fracción de llamadas que responden 500')
+        parser.add_argument('--auto-pagar', action='store_true', help='Los pagos nacen aprobados (status 2)')
+
+    def handle(self, *args, **options):
+        api_key = options['api_key'] or settings.FLOW_API_KEY or 'dev'
+        secret = options['secret'] or settings.FLOW_SECRET_KEY or 'dev'
+        url_publica = f"http://{options['host']}:{options['port']}"
+        flow = FlowFalso(api_key, secret, url_publica, auto_pagar=options['auto_pagar'])
+        handler = crear_handler(flow, options['latencia'], options['tasa_error'], self.stdout)
+        servidor = ThreadingHTTPServer((options['host'], options['port']), handler)
+        self.stdout.write(self.style.SUCCESS(f'Flow falso escuchando en {url_publica}/api (Ctrl+C para salir)'))
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(f'Llamadas recibidas: {flow.llamadas}')
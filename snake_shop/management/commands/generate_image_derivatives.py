@@ -0,0 +1,55 @@
+# snake_shop/management/commands/generate_image_derivatives.py
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from snake_shop import images
+from snake_shop.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Genera (backfill) las miniaturas WebP/AVIF de las imágenes de productos existentes, en paralelo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Procesos en paralelo (default: 4)')
+        parser.add_argument('--forzar', action='store_true', help='Regenera aunque los derivados ya existan')
+
+    def handle(self, *args, **options):
+        media_root = Path(settings.MEDIA_ROOT)
+        nombres = {}
+        qs = Producto.objects.exclude(imagen='').values_list('pk', 'imagen')
+        for pk, nombre in qs.iterator(chunk_size=2000):
+            nombres.setdefault(nombre, []).append(pk)
+
+        self.stdout.write(f'{len(nombres)} imágenes a procesar con {options["workers"]} procesos...')
+        ok = errores = 0
+        # Los hijos solo usan Pillow y rutas absolutas; el registro en caché y la BD se actualizan aquí
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futuros = {}
+            for nombre in nombres:
+                origen = media_root / nombre
+                if not origen.exists():
+                    self.stderr.write(f'  No existe: {nombre}')
+                    errores += 1
+                    continue
+                destino = media_root / images.carpeta_derivados(nombre)
+                futuros[pool.submit(
+                    images.generar_derivados_archivo, origen, destino, images.ANCHOS, images.FORMATOS, options['forzar']
+                )] = nombre
+
+            for futuro in as_completed(futuros):
+                nombre = futuros[futuro]
+                try:
+                    disponibles = futuro.result()
+                except Exception as e:
+                    self.stderr.write(f'  Error en {nombre}: {e}')
+                    errores += 1
+                    continue
+                images.registrar_derivados(nombre, disponibles)
+                Producto.objects.filter(pk__in=nombres[nombre]).update(actualizado=timezone.now())
+                ok += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Derivados generados: {ok} imágenes, {errores} errores.'))
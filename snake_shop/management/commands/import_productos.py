@@ -0,0 +1,69 @@
+# snake_shop/management/commands/import_productos.py
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from snake_shop.catalog_io import COLUMNAS, Importador, detectar_formato, leer_filas, lotes
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa productos desde CSV o JSONL en streaming. Crea o actualiza por slug con bulk_create/bulk_update. '
+        f'Columnas: {", ".join(COLUMNAS)}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo ('-' para leer de stdin)")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Por defecto se deduce de la extensión')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Filas por lote (default: 2000)')
+        parser.add_argument('--vendedor', help='Username asignado a las filas sin columna vendedor')
+        parser.add_argument('--crear-categorias', action='store_true', help='Crea las categorías que no existan')
+        parser.add_argument('--dry-run', action='store_true', help='Valida y cuenta sin escribir en la base de datos')
+        parser.add_argument('--max-errores', type=int, default=50, help='Errores a mostrar al final (default: 50)')
+
+    def handle(self, *args, **options):
+        vendedor = None
+        if options['vendedor']:
+            try:
+                vendedor = User.objects.get(username=options['vendedor'])
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario {options['vendedor']!r}")
+
+        importador = Importador(
+            vendedor_default=vendedor,
+            crear_categorias=options['crear_categorias'],
+            dry_run=options['dry_run'],
+            max_errores=options['max_errores'],
+        )
+        formato = detectar_formato(options['archivo'], options['formato'])
+        archivo = sys.stdin if options['archivo'] == '-' else open(options['archivo'], encoding='utf-8-sig', newline='')
+
+        inicio = time.monotonic()
+        procesadas = 0
+        try:
+            for lote in lotes(leer_filas(archivo, formato), options['batch_size']):
+                importador.procesar_lote(lote)
+                procesadas += len(lote)
+                segundos = time.monotonic() - inicio
+                self.stdout.write(
+                    f'  {procesadas} filas | creados={importador.creados} actualizados={importador.actualizados} '
+                    f'sin_cambios={importador.sin_cambios} '
+                    f'errores={importador.total_errores} | {procesadas / max(segundos, 0.001):.0f} filas/s'
+                )
+            importador.finalizar()
+        finally:
+            if archivo is not sys.stdin:
+                archivo.close()
+
+        for numero, error in importador.errores:
+            self.stderr.write(f'  línea {numero}: {error}')
+
+        prefijo = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefijo}Importación terminada en {time.monotonic() - inicio:.1f}s: '
+            f'{importador.creados} creados, {importador.actualizados} actualizados, '
+            f'{importador.sin_cambios} sin cambios, '
+            f'{importador.total_errores} filas con error.'
+        ))
@@ -0,0 +1,30 @@
+# snake_shop/management/commands/rebuild_rollups.py
+# Recalcula los resúmenes diarios de estadísticas (VentaDiaria, TransaccionDiaria) desde los pedidos.
+#   python manage.py rebuild_rollups                       (todo)
+#   python manage.py rebuild_rollups --desde 2026-01-01    (solo desde esa fecha)
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from snake_shop.rollups import reconstruir
+
+
+def _fecha(valor):
+    try:
+        return date.fromisoformat(valor) if valor else None
+    except ValueError:
+        raise CommandError(f'Fecha inválida: {valor} (formato AAAA-MM-DD)')
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los resúmenes diarios de ventas y transacciones usados por las estadísticas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', default=None, help='Fecha inicial AAAA-MM-DD (incluida)')
+        parser.add_argument('--hasta', default=None, help='Fecha final AAAA-MM-DD (incluida)')
+
+    def handle(self, *args, **options):
+        ventas, transacciones = reconstruir(desde=_fecha(options['desde']), hasta=_fecha(options['hasta']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Resúmenes reconstruidos: {ventas} filas de ventas, {transacciones} filas de transacciones.'
+        ))
@@ -0,0 +1,18 @@
+# snake_shop/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from snake_shop.search import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos (search_vector en PostgreSQL / FTS5 en SQLite).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Productos por lote (default: 1000)')
+
+    def handle(self, *args, **options):
+        def progreso(total):
+            self.stdout.write(f'  {total} productos indexados...')
+
+        total = reconstruir_indice(batch_size=options['batch_size'], progreso=progreso)
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda reconstruido: {total} productos.'))
@@ -0,0 +1,96 @@
+# snake_shop/management/commands/reconcile_payments.py
+# Concilia con Flow los pedidos que siguen sin pagar (webhook perdido, Flow caído, etc.).
+#   python manage.py reconcile_payments --horas 48 --workers 4 --rps 5
+#   python manage.py reconcile_payments --checkpoint /var/tmp/conciliacion.json   (reanudable)
+#   python manage.py reconcile_payments --loop 300                                (como daemon)
+# Con --checkpoint el cursor se guarda tras cada lote aplicado: si el proceso muere (o Flow se cae)
+# la siguiente ejecución sigue desde ahí con la misma ventana. Al terminar la ventana se borra.
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from snake_shop import flow
+from snake_shop.payments import conciliar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Consulta en Flow el estado de los pedidos pendientes y aplica los pagos que no llegaron por webhook.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=float, default=48, help='Antigüedad máxima de los pedidos a revisar')
+        parser.add_argument('--minutos-gracia', type=float, default=15,
+                            help='No revisar pedidos más nuevos que esto (el webhook aún puede llegar)')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=None, help='Por defecto FLOW_RECONCILE_WORKERS')
+        parser.add_argument('--rps', type=float, default=None, help='Llamadas por segundo a Flow (por defecto FLOW_RECONCILE_RPS, 0 = sin límite)')
+        parser.add_argument('--checkpoint', default=None, help='Archivo JSON donde guardar el avance para reanudar')
+        parser.add_argument('--reiniciar', action='store_true', help='Ignora el checkpoint existente')
+        parser.add_argument('--loop', type=float, default=0, help='Repetir cada N segundos (modo daemon)')
+
+    def handle(self, *args, **options):
+        while True:
+            self._ejecutar(options)
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def _ejecutar(self, options):
+        checkpoint = options['checkpoint']
+        estado = None
+        if checkpoint and not options['reiniciar'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                estado = json.load(f)
+            self.stdout.write(f"Reanudando la ventana {estado['desde']} - {estado['hasta']}")
+        if estado is None:
+            ahora = timezone.now()
+            estado = {
+                'desde': (ahora - timedelta(hours=options['horas'])).isoformat(),
+                'hasta': (ahora - timedelta(minutes=options['minutos_gracia'])).isoformat(),
+                'cursor': None,
+            }
+
+        totales = {'pedidos': 0, 'segundos': 0.0}
+
+        def al_avanzar(cursor, conteo, segundos):
+            estado['cursor'] = cursor
+            if checkpoint:
+                self._guardar(checkpoint, estado)
+            n = sum(conteo.values())
+            totales['pedidos'] += n
+            totales['segundos'] += segundos
+            self.stdout.write(f'Lote de {n} pedidos en {segundos:.2f}s ({n / max(segundos, 1e-6):.1f} pedidos/s): {dict(conteo)}')
+
+        inicio = time.monotonic()
+        try:
+            conteo = conciliar_pendientes(
+                datetime.fromisoformat(estado['desde']),
+                datetime.fromisoformat(estado['hasta']),
+                cursor=estado['cursor'],
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                por_segundo=options['rps'],
+                al_avanzar=al_avanzar,
+            )
+        except flow.FlowNoDisponible as e:
+            self.stderr.write(f'Flow no disponible, se reanudará desde el último lote aplicado: {e}')
+            return
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)  # ventana completa
+
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{totales['pedidos']} pedidos conciliados en {segundos:.2f}s "
+            f"({totales['pedidos'] / max(segundos, 1e-6):.1f} pedidos/s): {dict(Counter(conteo))}"
+        ))
+
+    def _guardar(self, ruta, estado):
+        # Escritura atómica: un corte a mitad no deja un checkpoint corrupto
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w') as f:
+            json.dump(estado, f)
+        os.replace(temporal, ruta)
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:02
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# Los índices de búsqueda dependen del motor, por eso se crean con SQL condicionado
+# en vez de declararse en Producto.Meta (GIN/pg_trgm no existen en SQLite).
+FTS_TABLE = 'snake_shop_producto_fts'
+# Misma configuración que snake_shop.search, para que el vector poblado acá y las consultas coincidan
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'spanish')
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS snake_shop_producto_search_gin '
+            'ON snake_shop_producto USING GIN (search_vector)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS snake_shop_producto_nombre_trgm '
+            'ON snake_shop_producto USING GIN (nombre gin_trgm_ops)'
+        )
+        schema_editor.execute(
+            "UPDATE snake_shop_producto p SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, coalesce(p.nombre, '')), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, coalesce(p.descripcion, '')), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, coalesce(c.nombre, '')), 'C') "
+            "FROM snake_shop_categoria c WHERE c.id = p.categoria_id",
+            [SEARCH_CONFIG] * 3,
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"nombre, descripcion, categoria, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, nombre, descripcion, categoria) '
+            f'SELECT p.id, p.nombre, p.descripcion, c.nombre '
+            f'FROM snake_shop_producto p JOIN snake_shop_categoria c ON c.id = p.categoria_id'
+        )
+
+
+def eliminar_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS snake_shop_producto_search_gin')
+        schema_editor.execute('DROP INDEX IF EXISTS snake_shop_producto_nombre_trgm')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0020_ticketcomentario_ticketcomentarioadjunto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(crear_indices_busqueda, eliminar_indices_busqueda),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, Q, When
+
+
+def calcular_precio_efectivo(apps, schema_editor):
+    Producto = apps.get_model('snake_shop', 'Producto')
+    Producto.objects.update(precio_efectivo=Case(
+        When(Q(en_promocion=True) & Q(precio_promocion__gt=0), then=F('precio_promocion')),
+        default=F('precio'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0021_producto_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='precio_efectivo',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(calcular_precio_efectivo, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['disponible', 'nombre', 'id'], name='producto_disp_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['disponible', 'precio', 'id'], name='producto_disp_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['disponible', 'precio_efectivo', 'id'], name='producto_disp_pefect_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['disponible', 'creado', 'id'], name='producto_disp_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'disponible', 'nombre', 'id'], name='producto_cat_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'disponible', 'precio', 'id'], name='producto_cat_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'disponible', 'precio_efectivo', 'id'], name='producto_cat_pefect_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'disponible', 'creado', 'id'], name='producto_cat_creado_idx'),
+        ),
+    ]
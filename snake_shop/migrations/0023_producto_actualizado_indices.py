@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0022_producto_precio_efectivo_indices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['disponible', 'actualizado'], name='producto_disp_actual_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'disponible', 'actualizado'], name='producto_cat_actual_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0023_producto_actualizado_indices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Carrito',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('usuario', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='carrito', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LineaCarrito',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('carrito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='snake_shop.carrito')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='snake_shop.producto')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(fields=['actualizado'], name='carrito_actualizado_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lineacarrito',
+            constraint=models.UniqueConstraint(fields=('carrito', 'producto'), name='linea_carrito_unica'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0025_carrito_resumen'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaccion',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('aprobado', 'Aprobado'), ('pagado', 'Pagado'), ('rechazado', 'Rechazado'), ('error', 'Error')], default='pendiente', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='transaccion',
+            name='flow_token',
+            field=models.CharField(blank=True, max_length=200, null=True, unique=True),
+        ),
+    ]
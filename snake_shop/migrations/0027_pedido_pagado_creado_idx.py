@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0026_transaccion_flow_token_unico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['pagado', 'creado'], name='pedido_pagado_creado_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0027_pedido_pagado_creado_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='foliosequence',
+            name='tipo',
+            field=models.CharField(choices=[('pedido', 'Pedido'), ('ticket', 'Ticket de Soporte')], max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='foliosequence',
+            constraint=models.UniqueConstraint(fields=('tipo', 'anio'), name='folio_tipo_anio_unico'),
+        ),
+    ]
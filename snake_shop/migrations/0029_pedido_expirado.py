@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0028_foliosequence_tipo_anio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='expirado',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0029_pedido_expirado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', '-creado', '-id'], name='pedido_usuario_creado_idx'),
+        ),
+    ]
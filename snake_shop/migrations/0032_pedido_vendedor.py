@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+def poblar_pedido_vendedor(apps, schema_editor):
+    ItemPedido = apps.get_model('snake_shop', 'ItemPedido')
+    PedidoVendedor = apps.get_model('snake_shop', 'PedidoVendedor')
+    filas = (
+        ItemPedido.objects.values('pedido_id', vendedor_id=F('producto__vendedor_id'))
+        .annotate(
+            subtotal=Sum(F('precio') * F('cantidad'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            cantidad_items=Sum('cantidad'),
+            creado=F('pedido__creado'),
+            pagado=F('pedido__pagado'),
+        )
+        .order_by('pedido_id')
+    )
+    PedidoVendedor.objects.bulk_create((PedidoVendedor(**fila) for fila in filas.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0031_rollups_diarios'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoVendedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('cantidad_items', models.PositiveIntegerField(default=0)),
+                ('creado', models.DateTimeField()),
+                ('pagado', models.BooleanField(default=False)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendedores', to='snake_shop.pedido')),
+                ('vendedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pedidos_vendidos', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vendedor', '-creado'], name='pedido_vendedor_creado_idx'), models.Index(fields=['vendedor', 'pagado'], name='pedido_vendedor_pagado_idx')],
+                'constraints': [models.UniqueConstraint(fields=('pedido', 'vendedor'), name='pedido_vendedor_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_pedido_vendedor, migrations.RunPython.noop),
+    ]
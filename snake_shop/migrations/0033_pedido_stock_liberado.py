@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:49
+
+from django.db import migrations, models
+
+
+def marcar_expirados(apps, schema_editor):
+    # Los pedidos ya expirados devolvieron su stock en expirar_pedidos
+    Pedido = apps.get_model('snake_shop', 'Pedido')
+    Pedido.objects.filter(expirado=True).update(stock_liberado=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0032_pedido_vendedor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='stock_liberado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(marcar_expirados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snake_shop', '0033_pedido_stock_liberado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='revision_stock',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,41 +1,105 @@
-from django.db import models, transaction
+import os
+import threading
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connection, connections, models
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.db.models import Max
+from django.contrib.postgres.search import SearchVectorField
 
 # Utilidades / Helpers
 class FolioSequence(models.Model):
-    # Lleva el correlativo de folios por tipo (pedido, ticket, etc.) Formato final: SS-YYYY-00001
+    # Lleva el correlativo de folios por tipo (pedido, ticket, etc.) y año. Formato final: SS-YYYY-00001
     TIPO_CHOICES = [
         ('pedido', 'Pedido'),
         ('ticket', 'Ticket de Soporte'),
     ]
-    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, unique=True)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
     anio = models.PositiveIntegerField()
     correlativo = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            # Una fila por tipo y año: el año nuevo parte en 1 sin tocar la fila del anterior
+            models.UniqueConstraint(fields=['tipo', 'anio'], name='folio_tipo_anio_unico'),
+        ]
+
     def __str__(self):
         return f"{self.tipo} - {self.anio} - {self.correlativo}"
 
-def generar_folio(tipo: str) -> str:
-    # Genera un folio correlativo único y atómico del tipo: SS-YYYY-00001
-    year = timezone.now().year
-    with transaction.atomic():
-        seq, created = FolioSequence.objects.select_for_update().get_or_create(
-            tipo=tipo,
-            defaults={'anio': year, 'correlativo': 0},
-        )
-        # Si cambió el año, reiniciar correlativo
-        if seq.anio != year:
-            seq.anio = year
-            seq.correlativo = 0
-        seq.correlativo += 1
-        seq.save()
-        return f"SS-{seq.anio}-{seq.correlativo:05d}"
+# Folios por bloques (hi/lo): cada proceso reserva FOLIO_BLOCK_SIZE correlativos con un solo
+# UPDATE ... RETURNING y los entrega desde memoria. La reserva va en una conexión propia en autocommit
+# (alias FOLIO_DB_ALIAS de DATABASES), así el bloqueo de la fila de FolioSequence dura lo que ese UPDATE
+# y no toda la transacción del pedido. Django abre esa conexión por hilo y la cierra al final de cada
+# request (close_old_connections), igual que 'default'.
+# Política de huecos: los folios son únicos, pero no un correlativo continuo ni en orden de creación:
+#   - los números de un bloque que el proceso no alcanzó a usar se pierden al reiniciarse,
+#   - un pedido o ticket revertido no devuelve su folio (la reserva ya se confirmó),
+#   - dos procesos con bloques distintos emiten folios intercalados.
+# Son para trazabilidad, no numeración tributaria. Con FOLIO_BLOCK_SIZE = 1 solo quedan los huecos por rollback.
+FOLIO_BLOQUE = getattr(settings, 'FOLIO_BLOCK_SIZE', 20)
+FOLIO_DB = getattr(settings, 'FOLIO_DB_ALIAS', 'folios')
+_bloques = {}  # (tipo, anio) -> [siguiente, ultimo]
+_bloques_lock = threading.Lock()
+
+def _reiniciar_folios():
+    # Tras un fork el hijo no puede heredar el bloque del padre (se repetirían folios)
+    _bloques.clear()
+
+os.register_at_fork(after_in_child=_reiniciar_folios)
+
+def _conexion_reserva():
+    # SQLite admite un solo escritor: otra conexión esperaría a la transacción en curso, así que usa la misma
+    if FOLIO_DB in settings.DATABASES and connection.vendor != 'sqlite':
+        return connections[FOLIO_DB]
+    return connection
+
+def _reservar_bloque(con, tipo, anio, cantidad):
+    # Suma `cantidad` al correlativo y devuelve el nuevo valor: el bloque es (valor - cantidad, valor]
+    tabla = con.ops.quote_name(FolioSequence._meta.db_table)
+    actualizar = f'UPDATE {tabla} SET correlativo = correlativo + %s WHERE tipo = %s AND anio = %s RETURNING correlativo'
+    for intento in range(2):
+        try:
+            with con.cursor() as cursor:
+                cursor.execute(actualizar, [cantidad, tipo, anio])
+                fila = cursor.fetchone()
+                if fila is None:
+                    # Primer folio del año para este tipo
+                    cursor.execute(
+                        f'INSERT INTO {tabla} (tipo, anio, correlativo) VALUES (%s, %s, 0) ON CONFLICT (tipo, anio) DO NOTHING',
+                        [tipo, anio],
+                    )
+                    cursor.execute(actualizar, [cantidad, tipo, anio])
+                    fila = cursor.fetchone()
+            return fila[0]
+        except (OperationalError, InterfaceError):
+            if con is connection or intento:
+                raise
+            con.close()  # conexión propia caída (p. ej. reinicio de la base): se reabre una vez
+
+def generar_folio(tipo: str, bloque=None) -> str:
+    # Genera un folio único del tipo: SS-YYYY-00001 (ver política de huecos arriba)
+    anio = timezone.now().year
+    bloque = bloque or FOLIO_BLOQUE
+    con = _conexion_reserva()
+    with _bloques_lock:
+        rango = _bloques.get((tipo, anio))
+        if rango is None or rango[0] > rango[1]:
+            if con.in_atomic_block:
+                # Reserva dentro de la transacción del llamador (SQLite): si esta se revierte, la fila de
+                # FolioSequence vuelve atrás y un bloque guardado en memoria se emitiría dos veces.
+                # Se reserva solo este folio, que se confirma o se revierte junto con el pedido.
+                return f"SS-{anio}-{_reservar_bloque(con, tipo, anio, 1):05d}"
+            ultimo = _reservar_bloque(con, tipo, anio, bloque)
+            rango = _bloques[(tipo, anio)] = [ultimo - bloque + 1, ultimo]
+        correlativo = rango[0]
+        rango[0] += 1
+    return f"SS-{anio}-{correlativo:05d}"
 
 def validar_archivo_soporte(file):
     # Valida tamaño y tipo MIME de archivos de soporte. Requerimiento US-18: máx 50MB, formatos: jpg, png, mp4, mov.
@@ -87,19 +151,49 @@ class Producto(models.Model):
     # para promociones
     precio_promocion = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, default=None)
     en_promocion = models.BooleanField(default=False)
+    # Precio final (promoción si aplica). Se calcula en save() para poder ordenar y paginar con índice
+    precio_efectivo = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Índice de búsqueda (PostgreSQL). Lo mantiene snake_shop.search, no se edita a mano
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ('nombre',)
         indexes = [
             models.Index(fields=['id', 'slug']),
+            # Índices compuestos para la paginación por cursor del catálogo (snake_shop.pagination)
+            models.Index(fields=['disponible', 'nombre', 'id'], name='producto_disp_nombre_idx'),
+            models.Index(fields=['disponible', 'precio', 'id'], name='producto_disp_precio_idx'),
+            models.Index(fields=['disponible', 'precio_efectivo', 'id'], name='producto_disp_pefect_idx'),
+            models.Index(fields=['disponible', 'creado', 'id'], name='producto_disp_creado_idx'),
+            models.Index(fields=['categoria', 'disponible', 'nombre', 'id'], name='producto_cat_nombre_idx'),
+            models.Index(fields=['categoria', 'disponible', 'precio', 'id'], name='producto_cat_precio_idx'),
+            models.Index(fields=['categoria', 'disponible', 'precio_efectivo', 'id'], name='producto_cat_pefect_idx'),
+            models.Index(fields=['categoria', 'disponible', 'creado', 'id'], name='producto_cat_creado_idx'),
+            # MAX(actualizado) barato para los ETag de los listados (snake_shop.conditional)
+            models.Index(fields=['disponible', 'actualizado'], name='producto_disp_actual_idx'),
+            models.Index(fields=['categoria', 'disponible', 'actualizado'], name='producto_cat_actual_idx'),
         ]
 
     def __str__(self):
         return self.nombre
 
+    def calcular_precio_efectivo(self):
+        return self.precio_promocion if self.en_promocion and self.precio_promocion else self.precio
+
+    def save(self, *args, **kwargs):
+        # precio_efectivo lo asigna la señal pre_save (también cubre loaddata); aquí solo se asegura que se persista
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'precio', 'precio_promocion', 'en_promocion'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'precio_efectivo'}
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('detalle_producto', args=[self.slug])
 
+@receiver(pre_save, sender=Producto)
+def asignar_precio_efectivo(sender, instance, **kwargs):
+    instance.precio_efectivo = instance.calcular_precio_efectivo()
+
 # Modelos para Usuarios y Perfiles
 class Perfil(models.Model):
     # Modelo de usuario para agregar roles y detalles de envío.
@@ -148,6 +242,12 @@ class Pedido(models.Model):
     creado = models.DateTimeField(auto_now_add=True)
     actualizado = models.DateTimeField(auto_now=True)
     pagado = models.BooleanField(default=False)
+    # Sin pagar pasado PENDING_ORDER_TTL_HOURS: su stock ya volvió al inventario (stock.expirar_pedidos)
+    expirado = models.BooleanField(default=False)
+    # Su stock ya volvió al inventario (stock.liberar_stock lo marca para no devolverlo dos veces)
+    stock_liberado = models.BooleanField(default=False)
+    # Se pagó después de expirar y ya no había stock para volver a reservarlo: revisar a mano antes de despachar
+    revision_stock = models.BooleanField(default=False)
     estado_despacho = models.CharField(max_length=20, choices=(
             ('en_despacho', 'Despacho a domicilio'),
             ('retiro', 'Retiro en tienda'),
@@ -163,6 +263,12 @@ class Pedido(models.Model):
     folio = models.CharField(max_length=50, unique=True, editable=False)
     class Meta:
         ordering = ('-creado',)
+        indexes = [
+            # Pedidos pendientes de pago por fecha (conciliación con Flow, expiración)
+            models.Index(fields=['pagado', 'creado'], name='pedido_pagado_creado_idx'),
+            # Historial del cliente (mis_pedidos) paginado por cursor ('-creado', '-id')
+            models.Index(fields=['usuario', '-creado', '-id'], name='pedido_usuario_creado_idx'),
+        ]
 
     def __str__(self):
         return f'Pedido {self.folio or self.id}'
@@ -176,6 +282,9 @@ class Pedido(models.Model):
         # Si el total está persistido, se usa ese valor. # Si no, se calcula a partir de los ítems.
         if self.total and self.total > 0:
             return self.total
+        # total_items viene anotado en SQL por mis_pedidos (evita recorrer los ítems)
+        if getattr(self, 'total_items', None) is not None:
+            return self.total_items
         return sum(item.get_cost() for item in self.items.all())
 
 class ItemPedido(models.Model):
@@ -191,11 +300,68 @@ class ItemPedido(models.Model):
     def get_cost(self):
         return self.precio * self.cantidad
 
+class PedidoVendedor(models.Model):
+    # Parte de cada vendedor en un pedido, escrita al crear los ítems (stock.reservar_stock). Las vistas del
+    # vendedor la leen con un índice en vez de unir Pedido × ItemPedido × Producto con DISTINCT.
+    pedido = models.ForeignKey(Pedido, related_name='vendedores', on_delete=models.CASCADE)
+    vendedor = models.ForeignKey(User, related_name='pedidos_vendidos', on_delete=models.CASCADE)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+    cantidad_items = models.PositiveIntegerField(default=0)
+    # Copias de Pedido para filtrar y ordenar sin join (pagado se mantiene en rollups.marcar_pagados)
+    creado = models.DateTimeField()
+    pagado = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pedido', 'vendedor'], name='pedido_vendedor_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['vendedor', '-creado'], name='pedido_vendedor_creado_idx'),
+            models.Index(fields=['vendedor', 'pagado'], name='pedido_vendedor_pagado_idx'),
+        ]
+
+    def __str__(self):
+        return f'Pedido {self.pedido_id} - vendedor {self.vendedor_id}: {self.subtotal}'
+
+class Carrito(models.Model):
+    # Carrito persistente (CART_BACKEND = 'db'): uno por usuario, o anónimo referenciado desde la sesión.
+    usuario = models.OneToOneField(User, related_name='carrito', on_delete=models.CASCADE, null=True, blank=True)
+    # Resumen mantenido en cada escritura (contador del encabezado sin sumar las líneas)
+    cantidad_items = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Para expirar carritos abandonados por rango de fecha
+            models.Index(fields=['actualizado'], name='carrito_actualizado_idx'),
+        ]
+
+    def __str__(self):
+        return f'Carrito {self.id} ({self.usuario or "invitado"})'
+
+class LineaCarrito(models.Model):
+    carrito = models.ForeignKey(Carrito, related_name='lineas', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='+', on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField(default=1)
+    # Precio efectivo al momento de agregar (mismo dato que guarda el carrito en sesión)
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['carrito', 'producto'], name='linea_carrito_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.cantidad} x {self.producto_id} (carrito {self.carrito_id})'
+
 # Modelo para Transacciones de Pago
 class Transaccion(models.Model):
     # Registra los detalles de las transacciones de pago. Pensado para integración con Flow y auditoría.
     ESTADO_PAGO_CHOICES = [
         ('pendiente', 'Pendiente'),
+        ('aprobado', 'Aprobado'),
         ('pagado', 'Pagado'),
         ('rechazado', 'Rechazado'),
         ('error', 'Error'),
@@ -204,7 +370,8 @@ class Transaccion(models.Model):
     pedido = models.ForeignKey(Pedido, related_name='transacciones', on_delete=models.CASCADE)
     id_transaccion = models.CharField(max_length=200)  # ID interno de la app
     flow_order = models.CharField(max_length=200, blank=True, null=True)
-    flow_token = models.CharField(max_length=200, blank=True, null=True)
+    # Único: los reintentos del webhook de Flow no pueden duplicar la transacción
+    flow_token = models.CharField(max_length=200, blank=True, null=True, unique=True)
     monto = models.DecimalField(max_digits=10, decimal_places=2)
     estado = models.CharField(max_length=50, choices=ESTADO_PAGO_CHOICES, default='pendiente')
     raw_webhook = models.JSONField(blank=True, null=True)
@@ -213,6 +380,43 @@ class Transaccion(models.Model):
     def __str__(self):
         return f'Transaccion {self.id_transaccion} - Pedido {self.pedido.folio}'
 
+# Resúmenes diarios para estadísticas (snake_shop/rollups.py): se actualizan al pagar y se
+# reconstruyen con `manage.py rebuild_rollups`. Fecha = día local de creación del pedido/transacción.
+class VentaDiaria(models.Model):
+    # Ventas pagadas por día, vendedor y producto
+    fecha = models.DateField()
+    vendedor = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='+', on_delete=models.CASCADE)
+    unidades = models.IntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'vendedor', 'producto'], name='venta_diaria_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['vendedor', 'fecha'], name='venta_diaria_vendedor_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.fecha} - {self.producto_id}: {self.unidades}'
+
+class TransaccionDiaria(models.Model):
+    # Transacciones por día y estado (cantidad y monto)
+    fecha = models.DateField()
+    estado = models.CharField(max_length=50, choices=Transaccion.ESTADO_PAGO_CHOICES)
+    cantidad = models.IntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'estado'], name='transaccion_diaria_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.fecha} - {self.estado}: {self.cantidad}'
+
 # Modelos para Servicio Técnico y Soporte
 class TicketSoporte(models.Model):
     ESTADO_CHOICES = [
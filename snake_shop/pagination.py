@@ -0,0 +1,151 @@
+# snake_shop/pagination.py
+# Paginación por cursor (keyset): cada página filtra "después de la última fila vista"
+# usando las mismas columnas del ORDER BY, así la página 100 cuesta lo mismo que la 1 (sin OFFSET).
+import base64
+import json
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import F, Func, Lookup, Q, Value
+
+# Motores donde se usa la comparación de filas (a, b) > (x, y); en el resto se expande a OR
+MOTORES_FILA = {'postgresql', 'sqlite'}
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+class Fila(Func):
+    # (a, b, c): valor de fila SQL
+    template = '(%(expressions)s)'
+
+
+class _ComparacionFilas(Lookup):
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} {self.operador} {rhs}', (*lhs_params, *rhs_params)
+
+
+class FilaMayor(_ComparacionFilas):
+    lookup_name = 'fila_gt'
+    operador = '>'
+
+
+class FilaMenor(_ComparacionFilas):
+    lookup_name = 'fila_lt'
+    operador = '<'
+
+
+@dataclass
+class PaginaKeyset:
+    objetos: list
+    siguiente_cursor: str | None = None
+    orden: tuple = field(default_factory=tuple)
+
+    @property
+    def tiene_siguiente(self):
+        return self.siguiente_cursor is not None
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    def __bool__(self):
+        return bool(self.objetos)
+
+
+def codificar_cursor(valores):
+    data = json.dumps(valores, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError) as e:
+        raise CursorInvalido('Cursor de paginación inválido.') from e
+    if not isinstance(valores, list):
+        raise CursorInvalido('Cursor de paginación inválido.')
+    return valores
+
+
+def _partes_orden(orden):
+    # ('-precio', 'id') -> [('precio', True), ('id', False)]
+    return [(o.lstrip('-'), o.startswith('-')) for o in orden]
+
+
+def _campo(queryset, nombre):
+    if nombre in queryset.query.annotations:
+        return queryset.query.annotations[nombre].output_field
+    return queryset.model._meta.get_field(nombre)
+
+
+def _convertir(queryset, nombre, valor):
+    # Convierte el valor del cursor (JSON) al tipo Python de la columna/anotación.
+    if valor is None:
+        return None
+    try:
+        return _campo(queryset, nombre).to_python(valor)
+    except ValidationError as e:
+        raise CursorInvalido('Cursor de paginación inválido.') from e
+
+
+def _filtro_despues_de(queryset, partes, valores):
+    sentidos = {descendente for _, descendente in partes}
+    if (
+        len(partes) > 1 and len(sentidos) == 1 and None not in valores
+        and connections[queryset.db].vendor in MOTORES_FILA
+    ):
+        # Todas las columnas en el mismo sentido: comparación de filas (k1, k2, id) > (v1, v2, z),
+        # que Postgres resuelve como un único rango sobre el índice compuesto del ORDER BY.
+        lookup = FilaMenor if sentidos.pop() else FilaMayor
+        return lookup(
+            Fila(*[F(nombre) for nombre, _ in partes]),
+            Fila(*[Value(valor, output_field=_campo(queryset, nombre)) for (nombre, _), valor in zip(partes, valores)]),
+        )
+    # Sentidos mezclados (p. ej. '-rank', 'id'): una comparación de filas compara todas las columnas en
+    # el mismo sentido, así que no sirve. Se expande a mano la comparación lexicográfica:
+    # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    condicion = Q()
+    iguales = Q()
+    for (nombre, descendente), valor in zip(partes, valores):
+        lookup = 'lt' if descendente else 'gt'
+        condicion |= iguales & Q(**{f'{nombre}__{lookup}': valor})
+        iguales &= Q(**{nombre: valor})
+    return condicion
+
+
+def paginar_keyset(queryset, orden, cursor=None, por_pagina=24):
+    # El último elemento de `orden` debe ser único (normalmente 'id' o '-id') para que el orden sea estable.
+    partes = _partes_orden(orden)
+    queryset = queryset.order_by(*orden)
+
+    if cursor:
+        valores = decodificar_cursor(cursor)
+        if len(valores) != len(partes):
+            raise CursorInvalido('Cursor de paginación inválido.')
+        valores = [_convertir(queryset, nombre, v) for (nombre, _), v in zip(partes, valores)]
+        queryset = queryset.filter(_filtro_despues_de(queryset, partes, valores))
+
+    # Se pide una fila extra para saber si hay página siguiente sin hacer COUNT(*)
+    filas = list(queryset[:por_pagina + 1])
+    siguiente = None
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        ultimo = filas[-1]
+        siguiente = codificar_cursor([_valor(ultimo, nombre) for nombre, _ in partes])
+    return PaginaKeyset(objetos=filas, siguiente_cursor=siguiente, orden=tuple(orden))
+
+
+def _valor(obj, nombre):
+    if isinstance(obj, dict):
+        return obj[nombre]
+    return getattr(obj, nombre)
@@ -0,0 +1,338 @@
+# snake_shop/payments.py
+# Estado de los pagos de Flow aplicado a Pedido/Transaccion.
+# - El webhook (views.confirmacion_flow) solo guarda el payload y responde 200 al instante; la consulta a
+#   payment/getStatus la hace un hilo en segundo plano (mismo patrón que images.encolar_derivados).
+# - Idempotencia: Transaccion.flow_token es único; un token ya resuelto (aprobado/rechazado) no se vuelve
+#   a consultar, y mientras uno se está resolviendo los reintentos de Flow se descartan con cache.add,
+#   así una ráfaga de notificaciones cuesta una sola consulta por token.
+# - aplicar_estado bloquea el Pedido (select_for_update) para que webhook, conciliación y vendedor
+#   no se pisen al marcar el mismo pedido.
+# - Cada cambio de estado actualiza en la misma transacción los resúmenes diarios (rollups.py).
+# - Un pedido que se paga después de expirar recupera su stock con stock.reponer_stock; si ya no alcanza
+#   queda pagado pero con revision_stock, para resolverlo a mano antes de despachar.
+# - conciliar_pendientes (comando reconcile_payments) recupera los webhooks perdidos: recorre por cursor los
+#   pedidos sin pagar de una ventana de tiempo, consulta Flow en paralelo con un pool acotado y un límite
+#   de llamadas por segundo, y aplica cada lote en una sola transacción (aplicar_estados).
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import Coalesce
+
+from . import flow, rollups, stock
+from .models import Pedido, Transaccion
+from .pagination import codificar_cursor, paginar_keyset
+
+logger = logging.getLogger(__name__)
+
+# Estados de Transaccion (ver Transaccion.ESTADO_PAGO_CHOICES)
+APROBADO = 'aprobado'
+PENDIENTE = 'pendiente'
+RECHAZADO = 'rechazado'
+ERROR = 'error'
+FINALES = (APROBADO, RECHAZADO)
+ESTADOS_FLOW = {
+    flow.ESTADO_PENDIENTE: PENDIENTE,
+    flow.ESTADO_PAGADO: APROBADO,
+    flow.ESTADO_RECHAZADO: RECHAZADO,
+    flow.ESTADO_ANULADO: RECHAZADO,
+}
+# Segundos que un token queda "en resolución" (descarta notificaciones repetidas mientras tanto)
+EN_CURSO_TIMEOUT = 60
+
+_executor = None
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'FLOW_WEBHOOK_WORKERS', 2),
+            thread_name_prefix='flow-webhook',
+        )
+    return _executor
+
+def _key_en_curso(token):
+    return f'flow:resolviendo:{token}'
+
+# Registro del pago al crearlo (crear_pedido)
+def registrar_pago_creado(pedido, datos_flow, monto):
+    # La transacción nace pendiente con el token: el webhook la encuentra sin consultar a Flow
+    transaccion = Transaccion.objects.create(
+        pedido=pedido,
+        id_transaccion=datos_flow['token'],
+        flow_token=datos_flow['token'],
+        flow_order=datos_flow.get('flowOrder'),
+        monto=monto,
+        estado=PENDIENTE,
+    )
+    rollups.mover_transacciones([rollups.aporte(transaccion)])
+    return transaccion
+
+# Aplicación del estado informado por Flow
+def aplicar_estados(resultados, raw_webhook=None):
+    # resultados: lista de (token, datos de payment/getStatus). Aplica todo en una transacción:
+    # bloquea los pedidos involucrados en orden de PK, crea/actualiza las transacciones en bloque y
+    # marca los pedidos pagados con un solo UPDATE. Devuelve {token: estado}.
+    normalizados = []
+    for token, datos in resultados:
+        try:
+            pedido_id = int(datos.get('commerceOrder'))
+        except (TypeError, ValueError):
+            logger.warning('Flow informó un commerceOrder inválido para el token %s: %r', token, datos.get('commerceOrder'))
+            continue
+        # getStatusByCommerceId puede no traer token: se identifica el pago por su flowOrder
+        token = token or datos.get('token') or f"flowOrder-{datos.get('flowOrder')}"
+        normalizados.append((token, pedido_id, datos))
+    if not normalizados:
+        return {}
+
+    estados = {}
+    with transaction.atomic():
+        pedidos = {
+            pedido.pk: pedido
+            for pedido in Pedido.objects.select_for_update()
+            .filter(pk__in=sorted({pedido_id for _, pedido_id, _ in normalizados}))
+            .order_by('pk').only('id', 'total', 'pagado', 'stock_liberado')
+        }
+        existentes = {
+            t.flow_token: t
+            for t in Transaccion.objects.filter(flow_token__in=[token for token, _, _ in normalizados])
+        }
+        nuevas, modificadas, pagados, cambios = [], [], [], []
+        for token, pedido_id, datos in normalizados:
+            pedido = pedidos.get(pedido_id)
+            if pedido is None:
+                logger.warning('Flow informó el token %s para el pedido inexistente %s', token, pedido_id)
+                continue
+            estado = ESTADOS_FLOW.get(datos.get('status'), PENDIENTE)
+            monto = Decimal(str(datos.get('amount') or 0))
+            if estado == APROBADO and monto != pedido.total:
+                # Pagado por un monto distinto al del pedido: no se marca como pagado
+                logger.error('Monto de Flow %s distinto al total %s del pedido %s', monto, pedido.total, pedido_id)
+                estado = ERROR
+
+            transaccion = existentes.get(token)
+            if transaccion is None:
+                transaccion = existentes[token] = Transaccion(
+                    pedido=pedido, id_transaccion=token, flow_token=token,
+                    flow_order=datos.get('flowOrder'), monto=monto, estado=estado,
+                    raw_webhook=raw_webhook,
+                )
+                nuevas.append(transaccion)
+            elif transaccion.estado != estado:
+                cambios.append(rollups.aporte(transaccion, -1))
+                transaccion.estado = estado
+                transaccion.monto = monto
+                transaccion.flow_order = datos.get('flowOrder') or transaccion.flow_order
+                modificadas.append(transaccion)
+            if estado == APROBADO and not pedido.pagado:
+                pedido.pagado = True
+                pagados.append(pedido.pk)
+            estados[token] = estado
+
+        Transaccion.objects.bulk_create(nuevas)
+        Transaccion.objects.bulk_update(modificadas, ['estado', 'monto', 'flow_order'])
+        cambios.extend(rollups.aporte(transaccion) for transaccion in nuevas + modificadas)
+        rollups.mover_transacciones(cambios)
+        if pagados:
+            # update() en vez de save(): no vuelve a pasar por el folio ni toca otros campos
+            Pedido.objects.filter(pk__in=pagados).update(pagado=True)
+            rollups.sumar_ventas(pagados)
+            rollups.marcar_pagados(pagados)
+            _reponer_stock([pk for pk in pagados if pedidos[pk].stock_liberado])
+    return estados
+
+def _reponer_stock(pedido_ids):
+    # Pagados después de expirar: su stock ya había vuelto al inventario y se reserva de nuevo
+    if not pedido_ids:
+        return
+    for pedido_id in stock.reponer_stock(pedido_ids):
+        logger.error('El pedido %s se pagó después de expirar y no hay stock para cubrirlo: quedó en revisión', pedido_id)
+
+def aplicar_estado(token, datos, raw_webhook=None):
+    # Un solo pago (webhook). Devuelve el estado de la Transaccion o None si el pedido no existe.
+    return aplicar_estados([(token, datos)], raw_webhook=raw_webhook).get(token)
+
+# Cambios manuales desde gestion_pedidos (uno o muchos pedidos a la vez)
+def actualizar_pedidos(pedidos, estado_despacho=None, pagado=None):
+    # pedidos: queryset ya acotado a lo que el usuario puede tocar. estado_despacho / pagado en None = sin cambio.
+    # Todo en una transacción con una cantidad fija de sentencias, sin importar cuántos pedidos sean:
+    # un UPDATE por campo, las transacciones aprobadas con bulk_create/un UPDATE y las quitadas con un DELETE.
+    # Devuelve la cantidad de pedidos actualizados.
+    with transaction.atomic():
+        filas = list(pedidos.select_for_update().order_by('pk').values_list('pk', 'pagado', 'stock_liberado'))
+        ids = [pk for pk, _, _ in filas]
+        if not ids:
+            return 0
+        if estado_despacho is not None:
+            Pedido.objects.filter(pk__in=ids).update(estado_despacho=estado_despacho)
+        if pagado is None:
+            return len(ids)
+
+        cambian = [pk for pk, pagado_antes, _ in filas if pagado_antes != pagado]
+        if cambian:
+            Pedido.objects.filter(pk__in=cambian).update(pagado=pagado)
+            rollups.sumar_ventas(cambian, 1 if pagado else -1)
+            rollups.marcar_pagados(cambian, pagado)
+        if pagado:
+            _reponer_stock([pk for pk, pagado_antes, liberado in filas if liberado and not pagado_antes])
+
+        if pagado:
+            _aprobar_transacciones(ids)
+        else:
+            # Si se quita el pago se eliminan sus transacciones (y se descuentan del resumen diario)
+            transacciones = Transaccion.objects.filter(pedido_id__in=ids)
+            rollups.sumar_transacciones(transacciones, -1)
+            transacciones.delete()
+    return len(ids)
+
+def _aprobar_transacciones(pedido_ids):
+    # La última transacción de cada pedido (p. ej. la pendiente de Flow) pasa a aprobada; los pedidos
+    # sin ninguna reciben una transacción aprobada por su total, para que aparezcan en el admin.
+    ultimas = dict(
+        Transaccion.objects.filter(pedido_id__in=pedido_ids)
+        .values('pedido_id').order_by('pedido_id').annotate(ultima=Max('id'))
+        .values_list('pedido_id', 'ultima')
+    )
+    por_aprobar = Transaccion.objects.filter(pk__in=ultimas.values()).exclude(estado=APROBADO)
+    rollups.sumar_transacciones(por_aprobar, -1)
+    aprobadas = list(por_aprobar.values_list('pk', flat=True))
+    Transaccion.objects.filter(pk__in=aprobadas).update(estado=APROBADO)
+    rollups.sumar_transacciones(Transaccion.objects.filter(pk__in=aprobadas))
+
+    sin_transaccion = [pk for pk in pedido_ids if pk not in ultimas]
+    if not sin_transaccion:
+        return
+    # Pedidos sin total guardado: suma de sus ítems en SQL (en vez de get_total_cost por pedido)
+    montos = (
+        Pedido.objects.filter(pk__in=sin_transaccion)
+        .annotate(total_items=Coalesce(Sum(F('items__precio') * F('items__cantidad')), Decimal('0')))
+        .values_list('pk', 'total', 'total_items')
+    )
+    nuevas = Transaccion.objects.bulk_create([
+        Transaccion(
+            pedido_id=pk, id_transaccion=f'manual-{pk}', estado=APROBADO,
+            monto=total if total and total > 0 else total_items,
+        )
+        for pk, total, total_items in montos
+    ])
+    rollups.mover_transacciones([rollups.aporte(t) for t in nuevas])
+
+# Webhook
+def registrar_notificacion(token, payload):
+    # Guarda el payload crudo en la transacción (si existe). Devuelve True si hay que consultar a Flow.
+    transacciones = Transaccion.objects.filter(flow_token=token)
+    transacciones.update(raw_webhook=payload)
+    if transacciones.filter(estado__in=FINALES).exists():
+        return False  # ya resuelto: reintento de Flow
+    return cache.add(_key_en_curso(token), 1, EN_CURSO_TIMEOUT)
+
+def resolver_pago(token, payload=None):
+    try:
+        datos = flow.get_client().estado_pago(token)
+        aplicar_estado(token, datos, raw_webhook=payload)
+        if ESTADOS_FLOW.get(datos.get('status')) == PENDIENTE:
+            cache.delete(_key_en_curso(token))  # sigue pendiente: la próxima notificación vuelve a consultar
+    except flow.FlowError as e:
+        # Flow caído o token desconocido: se libera el token para que el reintento de Flow (o la conciliación) lo resuelva
+        cache.delete(_key_en_curso(token))
+        logger.warning('No se pudo consultar el pago de Flow %s: %s', token, e)
+    except Exception:
+        cache.delete(_key_en_curso(token))
+        logger.exception('No se pudo resolver el pago de Flow %s', token)
+    finally:
+        # El hilo del pool abre su propia conexión; se cierra para no dejarla colgada
+        connection.close()
+
+def encolar_resolucion(token, payload=None):
+    return get_executor().submit(resolver_pago, token, payload)
+
+# Conciliación
+SIN_PAGO = 'sin_pago'  # Flow no conoce el pedido (nunca se llegó a pagar)
+
+def pedidos_pendientes(desde, hasta):
+    # Usa el índice pedido_pagado_creado_idx
+    return Pedido.objects.filter(pagado=False, creado__gte=desde, creado__lt=hasta)
+
+def tokens_por_pedido(pedido_ids):
+    # Último token de Flow de cada pedido, en una consulta
+    tokens = {}
+    filas = (
+        Transaccion.objects.filter(pedido_id__in=pedido_ids, flow_token__isnull=False)
+        .order_by('pedido_id', 'creado', 'id').values_list('pedido_id', 'flow_token')
+    )
+    for pedido_id, token in filas:
+        tokens[pedido_id] = token
+    return tokens
+
+def consultar_estado(pedido_id, token, limitador=None):
+    # Corre en los hilos del pool: solo HTTP, sin tocar la base de datos
+    if limitador is not None:
+        limitador.esperar()
+    cliente = flow.get_client()
+    if token:
+        return token, cliente.estado_pago(token)
+    return None, cliente.estado_por_orden(pedido_id)
+
+def conciliar_lote(pedido_ids, executor, limitador=None):
+    # Consulta en paralelo el estado de los pedidos y aplica los resultados en una transacción.
+    # Devuelve un Counter por estado. Si Flow deja de responder se aplica lo obtenido y se propaga
+    # FlowNoDisponible para que el llamador no avance el cursor más allá de este lote.
+    tokens = tokens_por_pedido(pedido_ids)
+    futuros = {
+        executor.submit(consultar_estado, pedido_id, tokens.get(pedido_id), limitador): pedido_id
+        for pedido_id in pedido_ids
+    }
+    resultados, conteo, caida = [], Counter(), None
+    for futuro in as_completed(futuros):
+        try:
+            resultados.append(futuro.result())
+        except flow.FlowNoDisponible as e:
+            caida = e
+            conteo[ERROR] += 1
+        except flow.FlowError as e:
+            if e.status == 400:
+                conteo[SIN_PAGO] += 1
+            else:
+                logger.warning('No se pudo consultar el pedido %s en Flow: %s', futuros[futuro], e)
+                conteo[ERROR] += 1
+    conteo.update(aplicar_estados(resultados).values())
+    if caida is not None:
+        raise caida
+    return conteo
+
+def conciliar_pendientes(desde, hasta, cursor=None, batch_size=100, workers=None, por_segundo=None, al_avanzar=None):
+    # Recorre los pedidos pendientes de [desde, hasta) por cursor (creado, id): la memoria y cada consulta
+    # quedan acotadas al lote. al_avanzar(cursor, conteo_lote, segundos) se llama tras aplicar cada lote
+    # (checkpoint y reporte del comando). Devuelve el Counter total.
+    workers = workers or getattr(settings, 'FLOW_RECONCILE_WORKERS', 4)
+    if por_segundo is None:
+        por_segundo = getattr(settings, 'FLOW_RECONCILE_RPS', 5)
+    limitador = flow.LimitadorTasa(por_segundo)
+    total = Counter()
+    queryset = pedidos_pendientes(desde, hasta).values('id', 'creado')
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='flow-conciliacion') as executor:
+        while True:
+            pagina = paginar_keyset(queryset, ('creado', 'id'), cursor=cursor, por_pagina=batch_size)
+            if not pagina:
+                break
+            inicio = time.monotonic()
+            conteo = conciliar_lote([fila['id'] for fila in pagina], executor, limitador)
+            total.update(conteo)
+            cursor = pagina.siguiente_cursor or _cursor_final(pagina)
+            if al_avanzar is not None:
+                al_avanzar(cursor, conteo, time.monotonic() - inicio)
+            if not pagina.tiene_siguiente:
+                break
+    return total
+
+def _cursor_final(pagina):
+    # Cursor después de la última fila: al reanudar no se repite el último lote
+    ultimo = pagina.objetos[-1]
+    return codificar_cursor([ultimo['creado'], ultimo['id']])
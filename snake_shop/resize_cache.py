@@ -0,0 +1,211 @@
+# snake_shop/resize_cache.py
+# Redimensionado bajo demanda de imágenes de MEDIA_ROOT: /media/r/<ancho>x<alto>/<ruta>
+# - El resultado se guarda en MEDIA_ROOT/r/<ancho>x<alto>/<ruta>, la misma ruta de la URL,
+#   así nginx puede servirlo directo desde disco después del primer render (ver nginx/default.conf).
+# - Solo se redimensionan imágenes de las carpetas públicas del catálogo (IMAGE_RESIZE_CARPETAS, p. ej.
+#   productos/) con extensión de imagen: los adjuntos de soporte/ y cualquier otro archivo dan 404.
+# - La carpeta tiene un tope de tamaño; al superarlo se borran los archivos usados hace más tiempo (LRU por mtime).
+#   Los aciertos servidos por Django actualizan el mtime; los que sirve nginx no, por eso el orden es aproximado.
+#   Cada worker de gunicorn suma solo lo que él genera, así que la cuenta se vuelve a medir en disco cada
+#   REESCANEO segundos (y siempre al purgar): el tope se puede pasar, como mucho, por lo generado en ese lapso.
+# - Single-flight: si varios requests piden la misma variante a la vez, solo uno la genera y el resto espera.
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+CARPETA = 'r'
+MAX_DIMENSION = getattr(settings, 'IMAGE_RESIZE_MAX_DIM', 2048)
+MAX_BYTES = getattr(settings, 'IMAGE_RESIZE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+CARPETAS_ORIGEN = tuple(getattr(settings, 'IMAGE_RESIZE_CARPETAS', ('productos',)))
+EXTENSIONES = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+ESPERA_MAXIMA = 30  # segundos que un request espera a que otro proceso termine la misma variante
+REESCANEO = 60      # segundos entre mediciones del tamaño real de la caché en disco
+CALIDAD = 82
+
+
+class RutaInvalida(ValueError):
+    pass
+
+
+# Original que no se puede leer como imagen (archivo dañado o con extensión engañosa)
+ERRORES_IMAGEN = (UnidentifiedImageError, Image.DecompressionBombError, OSError)
+
+
+def media_root():
+    return Path(settings.MEDIA_ROOT).resolve()
+
+def raiz_cache():
+    return media_root() / CARPETA
+
+def resolver_origen(ruta):
+    # Ruta del original: una imagen dentro de alguna de CARPETAS_ORIGEN (sin salir de ellas con .. o enlaces).
+    root = media_root()
+    origen = (root / ruta).resolve()
+    if not any(root / carpeta in origen.parents for carpeta in CARPETAS_ORIGEN):
+        raise RutaInvalida(ruta)
+    if origen.suffix.lower() not in EXTENSIONES or not origen.is_file():
+        raise RutaInvalida(ruta)
+    return origen
+
+def validar_dimensiones(ancho, alto):
+    # 0 en una dimensión = se calcula manteniendo la proporción
+    if ancho < 0 or alto < 0 or (ancho == 0 and alto == 0):
+        raise RutaInvalida('dimensiones')
+    if ancho > MAX_DIMENSION or alto > MAX_DIMENSION:
+        raise RutaInvalida('dimensiones')
+
+def etag(origen, ancho, alto):
+    # ETag fuerte: depende solo del original (mtime + tamaño) y del tamaño pedido
+    stat = origen.stat()
+    base = f'{origen}:{stat.st_mtime_ns}:{stat.st_size}:{ancho}x{alto}'
+    return '"%s"' % hashlib.sha1(base.encode()).hexdigest()
+
+# Render
+def _redimensionar(origen, destino, ancho, alto):
+    with Image.open(origen) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if ancho == 0:
+            ancho = max(1, round(imagen.width * alto / imagen.height))
+        elif alto == 0:
+            alto = max(1, round(imagen.height * ancho / imagen.width))
+        # Sin agrandar: si el original ya cabe en la caja se guarda con su tamaño
+        if ancho < imagen.width or alto < imagen.height:
+            imagen = ImageOps.contain(imagen, (ancho, alto), Image.Resampling.LANCZOS)
+        formato = Image.registered_extensions().get(destino.suffix.lower(), 'PNG')
+        if formato == 'JPEG' and imagen.mode not in ('RGB', 'L'):
+            imagen = imagen.convert('RGB')
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporal = destino.with_name(f'.{destino.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        imagen.save(temporal, format=formato, quality=CALIDAD)
+        os.replace(temporal, destino)
+
+# Single-flight
+# Locks por "franjas": cantidad fija de locks, la variante elige uno por hash (memoria acotada)
+_locks = [threading.Lock() for _ in range(64)]
+
+def _lock_local(key):
+    return _locks[hash(key) % len(_locks)]
+
+def _lock_archivo(destino):
+    # Lock entre procesos (workers de gunicorn) con un archivo creado en modo exclusivo
+    lock = destino.with_name(f'.{destino.name}.lock')
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            return lock
+        except FileExistsError:
+            if destino.exists():
+                return None  # otro proceso ya la generó
+            try:
+                if time.time() - lock.stat().st_mtime > ESPERA_MAXIMA:
+                    lock.unlink(missing_ok=True)  # lock abandonado
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > limite:
+                raise TimeoutError(str(destino))
+            time.sleep(0.05)
+
+def _vigente(destino, origen):
+    try:
+        return destino.stat().st_mtime >= origen.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+def obtener_variante(origen, ancho, alto):
+    # Devuelve la ruta del archivo redimensionado. Lo genera si no existe o si el original cambió.
+    destino = raiz_cache() / f'{ancho}x{alto}' / origen.relative_to(media_root())
+
+    if _vigente(destino, origen):
+        os.utime(destino)  # marca de uso para el LRU
+        return destino
+
+    with _lock_local(str(destino)):
+        if _vigente(destino, origen):
+            return destino
+        lock = _lock_archivo(destino)
+        try:
+            if not _vigente(destino, origen):
+                _redimensionar(origen, destino, ancho, alto)
+                lru.registrar(destino.stat().st_size)
+        finally:
+            if lock is not None:
+                lock.unlink(missing_ok=True)
+    return destino
+
+# LRU en disco
+class CacheLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._tamano = None
+        self._medido = 0.0
+        self._lock = threading.Lock()
+
+    def _archivos(self):
+        raiz = raiz_cache()
+        if not raiz.exists():
+            return []
+        archivos = []
+        for carpeta, _, nombres in os.walk(raiz):
+            for nombre in nombres:
+                if nombre.startswith('.'):
+                    continue
+                ruta = Path(carpeta) / nombre
+                try:
+                    stat = ruta.stat()
+                except FileNotFoundError:
+                    continue
+                archivos.append((stat.st_mtime, stat.st_size, ruta))
+        return archivos
+
+    def _medir(self):
+        self._tamano = sum(size for _, size, _ in self._archivos())
+        self._medido = time.monotonic()
+
+    def _desactualizado(self):
+        return self._tamano is None or time.monotonic() - self._medido > REESCANEO
+
+    def tamano(self):
+        with self._lock:
+            if self._desactualizado():
+                self._medir()
+            return self._tamano
+
+    def registrar(self, bytes_nuevos):
+        with self._lock:
+            if self._desactualizado():
+                # La medición ya incluye el archivo recién generado (y lo que escribieron otros workers)
+                self._medir()
+            else:
+                self._tamano += bytes_nuevos
+            excedido = self._tamano > self.max_bytes
+        if excedido:
+            self.purgar()
+
+    def purgar(self, objetivo=None):
+        # Borra los archivos menos usados hasta quedar bajo el 90% del tope (o el objetivo dado)
+        objetivo = int(self.max_bytes * 0.9) if objetivo is None else objetivo
+        with self._lock:
+            archivos = sorted(self._archivos(), key=lambda a: a[0])
+            total = sum(size for _, size, _ in archivos)
+            borrados = 0
+            for _, size, ruta in archivos:
+                if total <= objetivo:
+                    break
+                ruta.unlink(missing_ok=True)
+                total -= size
+                borrados += 1
+            self._tamano = total
+            self._medido = time.monotonic()
+        return borrados
+
+
+lru = CacheLRU(MAX_BYTES)
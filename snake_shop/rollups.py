@@ -0,0 +1,123 @@
+# snake_shop/rollups.py
+# Resúmenes diarios para estadisticas_vendedor: VentaDiaria (día × vendedor × producto, solo pedidos pagados)
+# y TransaccionDiaria (día × estado de Transaccion).
+# - Incrementales: cada cambio suma o resta su aporte con UPDATE ... SET x = x + n (F()) sobre la fila del
+#   día, creándola si no existe. Se llaman dentro de la transacción que cambia el pedido o el pago, así el
+#   resumen se confirma o se revierte junto con el cambio.
+#     sumar_ventas(pedido_ids, signo)      un pedido pasa a pagado (+1) o deja de estarlo (-1)
+#     sumar_transacciones(queryset, signo) altas/bajas de transacciones ya guardadas (agregado en SQL)
+#     mover_transacciones(cambios)         cambios en memoria: [(creado, estado, monto, signo), ...]
+#     marcar_pagados(pedido_ids, pagado)   copia de Pedido.pagado en PedidoVendedor
+# - Lo que se cambie por fuera (admin, shell, crud del dashboard) no pasa por acá:
+#   `manage.py rebuild_rollups` recalcula todo, o un rango de fechas, desde Pedido/ItemPedido/Transaccion.
+# La fecha es el día local de creación del pedido (ventas) o de la transacción, así reconstruir da lo mismo.
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ItemPedido, PedidoVendedor, Transaccion, TransaccionDiaria, VentaDiaria
+
+MONTO = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _acumular(modelo, claves, incrementos):
+    # Suma `incrementos` a la fila `claves`; si no existe la crea (y si otro proceso la creó primero, suma)
+    valores = {campo: F(campo) + valor for campo, valor in incrementos.items()}
+    if modelo.objects.filter(**claves).update(**valores):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**claves, **incrementos)
+    except IntegrityError:
+        modelo.objects.filter(**claves).update(**valores)
+
+def _ventas_por_dia(items):
+    # Aporte de un conjunto de ItemPedido agrupado en SQL por (día, vendedor, producto)
+    return (
+        items.annotate(fecha=TruncDate('pedido__creado'))
+        .values('fecha', 'producto_id', vendedor_id=F('producto__vendedor_id'))
+        .annotate(
+            unidades=Sum('cantidad'),
+            monto=Sum(F('precio') * F('cantidad'), output_field=MONTO),
+            pedidos=Count('pedido_id', distinct=True),
+        )
+        .order_by('fecha', 'vendedor_id', 'producto_id')  # orden fijo: dos pagos no se bloquean en cruz
+    )
+
+def _transacciones_por_dia(transacciones):
+    return (
+        transacciones.annotate(fecha=TruncDate('creado'))
+        .values('fecha', 'estado')
+        .annotate(cantidad=Count('id'), total=Sum('monto'))
+        .order_by('fecha', 'estado')
+    )
+
+def sumar_ventas(pedido_ids, signo=1):
+    for fila in _ventas_por_dia(ItemPedido.objects.filter(pedido_id__in=pedido_ids)):
+        _acumular(
+            VentaDiaria,
+            {'fecha': fila['fecha'], 'vendedor_id': fila['vendedor_id'], 'producto_id': fila['producto_id']},
+            {'unidades': signo * fila['unidades'], 'monto': signo * fila['monto'], 'pedidos': signo * fila['pedidos']},
+        )
+
+def marcar_pagados(pedido_ids, pagado=True):
+    PedidoVendedor.objects.filter(pedido_id__in=pedido_ids).update(pagado=pagado)
+
+def sumar_transacciones(transacciones, signo=1):
+    for fila in _transacciones_por_dia(transacciones):
+        _acumular(
+            TransaccionDiaria,
+            {'fecha': fila['fecha'], 'estado': fila['estado']},
+            {'cantidad': signo * fila['cantidad'], 'monto': signo * fila['total']},
+        )
+
+def aporte(transaccion, signo=1):
+    # Entrada para mover_transacciones a partir de una Transaccion en memoria
+    return (transaccion.creado, transaccion.estado, transaccion.monto, signo)
+
+def mover_transacciones(cambios):
+    totales = defaultdict(lambda: [0, Decimal('0')])
+    for creado, estado, monto, signo in cambios:
+        total = totales[(timezone.localdate(creado), estado)]
+        total[0] += signo
+        total[1] += signo * Decimal(monto)
+    for (fecha, estado), (cantidad, monto) in sorted(totales.items()):
+        if cantidad or monto:  # un cambio que se anula (p. ej. pendiente -> pendiente) no toca la tabla
+            _acumular(TransaccionDiaria, {'fecha': fecha, 'estado': estado}, {'cantidad': cantidad, 'monto': monto})
+
+# Reconstrucción completa
+def reconstruir(desde=None, hasta=None):
+    # Recalcula los resúmenes de [desde, hasta] (fechas incluidas; None = sin límite) en una transacción.
+    # Devuelve (filas de VentaDiaria, filas de TransaccionDiaria).
+    ventas = VentaDiaria.objects.all()
+    resumen = TransaccionDiaria.objects.all()
+    items = ItemPedido.objects.filter(pedido__pagado=True)
+    transacciones = Transaccion.objects.all()
+    if desde is not None:
+        ventas, resumen = ventas.filter(fecha__gte=desde), resumen.filter(fecha__gte=desde)
+        items = items.filter(pedido__creado__date__gte=desde)
+        transacciones = transacciones.filter(creado__date__gte=desde)
+    if hasta is not None:
+        ventas, resumen = ventas.filter(fecha__lte=hasta), resumen.filter(fecha__lte=hasta)
+        items = items.filter(pedido__creado__date__lte=hasta)
+        transacciones = transacciones.filter(creado__date__lte=hasta)
+
+    with transaction.atomic():
+        ventas.delete()
+        resumen.delete()
+        nuevas_ventas = VentaDiaria.objects.bulk_create(
+            (VentaDiaria(**fila) for fila in _ventas_por_dia(items).iterator()),
+            batch_size=1000,
+        )
+        nuevo_resumen = TransaccionDiaria.objects.bulk_create(
+            (
+                TransaccionDiaria(fecha=fila['fecha'], estado=fila['estado'], cantidad=fila['cantidad'], monto=fila['total'])
+                for fila in _transacciones_por_dia(transacciones).iterator()
+            ),
+            batch_size=1000,
+        )
+    return len(nuevas_ventas), len(nuevo_resumen)
@@ -0,0 +1,176 @@
+# snake_shop/search.py
+# Búsqueda de productos indexada (reemplaza los icontains de lista_productos).
+# - PostgreSQL: columna Producto.search_vector (nombre > descripción > categoría) con índice GIN,
+#   ranking con SearchRank. Si la página sale vacía, la vista pide buscar_parecidos: nombres con
+#   trigramas parecidos (pg_trgm) para errores de tipeo, filtrados con el operador % (nombre__trigram_similar),
+#   que sí usa el índice GIN de trigramas; la similitud para ordenar se calcula solo sobre esas filas.
+#   El umbral es pg_trgm.similarity_threshold (0.3 por defecto; ALTER DATABASE ... SET para cambiarlo).
+# - SQLite (desarrollo local): tabla virtual FTS5 con ranking bm25.
+# - Otros motores: se mantiene el filtro icontains como último recurso.
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Categoria, Producto
+
+FTS_TABLE = 'snake_shop_producto_fts'
+# Configuración de texto de PostgreSQL; la misma la usa la migración 0021 para poblar el índice
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'spanish')
+# Máximo de coincidencias que devuelve FTS5 antes de filtrar en el ORM
+FTS_LIMITE = getattr(settings, 'SEARCH_FTS_LIMITE', 1000)
+
+def _motor():
+    return connection.vendor
+
+def _vector_producto():
+    # Vector ponderado: A = nombre, B = descripción, C = nombre de la categoría
+    categoria_nombre = Subquery(
+        Categoria.objects.filter(pk=OuterRef('categoria_id')).values('nombre')[:1]
+    )
+    return (
+        SearchVector('nombre', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('descripcion', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(categoria_nombre, weight='C', config=SEARCH_CONFIG)
+    )
+
+# Consulta
+def buscar_productos(productos, query):
+    # Filtra y ordena por relevancia el queryset recibido según el texto buscado.
+    query = (query or '').strip()
+    if not query:
+        return productos
+
+    motor = _motor()
+    if motor == 'postgresql':
+        return _buscar_postgres(productos, query)
+    if motor == 'sqlite':
+        return _buscar_sqlite(productos, query)
+    return _buscar_simple(productos, query)
+
+def _buscar_simple(productos, query):
+    # Sin índice disponible. Se anota rank constante para que todos los caminos ordenen igual.
+    return productos.filter(
+        Q(nombre__icontains=query) | Q(descripcion__icontains=query)
+    ).annotate(rank=Value(0.0, output_field=FloatField())).order_by('-rank', 'id')
+
+def _buscar_postgres(productos, query):
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    # rank se castea a double precision para que el valor que vuelve a Python sea exacto
+    # y se pueda usar como cursor de paginación (snake_shop.pagination).
+    return productos.filter(search_vector=search_query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+    ).order_by('-rank', 'id')
+
+def buscar_parecidos(productos, query):
+    # Fallback para errores de tipeo cuando buscar_productos no encontró nada. None si el motor no tiene
+    # uno (en SQLite FTS5 ya busca por prefijo). Mismo rank que buscar_productos: sirve el mismo orden y cursor.
+    query = (query or '').strip()
+    if not query or _motor() != 'postgresql':
+        return None
+    return productos.filter(nombre__trigram_similar=query).annotate(
+        rank=Cast(TrigramSimilarity('nombre', query), FloatField())
+    ).order_by('-rank', 'id')
+
+def _consulta_fts5(query):
+    # Cada palabra se busca como prefijo: "memo ddr" -> "memo"* "ddr"*
+    terminos = [t.replace('"', '""') for t in query.split()]
+    return ' '.join(f'"{t}"*' for t in terminos if t)
+
+def _buscar_sqlite(productos, query):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 2.0) LIMIT %s',
+                [_consulta_fts5(query), FTS_LIMITE],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+    except Exception:
+        # SQLite compilado sin FTS5 o índice no creado: búsqueda simple
+        return _buscar_simple(productos, query)
+
+    if not ids:
+        return productos.none().annotate(rank=Value(0.0, output_field=FloatField()))
+    # rank = -posición en el resultado de bm25 (mayor es más relevante, igual que en PostgreSQL)
+    orden = Case(*[When(pk=pk, then=Value(-pos)) for pos, pk in enumerate(ids)], output_field=FloatField())
+    return productos.filter(pk__in=ids).annotate(rank=orden).order_by('-rank', 'id')
+
+# Mantenimiento del índice
+def actualizar_indice(producto_ids):
+    # Recalcula el índice de búsqueda de los productos indicados.
+    producto_ids = list(producto_ids)
+    if not producto_ids:
+        return
+
+    motor = _motor()
+    if motor == 'postgresql':
+        Producto.objects.filter(pk__in=producto_ids).update(search_vector=_vector_producto())
+    elif motor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(producto_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', producto_ids)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, nombre, descripcion, categoria) '
+                f'SELECT p.id, p.nombre, p.descripcion, c.nombre '
+                f'FROM snake_shop_producto p JOIN snake_shop_categoria c ON c.id = p.categoria_id '
+                f'WHERE p.id IN ({placeholders})',
+                producto_ids,
+            )
+
+def eliminar_del_indice(producto_ids):
+    producto_ids = list(producto_ids)
+    if not producto_ids or _motor() != 'sqlite':
+        # En PostgreSQL el vector vive en la propia fila del producto
+        return
+    placeholders = ', '.join(['%s'] * len(producto_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', producto_ids)
+
+def reconstruir_indice(batch_size=1000, progreso=None):
+    # Reconstruye el índice completo por lotes de IDs. Devuelve la cantidad de productos indexados.
+    if _motor() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        ids = list(
+            Producto.objects.filter(pk__gt=ultimo_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            actualizar_indice(ids)
+        total += len(ids)
+        ultimo_id = ids[-1]
+        if progreso:
+            progreso(total)
+    return total
+
+# Señales: el índice se mantiene solo al guardar productos o renombrar categorías
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(lambda: actualizar_indice([instance.pk]))
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: eliminar_del_indice([pk]))
+
+@receiver(post_save, sender=Categoria)
+def indexar_categoria(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    categoria_id = instance.pk
+
+    def _reindexar():
+        ids = Producto.objects.filter(categoria_id=categoria_id).values_list('pk', flat=True)
+        actualizar_indice(ids)
+
+    transaction.on_commit(_reindexar)
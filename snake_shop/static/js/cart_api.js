@@ -0,0 +1,49 @@
+// snake_shop/static/js/cart_api.js
+
+// Actualiza el carrito con la API JSON (cart/api/...) sin recargar la página.
+// Si el JS no carga, los formularios siguen funcionando con POST + redirect.
+document.addEventListener('DOMContentLoaded', function() {
+    const tabla = document.getElementById('cart-table');
+    if (!tabla) return;
+
+    const subtotal = document.getElementById('cart-subtotal');
+    const envio = document.getElementById('cart-envio');
+    const contador = document.getElementById('cart-count');
+
+    function aplicarRespuesta(datos) {
+        // Reemplaza solo las filas que cambiaron
+        Object.entries(datos.html || {}).forEach(function([productoId, html]) {
+            const fila = tabla.querySelector(`tr[data-producto-id="${productoId}"]`);
+            if (fila) fila.outerHTML = html;
+        });
+        (datos.eliminados || []).forEach(function(productoId) {
+            const fila = tabla.querySelector(`tr[data-producto-id="${productoId}"]`);
+            if (fila) fila.remove();
+        });
+        if (subtotal) subtotal.textContent = datos.subtotal;
+        if (envio) envio.textContent = datos.envio;
+        if (contador) contador.textContent = datos.cart_count;
+        if (datos.cart_count === 0) window.location.reload();  // muestra "Tu carrito está vacío"
+
+        Object.values(datos.errores || {}).forEach(function(mensaje) {
+            alert(mensaje);
+        });
+    }
+
+    tabla.addEventListener('submit', function(e) {
+        const form = e.target;
+        if (!form.dataset.apiUrl) return;
+        e.preventDefault();
+
+        const datos = new FormData(form);
+        datos.append('fragmentos', '1');
+        fetch(form.dataset.apiUrl, {
+            method: 'POST',
+            body: datos,
+            headers: { 'X-Requested-With': 'XMLHttpRequest' },
+        })
+            .then(function(respuesta) { return respuesta.json(); })
+            .then(aplicarRespuesta)
+            .catch(function() { form.submit(); });  // sin conexión con la API: envío normal
+    });
+});
@@ -0,0 +1,205 @@
+# snake_shop/stock.py
+# Reserva de stock al crear un pedido, en una cantidad fija de consultas sin importar cuántas líneas tenga:
+#   1. SELECT ... FOR UPDATE de todos los productos del pedido, ordenados por PK (orden determinista:
+#      dos checkouts con productos en común no se bloquean en cruz).
+#   2. Se validan todas las líneas y se informan juntas las que no alcanzan.
+#   3. Un solo UPDATE con CASE descuenta el stock, condicionado a stock >= cantidad en cada fila;
+#      si alguna fila no cumple, el UPDATE afecta menos filas y se aborta la transacción.
+#   4. bulk_create de los ItemPedido y de la parte de cada vendedor (PedidoVendedor).
+# update() no pasa por save(): `actualizado` no cambia y no se disparan señales del catálogo.
+# Debe llamarse dentro de transaction.atomic().
+# expirar_pedidos devuelve el stock de los pedidos impagos vencidos por lotes (comando expirar_pedidos);
+# si uno de esos pedidos se paga después, reponer_stock lo vuelve a reservar (o lo deja en revisión).
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Sum, When
+from django.utils import timezone
+
+from .models import ItemPedido, Pedido, PedidoVendedor, Producto
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, faltantes):
+        # faltantes: lista de (nombre del producto, cantidad pedida, stock disponible)
+        self.faltantes = faltantes
+        detalle = ', '.join(
+            f'{nombre} (pediste {pedido}, quedan {disponible})' for nombre, pedido, disponible in faltantes
+        )
+        super().__init__(f'Stock insuficiente para: {detalle}')
+
+
+class _ReservaIncompleta(Exception):
+    pass
+
+
+def reservar_stock(pedido, lineas):
+    # lineas: {producto_id: (cantidad, precio)}. Devuelve los ItemPedido creados.
+    ids = sorted(int(producto_id) for producto_id in lineas)
+    cantidades = {int(producto_id): cantidad for producto_id, (cantidad, _) in lineas.items()}
+    precios = {int(producto_id): precio for producto_id, (_, precio) in lineas.items()}
+
+    productos = list(
+        Producto.objects.select_for_update().filter(pk__in=ids).order_by('pk').only('id', 'nombre', 'stock', 'vendedor_id')
+    )
+    encontrados = {producto.pk: producto for producto in productos}
+    faltantes = []
+    for producto_id in ids:
+        producto = encontrados.get(producto_id)
+        if producto is None:
+            faltantes.append((f'producto #{producto_id}', cantidades[producto_id], 0))
+        elif producto.stock < cantidades[producto_id]:
+            faltantes.append((producto.nombre, cantidades[producto_id], producto.stock))
+    if faltantes:
+        raise StockInsuficiente(faltantes)
+
+    if not _descontar(cantidades):
+        # Solo posible si el motor no bloquea filas (SQLite ignora FOR UPDATE) y otro checkout se
+        # adelantó: el savepoint deshizo el UPDATE parcial y se informan las líneas con el stock actual.
+        actuales = Producto.objects.filter(pk__in=ids).values_list('pk', 'nombre', 'stock')
+        raise StockInsuficiente([
+            (nombre, cantidades[producto_id], stock)
+            for producto_id, nombre, stock in actuales
+            if stock < cantidades[producto_id]
+        ])
+
+    items = ItemPedido.objects.bulk_create([
+        ItemPedido(pedido=pedido, producto_id=producto_id, precio=precios[producto_id], cantidad=cantidades[producto_id])
+        for producto_id in ids
+    ])
+
+    partes = {}
+    for producto_id in ids:
+        parte = partes.setdefault(encontrados[producto_id].vendedor_id, [Decimal('0'), 0])
+        parte[0] += Decimal(precios[producto_id]) * cantidades[producto_id]
+        parte[1] += cantidades[producto_id]
+    PedidoVendedor.objects.bulk_create([
+        PedidoVendedor(
+            pedido=pedido, vendedor_id=vendedor_id, subtotal=subtotal, cantidad_items=cantidad,
+            creado=pedido.creado, pagado=pedido.pagado,
+        )
+        for vendedor_id, (subtotal, cantidad) in partes.items()
+    ])
+    return items
+
+
+def _descontar(cantidades):
+    # cantidades: {producto_id: cantidad}. Un solo UPDATE con CASE condicionado a stock >= cantidad en
+    # cada fila, en un savepoint: si alguna fila no alcanza se deshace completo y devuelve False.
+    if not cantidades:
+        return True
+    ids = sorted(cantidades)
+    suficiente = Q()
+    for producto_id in ids:
+        suficiente |= Q(pk=producto_id, stock__gte=cantidades[producto_id])
+    try:
+        with transaction.atomic():
+            actualizados = Producto.objects.filter(suficiente).update(
+                stock=Case(
+                    *[When(pk=producto_id, then=F('stock') - cantidades[producto_id]) for producto_id in ids],
+                    default=F('stock'),
+                    output_field=PositiveIntegerField(),
+                )
+            )
+            if actualizados != len(ids):
+                raise _ReservaIncompleta()
+    except _ReservaIncompleta:
+        return False
+    return True
+
+
+def reponer_stock(pedido_ids):
+    # Vuelve a reservar el stock de pedidos que ya lo habían liberado (pagados después de expirar), con el
+    # mismo UPDATE condicional del checkout y todo el pedido o nada. Los que no alcanzan quedan marcados
+    # con revision_stock para resolverlos a mano antes de despachar. Llamar dentro de transaction.atomic()
+    # con los pedidos bloqueados. Devuelve los ids que quedaron en revisión.
+    lineas = defaultdict(lambda: defaultdict(int))
+    for pedido_id, producto_id, cantidad in (
+        ItemPedido.objects.filter(pedido_id__in=pedido_ids, pedido__stock_liberado=True)
+        .values_list('pedido_id', 'producto_id', 'cantidad')
+    ):
+        lineas[pedido_id][producto_id] += cantidad
+    if not lineas:
+        return []
+    _bloquear_productos({producto_id for cantidades in lineas.values() for producto_id in cantidades})
+
+    repuestos, en_revision = [], []
+    for pedido_id in sorted(lineas):
+        (repuestos if _descontar(lineas[pedido_id]) else en_revision).append(pedido_id)
+    if repuestos:
+        Pedido.objects.filter(pk__in=repuestos).update(stock_liberado=False, expirado=False)
+    if en_revision:
+        Pedido.objects.filter(pk__in=en_revision).update(revision_stock=True)
+    return en_revision
+
+
+def liberar_stock(pedido_ids):
+    # Devuelve al inventario el stock de los pedidos dados: cantidades sumadas por producto en SQL
+    # y un solo UPDATE con CASE (sin save() por ítem). Devuelve la cantidad de productos tocados.
+    # Idempotente: solo cuenta los pedidos con stock_liberado=False, bloqueados y marcados en la misma
+    # transacción, así un reintento o dos caminos sobre el mismo pedido (expiración y eliminación) no
+    # devuelven el stock dos veces.
+    with transaction.atomic():
+        pendientes = list(
+            Pedido.objects.select_for_update()
+            .filter(pk__in=pedido_ids, stock_liberado=False)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        if not pendientes:
+            return 0
+        Pedido.objects.filter(pk__in=pendientes).update(stock_liberado=True)
+        return _devolver_stock(pendientes)
+
+
+def _bloquear_productos(producto_ids):
+    # Bloqueo en orden de PK, el mismo de reservar_stock. Un UPDATE ... WHERE pk IN (...) bloquea las filas
+    # en el orden en que el motor las recorre, así que sin este paso una devolución y un checkout con
+    # productos en común podían bloquearse en cruz.
+    list(Producto.objects.select_for_update().filter(pk__in=producto_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def _devolver_stock(pedido_ids):
+    devoluciones = dict(
+        ItemPedido.objects.filter(pedido_id__in=pedido_ids)
+        .values('producto_id').order_by('producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+    if not devoluciones:
+        return 0
+    _bloquear_productos(list(devoluciones))
+    return Producto.objects.filter(pk__in=sorted(devoluciones)).update(
+        stock=Case(
+            *[When(pk=producto_id, then=F('stock') + total) for producto_id, total in devoluciones.items()],
+            default=F('stock'),
+            output_field=PositiveIntegerField(),
+        )
+    )
+
+
+def expirar_pedidos(horas=None, batch_size=500):
+    # Marca como expirados los pedidos impagos con más de `horas` y devuelve su stock, por lotes de PKs.
+    # Cada lote bloquea sus pedidos con SKIP LOCKED: un pedido que el webhook o la conciliación están
+    # marcando como pagado (aplicar_estados también lo bloquea) se salta y, si se pagó, ya no califica.
+    # El checkout no compite por estos pedidos y el stock se suma con F(), así que no pisa sus reservas.
+    # Devuelve la cantidad de pedidos expirados.
+    horas = getattr(settings, 'PENDING_ORDER_TTL_HOURS', 24) if horas is None else horas
+    limite = timezone.now() - timedelta(hours=horas)
+    total = 0
+    ultimo_id = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Pedido.objects.select_for_update(skip_locked=True)
+                .filter(pagado=False, expirado=False, creado__lt=limite, pk__gt=ultimo_id)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+            Pedido.objects.filter(pk__in=ids).update(expirado=True)
+            liberar_stock(ids)
+        total += len(ids)
+        ultimo_id = ids[-1]
@@ -0,0 +1,27 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from snake_shop.catalog_cache import tarjeta_producto as _tarjeta_producto
+from snake_shop.images import srcsets
+
+register = template.Library()
+
+@register.simple_tag
+def tarjeta_producto(producto):
+    # Tarjeta del listado servida desde la caché del catálogo
+    return _tarjeta_producto(producto)
+
+@register.simple_tag
+def imagen_responsive(imagen, alt='', sizes='100vw', css_class='', loading='lazy'):
+    # <picture> con srcset AVIF/WebP de los derivados; el original queda como respaldo en <img>
+    if not imagen:
+        return ''
+    fuentes = srcsets(imagen.name)
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((formato, fuentes[formato], sizes) for formato in ('avif', 'webp') if formato in fuentes),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}" loading="{}" decoding="async"></picture>',
+        sources, imagen.url, alt, css_class, loading,
+    )
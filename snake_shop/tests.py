@@ -1,3 +1,422 @@
-from django.test import TestCase
+import io
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cart_store, catalog_cache, flow, models, payments, stock
+from .management.commands.fake_flow_server import FlowFalso, crear_handler
+from .models import (
+    Carrito, Categoria, FolioSequence, LineaCarrito, Pedido, PedidoVendedor, Producto, Transaccion,
+    TransaccionDiaria, VentaDiaria, generar_folio,
+)
+from .pagination import _filtro_despues_de, _partes_orden, paginar_keyset
+from PIL import Image
+
+
+class Deshacer(Exception):
+    pass
+
+
+def crear_producto(categoria, vendedor, nombre, precio='1000', stock=10):
+    return Producto.objects.create(
+        categoria=categoria, vendedor=vendedor, nombre=nombre, slug=nombre.lower().replace(' ', '-'),
+        precio=Decimal(precio), stock=stock,
+    )
+
+
+class CatalogoMixin:
+    def crear_catalogo(self):
+        self.vendedor1 = User.objects.create_user('vendedor1', 'v1@snake.cl', 'clave-segura-1')
+        self.vendedor2 = User.objects.create_user('vendedor2', 'v2@snake.cl', 'clave-segura-2')
+        self.categoria = Categoria.objects.create(nombre='Reptiles', slug='reptiles')
+        self.producto1 = crear_producto(self.categoria, self.vendedor1, 'Terrario', '10000', stock=5)
+        self.producto2 = crear_producto(self.categoria, self.vendedor2, 'Lampara', '2500', stock=5)
+
+
+class FoliosTests(TransactionTestCase):
+    # TransactionTestCase: las reservas fuera de atomic() se confirman de verdad, como en producción
+    def setUp(self):
+        models._reiniciar_folios()
+
+    def tearDown(self):
+        models._reiniciar_folios()
+
+    def test_folios_unicos_tras_rollback_y_reinicio(self):
+        with self.assertRaises(Deshacer):
+            with transaction.atomic():
+                generar_folio('pedido')
+                raise Deshacer()
+        emitidos = [generar_folio('pedido') for _ in range(3)]
+        models._reiniciar_folios()  # reinicio del proceso: se pierde el bloque en memoria
+        emitidos += [generar_folio('pedido') for _ in range(3)]
+        self.assertEqual(len(set(emitidos)), len(emitidos))
+
+    def test_bloque_reservado_en_una_sola_actualizacion(self):
+        generar_folio('ticket', bloque=5)
+        self.assertEqual(FolioSequence.objects.get(tipo='ticket').correlativo, 5)
+        folios = [generar_folio('ticket', bloque=5) for _ in range(4)]
+        self.assertEqual(FolioSequence.objects.get(tipo='ticket').correlativo, 5)
+        self.assertEqual(len(set(folios)), 4)
+
+
+class StockTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def pedido(self):
+        return Pedido.objects.create(email='cliente@snake.cl', total=Decimal('30000'))
+
+    def test_dos_pedidos_no_sobrevenden(self):
+        primero, segundo = self.pedido(), self.pedido()
+        stock.reservar_stock(primero, {self.producto1.pk: (3, Decimal('10000'))})
+        with self.assertRaises(stock.StockInsuficiente) as error:
+            stock.reservar_stock(segundo, {self.producto1.pk: (3, Decimal('10000'))})
+        self.assertEqual(error.exception.faltantes, [('Terrario', 3, 2)])
+        self.producto1.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 2)
+        self.assertFalse(segundo.items.exists())
+
+    def test_reserva_todo_o_nada(self):
+        pedido = self.pedido()
+        with self.assertRaises(stock.StockInsuficiente):
+            stock.reservar_stock(pedido, {
+                self.producto1.pk: (2, Decimal('10000')),
+                self.producto2.pk: (6, Decimal('2500')),
+            })
+        self.assertEqual(
+            dict(Producto.objects.values_list('pk', 'stock')),
+            {self.producto1.pk: 5, self.producto2.pk: 5},
+        )
+        self.assertFalse(pedido.items.exists())
+
+    def test_liberar_stock_es_idempotente(self):
+        pedido = self.pedido()
+        stock.reservar_stock(pedido, {self.producto1.pk: (3, Decimal('10000'))})
+        self.assertEqual(stock.liberar_stock([pedido.pk]), 1)
+        self.assertEqual(stock.liberar_stock([pedido.pk]), 0)
+        self.producto1.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 5)
+
+    def test_expirar_y_eliminar_devuelven_el_stock_una_vez(self):
+        pedido = self.pedido()
+        stock.reservar_stock(pedido, {self.producto1.pk: (3, Decimal('10000'))})
+        self.assertEqual(stock.expirar_pedidos(horas=-1), 1)
+        stock.liberar_stock([pedido.pk])  # como eliminar_pedido sobre un pedido ya expirado
+        self.producto1.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 5)
+
+
+class CrearPedidoTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        for producto, cantidad in ((self.producto1, 2), (self.producto2, 3)):
+            self.client.post(reverse('cart_add', args=[producto.pk]), {'cantidad': cantidad})
+
+    def comprar(self):
+        return self.client.post(reverse('crear_pedido'), {
+            'email': 'invitado@snake.cl', 'direccion': 'Av. Siempre Viva 742', 'ciudad': 'Santiago',
+        })
+
+    def test_escribe_la_parte_de_cada_vendedor(self):
+        cliente_flow = mock.Mock()
+        cliente_flow.crear_pago.return_value = {'url': 'https://flow.test/app/pagar', 'token': 'tok-1', 'flowOrder': 1}
+        with mock.patch.object(flow, 'get_client', return_value=cliente_flow):
+            respuesta = self.comprar()
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(respuesta['Location'], 'https://flow.test/app/pagar?token=tok-1')
+
+        pedido = Pedido.objects.get()
+        partes = dict(PedidoVendedor.objects.filter(pedido=pedido).values_list('vendedor_id', 'subtotal'))
+        self.assertEqual(partes, {self.vendedor1.pk: Decimal('20000'), self.vendedor2.pk: Decimal('7500')})
+        self.assertEqual(
+            dict(Producto.objects.values_list('pk', 'stock')),
+            {self.producto1.pk: 3, self.producto2.pk: 2},
+        )
+        self.assertEqual(Transaccion.objects.get(pedido=pedido).estado, 'pendiente')
+
+    def test_flow_caido_anula_el_pedido_y_devuelve_el_stock(self):
+        cliente_flow = mock.Mock()
+        cliente_flow.crear_pago.side_effect = flow.FlowNoDisponible('sin respuesta')
+        with mock.patch.object(flow, 'get_client', return_value=cliente_flow):
+            respuesta = self.comprar()
+        self.assertRedirects(respuesta, reverse('cart_detail'), fetch_redirect_response=False)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(PedidoVendedor.objects.exists())
+        self.assertEqual(
+            dict(Producto.objects.values_list('pk', 'stock')),
+            {self.producto1.pk: 5, self.producto2.pk: 5},
+        )
+
+    def test_timeout_de_lectura_deja_el_pedido_pendiente(self):
+        # Flow falso lento: recibe y crea el pago, pero responde después del timeout de lectura
+        flow_falso = FlowFalso('dev', 'dev', 'http://127.0.0.1')
+        servidor = ThreadingHTTPServer(('127.0.0.1', 0), crear_handler(flow_falso, 0.5, 0, io.StringIO()))
+        servidor.handle_error = lambda *args: None  # el cliente ya cortó: BrokenPipe esperado
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+        cliente_flow = flow.FlowClient(url_base=f'http://127.0.0.1:{servidor.server_port}/api', api_key='dev')
+        with (
+            override_settings(FLOW_SECRET_KEY='dev'),
+            mock.patch.object(flow, 'READ_TIMEOUT', 0.1),
+            mock.patch.object(flow, 'get_client', return_value=cliente_flow),
+        ):
+            respuesta = self.comprar()
+            time.sleep(0.6)  # el servidor termina de procesar el POST
+
+        self.assertRedirects(respuesta, reverse('cart_detail'), fetch_redirect_response=False)
+        pedido = Pedido.objects.get()
+        self.assertIn(str(pedido.pk), flow_falso.por_orden)
+        self.assertFalse(pedido.pagado)
+        self.assertFalse(Transaccion.objects.exists())
+        # El stock sigue reservado hasta que la conciliación o la expiración lo resuelvan
+        self.assertEqual(
+            dict(Producto.objects.values_list('pk', 'stock')),
+            {self.producto1.pk: 3, self.producto2.pk: 2},
+        )
+
+
+class PagosFlowTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        cache.clear()  # tokens "en resolución" de otros tests
+        self.crear_catalogo()
+        self.pedido = Pedido.objects.create(email='cliente@snake.cl', total=Decimal('20000'))
+        stock.reservar_stock(self.pedido, {self.producto1.pk: (2, Decimal('10000'))})
+        payments.registrar_pago_creado(self.pedido, {'token': 'tok-1', 'flowOrder': 1001}, self.pedido.total)
+
+    def datos_flow(self, status, amount=20000):
+        return {'token': 'tok-1', 'flowOrder': 1001, 'commerceOrder': str(self.pedido.pk), 'status': status, 'amount': amount}
+
+    def notificar(self, cliente_flow, veces=1):
+        # El webhook resuelve en un hilo aparte; acá se resuelve en línea para verlo en la misma transacción
+        with mock.patch.object(flow, 'get_client', return_value=cliente_flow), \
+                mock.patch.object(payments, 'encolar_resolucion', side_effect=payments.resolver_pago):
+            for _ in range(veces):
+                respuesta = self.client.post(reverse('confirmacion_flow'), {'token': 'tok-1'})
+                self.assertEqual(respuesta.status_code, 200)
+
+    def resumen_transacciones(self):
+        return dict(TransaccionDiaria.objects.filter(cantidad__gt=0).values_list('estado', 'cantidad'))
+
+    def test_confirmaciones_repetidas_se_aplican_una_vez(self):
+        cliente_flow = mock.Mock()
+        cliente_flow.estado_pago.return_value = self.datos_flow(flow.ESTADO_PAGADO)
+        self.notificar(cliente_flow, veces=3)
+
+        self.assertEqual(cliente_flow.estado_pago.call_count, 1)
+        self.pedido.refresh_from_db()
+        self.assertTrue(self.pedido.pagado)
+        self.assertTrue(PedidoVendedor.objects.get(pedido=self.pedido).pagado)
+        self.assertEqual(Transaccion.objects.get(pedido=self.pedido).estado, payments.APROBADO)
+        ventas = VentaDiaria.objects.aggregate(pedidos=Sum('pedidos'), unidades=Sum('unidades'), monto=Sum('monto'))
+        self.assertEqual(ventas, {'pedidos': 1, 'unidades': 2, 'monto': Decimal('20000')})
+        self.assertEqual(self.resumen_transacciones(), {payments.APROBADO: 1})
+
+    def test_reaplicar_el_mismo_estado_no_duplica_resumenes(self):
+        for _ in range(2):
+            payments.aplicar_estado('tok-1', self.datos_flow(flow.ESTADO_PAGADO))
+        self.assertEqual(VentaDiaria.objects.aggregate(pedidos=Sum('pedidos'))['pedidos'], 1)
+        self.assertEqual(self.resumen_transacciones(), {payments.APROBADO: 1})
+
+    def test_pendiente_se_vuelve_a_consultar_y_luego_se_rechaza(self):
+        cliente_flow = mock.Mock()
+        cliente_flow.estado_pago.side_effect = [
+            self.datos_flow(flow.ESTADO_PENDIENTE), self.datos_flow(flow.ESTADO_RECHAZADO),
+        ]
+        self.notificar(cliente_flow)
+        self.assertEqual(Transaccion.objects.get(pedido=self.pedido).estado, payments.PENDIENTE)
+        self.notificar(cliente_flow)  # sigue pendiente: la siguiente notificación sí consulta
+
+        self.assertEqual(cliente_flow.estado_pago.call_count, 2)
+        self.pedido.refresh_from_db()
+        self.assertFalse(self.pedido.pagado)
+        self.assertEqual(Transaccion.objects.get(pedido=self.pedido).estado, payments.RECHAZADO)
+        self.assertFalse(VentaDiaria.objects.exists())
+        self.assertEqual(self.resumen_transacciones(), {payments.RECHAZADO: 1})
+
+    def test_monto_distinto_no_marca_pagado(self):
+        with self.assertLogs('snake_shop.payments', 'ERROR'):
+            payments.aplicar_estado('tok-1', self.datos_flow(flow.ESTADO_PAGADO, amount=1))
+        self.pedido.refresh_from_db()
+        self.assertFalse(self.pedido.pagado)
+        self.assertEqual(Transaccion.objects.get(pedido=self.pedido).estado, payments.ERROR)
+
+
+    def test_pago_de_pedido_expirado_vuelve_a_reservar_stock(self):
+        stock.expirar_pedidos(horas=-1)
+        payments.aplicar_estado('tok-1', self.datos_flow(flow.ESTADO_PAGADO))
+
+        self.pedido.refresh_from_db()
+        self.producto1.refresh_from_db()
+        self.assertTrue(self.pedido.pagado)
+        self.assertFalse(self.pedido.expirado)
+        self.assertFalse(self.pedido.stock_liberado)
+        self.assertFalse(self.pedido.revision_stock)
+        self.assertEqual(self.producto1.stock, 3)
+
+    def test_pago_de_pedido_expirado_sin_stock_queda_en_revision(self):
+        stock.expirar_pedidos(horas=-1)
+        Producto.objects.filter(pk=self.producto1.pk).update(stock=1)  # otro cliente compró entretanto
+        with self.assertLogs('snake_shop.payments', 'ERROR'):
+            payments.aplicar_estado('tok-1', self.datos_flow(flow.ESTADO_PAGADO))
+
+        self.pedido.refresh_from_db()
+        self.producto1.refresh_from_db()
+        self.assertTrue(self.pedido.pagado)
+        self.assertTrue(self.pedido.revision_stock)
+        self.assertEqual(self.producto1.stock, 1)
+
+
+class GestionPedidosTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        self.staff = User.objects.create_user('staff', 'staff@snake.cl', 'clave-segura-3', is_staff=True)
+        self.client.force_login(self.staff)
+        self.pedidos = [Pedido.objects.create(email='cliente@snake.cl', total=Decimal('1000')) for _ in range(2)]
+
+    def masivo(self, estado):
+        return self.client.post(reverse('actualizar_pedidos_masivo'), {
+            'pedido_ids': [pedido.pk for pedido in self.pedidos], 'estado_despacho': estado,
+        })
+
+    def test_actualizacion_masiva_usa_los_estados_del_campo(self):
+        self.masivo('retiro')
+        self.assertEqual(set(Pedido.objects.values_list('estado_despacho', flat=True)), {'retiro'})
+        self.masivo('pendiente')  # está en Pedido.ESTADO_CHOICES pero no es un estado de despacho
+        self.assertEqual(set(Pedido.objects.values_list('estado_despacho', flat=True)), {'retiro'})
+
+    def test_filtro_por_estado_de_despacho(self):
+        Pedido.objects.filter(pk=self.pedidos[0].pk).update(estado_despacho='retiro')
+        respuesta = self.client.get(reverse('gestion_pedidos'), {'estado': 'retiro'})
+        self.assertEqual([pedido.pk for pedido in respuesta.context['pedidos']], [self.pedidos[0].pk])
+        self.assertEqual(respuesta.context['filtros']['estado'], 'retiro')
+
+
+@mock.patch.object(cart_store, 'BACKEND', 'db')
+class CarritoBDTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def agregar(self, producto, cantidad=1):
+        return self.client.post(reverse('cart_add', args=[producto.pk]), {'cantidad': cantidad})
+
+    def test_carrito_de_invitado_expirado_se_vuelve_a_crear(self):
+        self.agregar(self.producto1)
+        viejo_id = self.client.session[cart_store.SESION_CARRITO_ID]
+        Carrito.objects.filter(pk=viejo_id).update(actualizado=timezone.now() - timedelta(days=60))
+        self.assertEqual(cart_store.expirar_carritos(dias=30), 1)
+
+        self.agregar(self.producto2, 2)
+        nuevo_id = self.client.session[cart_store.SESION_CARRITO_ID]
+        self.assertNotEqual(nuevo_id, viejo_id)
+        self.assertEqual(
+            list(LineaCarrito.objects.filter(carrito_id=nuevo_id).values_list('producto_id', 'cantidad')),
+            [(self.producto2.pk, 2)],
+        )
+        self.assertEqual(Carrito.objects.get(pk=nuevo_id).cantidad_items, 2)
+
+
+class CatalogCacheTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        self.otra = Categoria.objects.create(nombre='Alimento', slug='alimento')
+
+    def test_cambio_de_categoria_invalida_ambas_sin_releer_el_producto(self):
+        producto = Producto.objects.get(pk=self.producto1.pk)
+        antes = {c: catalog_cache.version_categoria(c) for c in (self.categoria.pk, self.otra.pk)}
+        producto.categoria = self.otra
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as consultas:
+            producto.save()
+        self.assertFalse([q['sql'] for q in consultas if q['sql'].startswith('SELECT')])
+        for categoria_id, version in antes.items():
+            self.assertGreater(catalog_cache.version_categoria(categoria_id), version)
+
+
+class PaginacionKeysetTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        # Muchos empates de precio: el id es el que desempata
+        for i in range(23):
+            crear_producto(self.categoria, self.vendedor1, f'Producto {i}', precio=str(1000 * (i % 3)))
+
+    def recorrer(self, orden, por_pagina):
+        vistos, cursor = [], None
+        while True:
+            pagina = paginar_keyset(Producto.objects.all(), orden, cursor, por_pagina)
+            vistos += [producto.pk for producto in pagina]
+            if not pagina.tiene_siguiente:
+                return vistos
+            cursor = pagina.siguiente_cursor
+
+    def test_sin_huecos_ni_repetidos_con_empates(self):
+        for orden in (
+            ('precio', 'id'), ('-precio', '-id'), ('-precio', 'id'), ('nombre', '-id'), ('-creado', '-id'),
+        ):
+            for por_pagina in (1, 4, 7):
+                with self.subTest(orden=orden, por_pagina=por_pagina):
+                    esperado = list(Producto.objects.order_by(*orden).values_list('pk', flat=True))
+                    self.assertEqual(self.recorrer(orden, por_pagina), esperado)
+
+    def test_mismo_sentido_usa_comparacion_de_filas(self):
+        productos = Producto.objects.all()
+        uniforme = _filtro_despues_de(productos, _partes_orden(('-precio', '-id')), [Decimal('1000'), 5])
+        sql = str(productos.filter(uniforme).query)
+        self.assertIn('("snake_shop_producto"."precio", "snake_shop_producto"."id") < (', sql)
+        mixto = _filtro_despues_de(productos, _partes_orden(('-precio', 'id')), [Decimal('1000'), 5])
+        self.assertNotIn('("snake_shop_producto"."precio", ', str(productos.filter(mixto).query))
+
+
+class GetCondicionalTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def test_primera_revalidacion_responde_304(self):
+        url = reverse('detalle_producto', args=[self.producto1.slug])
+        primera = self.client.get(url)
+        self.assertEqual(primera.status_code, 200)
+        # La segunda visita ya trae la cookie CSRF que creó la primera respuesta
+        segunda = self.client.get(url, headers={'If-None-Match': primera['ETag']})
+        self.assertEqual(segunda.status_code, 304)
+
+
+class ImagenRedimensionadaTests(TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.media = Path(carpeta.name)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        (self.media / 'productos').mkdir()
+        (self.media / 'soporte').mkdir()
+        Image.new('RGB', (400, 200), 'green').save(self.media / 'productos' / 'foto.png')
+        Image.new('RGB', (400, 200), 'red').save(self.media / 'soporte' / 'adjunto.png')
+        (self.media / 'productos' / 'falsa.jpg').write_bytes(b'no es una imagen')
+
+    def pedir(self, ruta):
+        return self.client.get(reverse('imagen_redimensionada', args=[100, 0, ruta]))
+
+    def test_redimensiona_imagen_de_producto(self):
+        respuesta = self.pedir('productos/foto.png')
+        self.assertEqual(respuesta.status_code, 200)
+        with Image.open(self.media / 'r' / '100x0' / 'productos' / 'foto.png') as variante:
+            self.assertEqual(variante.size, (100, 50))
+
+    def test_archivo_que_no_es_imagen_da_404(self):
+        self.assertEqual(self.pedir('productos/falsa.jpg').status_code, 404)
+
+    def test_adjuntos_de_soporte_no_se_sirven(self):
+        self.assertEqual(self.pedir('soporte/adjunto.png').status_code, 404)
+        self.assertEqual(self.pedir('productos/../soporte/adjunto.png').status_code, 404)
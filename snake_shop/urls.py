@@ -8,6 +8,8 @@ urlpatterns = [
     path('tienda/', views.lista_productos, name='lista_productos'),
     path('tienda/categorias/<slug:categoria_slug>/', views.lista_productos, name='lista_productos_por_categoria'),
     path('tienda/productos/<slug:product_slug>/', views.detalle_producto, name='detalle_producto'),
+    # Imágenes redimensionadas bajo demanda (nginx sirve las ya generadas directo desde disco)
+    path('media/r/<int:ancho>x<int:alto>/<path:ruta>', views.imagen_redimensionada, name='imagen_redimensionada'),
 
     # URLs de Autenticación y Perfil
     path('register/', views.register_view, name='register'),
@@ -25,6 +27,7 @@ urlpatterns = [
     path('crear-producto/', views.crear_producto, name='crear_producto'), # Asegúrate que esta línea exista
     path('gestion-pedidos/', views.gestion_pedidos, name='gestion_pedidos'),
     path('gestion-pedidos/<int:pedido_id>/actualizar/', views.actualizar_estado_vendedor, name='actualizar_estado_vendedor'),
+    path('gestion-pedidos/masivo/', views.actualizar_pedidos_masivo, name='actualizar_pedidos_masivo'),
     path('gestion-tickets/', views.gestion_tickets, name='gestion_tickets'),
     path('gestion-tickets/<int:ticket_id>/actualizar/', views.actualizar_ticket, name='actualizar_ticket'),
     path('estadisticas/', views.estadisticas_vendedor, name='estadisticas_vendedor'),
@@ -33,6 +36,10 @@ urlpatterns = [
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:producto_id>/', views.cart_add, name='cart_add'),
     path('cart/remove/<int:producto_id>/', views.cart_remove, name='cart_remove'),
+    path('cart/api/add/<int:producto_id>/', views.cart_api_add, name='cart_api_add'),
+    path('cart/api/update/<int:producto_id>/', views.cart_api_update, name='cart_api_update'),
+    path('cart/api/remove/<int:producto_id>/', views.cart_api_remove, name='cart_api_remove'),
+    path('cart/api/bulk/', views.cart_api_bulk, name='cart_api_bulk'),
     path('checkout/', views.checkout, name='checkout'),
     path('crear_pedido/', views.crear_pedido, name='crear_pedido'),
 
@@ -52,6 +59,7 @@ urlpatterns = [
     
     #login dashboard Crud 26/01/2025
     path('dashboard/', views.dashboard_admin, name='dashboard_admin'),
+    path('dashboard/cache-catalogo/', views.estadisticas_cache_catalogo, name='estadisticas_cache_catalogo'),
     path('dashboard/<str:model_name>/', views.crud_modelo, name='crud_modelo'),
     path('dashboard/<str:model_name>/create/', views.crud_modelo_create, name='crud_create'),
     path('dashboard/<str:model_name>/<int:pk>/update/', views.crud_modelo_update, name='crud_update'),
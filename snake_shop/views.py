@@ -1,91 +1,155 @@
-import hashlib
-import hmac
-import requests
+import json
+import logging
+import mimetypes
 import random
 import uuid
+from datetime import date, timedelta
 from decimal import Decimal
 
 from django.conf import settings
 from django.core.mail import send_mail 
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.http import require_POST
+from django.template.defaultfilters import pluralize
+from django.template.loader import render_to_string
+from django.views.decorators.http import condition, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.urls import reverse
 from django.db import transaction
-from django.http import HttpResponse, JsonResponse
-from django.db.models.functions import TruncDate, TruncMonth
-from django.db.models import Sum, Count, Q
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.db.models import Sum, Count, Q, F, Prefetch
 
 
 # Modelos y Formularios del Proyecto
-from .models import Producto, Categoria, Perfil, Pedido, ItemPedido, TicketComentario, TicketComentarioAdjunto, Transaccion, TicketSoporte 
+from .models import (
+    Producto, Categoria, Perfil, Pedido, ItemPedido, TicketComentario, TicketComentarioAdjunto, Transaccion, TicketSoporte,
+    PedidoVendedor, TransaccionDiaria, VentaDiaria,
+)
 from .forms import CartAddProductForm, PerfilForm, ProductoForm, ContactoTecnicoForm, UserUpdateForm
 from .cart import Cart
+from .cart_store import fusionar_carrito_invitado
+from .search import buscar_parecidos, buscar_productos
+from . import catalog_cache, checkout_quote, dashboard_metrics, flow, payments, resize_cache, rollups, stock
+from .conditional import etag_detalle_producto, etag_lista_productos
+from .catalog_cache import obtener_categorias, obtener_promociones
+from .pagination import CursorInvalido, paginar_keyset
 
 #login dashboard Crud 26/01/2025
 from django.contrib.auth.models import User, Group
 from django.forms import modelform_factory
 from .models import *  # Todos tus models
 
-# FUNCIONES DE UTILIDAD (FLOW API)
-def generar_firma_flow(params):
-    # Genera la firma digital (s) requerida por Flow para asegurar la integridad.
-    keys = sorted(params.keys())
-    string_to_sign = "".join(f"{k}{params[k]}" for k in keys)
-    return hmac.new(
-        settings.FLOW_SECRET_KEY.encode(),
-        string_to_sign.encode(),
-        hashlib.sha256
-    ).hexdigest()
+logger = logging.getLogger(__name__)
 
 # Vistas de Productos y Tienda
 def home(request):
     # 3 productos ALEATORIOS en promoción (o los únicos si hay menos de 3)
-    productos_promocion = Producto.objects.filter(
-        en_promocion=True, 
-        disponible=True
-    ).select_related('categoria')[:3]
+    productos_promocion = obtener_promociones(3)
     
     context = {'productos_promocion': productos_promocion}
     return render(request, 'snake_shop/home.html', context)
     # return render(request, 'snake_shop/home.html')
 
+# Órdenes disponibles en el catálogo. El último campo siempre es único (id) para que el cursor sea estable.
+ORDENES_CATALOGO = {
+    'nombre': ('nombre', 'id'),
+    'precio': ('precio_efectivo', 'id'),
+    '-precio': ('-precio_efectivo', '-id'),
+    'precio_lista': ('precio', 'id'),
+    'nuevos': ('-creado', '-id'),
+    'relevancia': ('-rank', 'id'),  # solo con búsqueda
+}
+ETIQUETAS_ORDEN = {
+    'nombre': 'Nombre (A-Z)',
+    'precio': 'Menor precio',
+    '-precio': 'Mayor precio',
+    'precio_lista': 'Precio de lista',
+    'nuevos': 'Más nuevos',
+    'relevancia': 'Relevancia',
+}
+PRODUCTOS_POR_PAGINA = 24
+
+def producto_a_dict(producto):
+    return {
+        'id': producto.id,
+        'nombre': producto.nombre,
+        'slug': producto.slug,
+        'url': producto.get_absolute_url(),
+        'categoria': producto.categoria.nombre,
+        'precio': str(producto.precio),
+        'precio_promocion': str(producto.precio_promocion) if producto.precio_promocion else None,
+        'en_promocion': producto.en_promocion,
+        'precio_efectivo': str(producto.precio_efectivo),
+        'imagen': producto.imagen.url if producto.imagen else None,
+    }
+
+@condition(etag_func=etag_lista_productos)
 def lista_productos(request, categoria_slug=None):
     categoria = None
-    categorias = Categoria.objects.all()
+    categorias = obtener_categorias()
     # productos = Producto.objects.filter(disponible=True)
     productos = Producto.objects.filter(disponible=True).select_related('categoria')
 
-    # Para la busqueda
+    if categoria_slug:
+        categoria = next((c for c in categorias if c.slug == categoria_slug), None)
+        if categoria is None:
+            raise Http404('Categoría no encontrada')
+        productos = productos.filter(categoria=categoria)
+
+    # Para la busqueda (índice full-text, ordenado por relevancia)
     query = request.GET.get('q', '').strip()
+    catalogo = productos
     if query:
-        productos = productos.filter(
-            Q(nombre__icontains=query) |
-            Q(descripcion__icontains=query)
-        )
+        productos = buscar_productos(productos, query)
 
-    # 3 productos en promoción para carrusel
-    productos_promocion = Producto.objects.filter(
-        en_promocion=True, disponible=True
-    ).select_related('categoria')[:3]
+    # Orden y paginación por cursor (sin OFFSET)
+    orden = request.GET.get('orden') or ('relevancia' if query else 'nombre')
+    if orden not in ORDENES_CATALOGO or (orden == 'relevancia' and not query):
+        orden = 'nombre'
 
-    if categoria_slug:
-        categoria = get_object_or_404(Categoria, slug=categoria_slug)
-        productos = productos.filter(categoria=categoria)
+    def paginar(productos):
+        try:
+            return paginar_keyset(productos, ORDENES_CATALOGO[orden], request.GET.get('cursor'), PRODUCTOS_POR_PAGINA)
+        except CursorInvalido:
+            return paginar_keyset(productos, ORDENES_CATALOGO[orden], None, PRODUCTOS_POR_PAGINA)
+
+    pagina = paginar(productos)
+    if query and not pagina:
+        # Sin coincidencias en el índice: nombres parecidos (errores de tipeo). Una página con cursor
+        # solo existe si la anterior tenía más filas, así que vacía también significa "modo parecidos".
+        parecidos = buscar_parecidos(catalogo, query)
+        if parecidos is not None:
+            pagina = paginar(parecidos)
+
+    # Variante JSON para scroll infinito
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'productos': [producto_a_dict(p) for p in pagina],
+            'siguiente_cursor': pagina.siguiente_cursor,
+            'orden': orden,
+        })
+
+    # 3 productos en promoción para carrusel
+    productos_promocion = obtener_promociones(3)
 
     context = {
         'categoria': categoria,
         'categorias': categorias,
-        'productos': productos,
+        'productos': pagina,
         'productos_promocion': productos_promocion,  # NUEVO
         'query': query,
+        'orden': orden,
+        'ordenes': [(o, ETIQUETAS_ORDEN[o]) for o in ORDENES_CATALOGO if o != 'relevancia' or query],
     }
     return render(request, 'snake_shop/lista_productos.html', context)
 
+@condition(etag_func=etag_detalle_producto)
 def detalle_producto(request, product_slug):
     producto = get_object_or_404(Producto, slug=product_slug, disponible=True)
     cart_product_form = CartAddProductForm()
@@ -94,6 +158,31 @@ def detalle_producto(request, product_slug):
         'cart_product_form': cart_product_form
     })
 
+def imagen_redimensionada(request, ancho, alto, ruta):
+    # /media/r/<ancho>x<alto>/<ruta>: variante de una imagen de MEDIA_ROOT, cacheada en disco.
+    try:
+        resize_cache.validar_dimensiones(ancho, alto)
+        origen = resize_cache.resolver_origen(ruta)
+    except resize_cache.RutaInvalida:
+        raise Http404('Imagen no encontrada')
+
+    # Revalidación: si el cliente ya tiene esta versión no se toca la imagen
+    etag = resize_cache.etag(origen, ancho, alto)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            archivo = resize_cache.obtener_variante(origen, ancho, alto)
+        except TimeoutError:
+            return HttpResponse('Imagen en proceso, intenta nuevamente.', status=503)
+        except resize_cache.ERRORES_IMAGEN:
+            raise Http404('Imagen no encontrada')
+        content_type = mimetypes.guess_type(archivo.name)[0] or 'application/octet-stream'
+        response = FileResponse(open(archivo, 'rb'), content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
 # Vistas de Soporte Técnico (Módulo Institucional)
 def contacto_tecnico_view(request):
     initial_data = {}
@@ -134,6 +223,7 @@ def login_view(request):
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
             user = form.get_user()
+            fusionar_carrito_invitado(request, user)
             login(request, user)
             messages.success(request, f'Bienvenido {user.username}')
             return redirect('lista_productos')
@@ -154,6 +244,7 @@ def register_view(request):
             user = form.save()
             # Evitamos el IntegrityError: UNIQUE constraint
             Perfil.objects.get_or_create(usuario=user) 
+            fusionar_carrito_invitado(request, user)
             login(request, user)
             messages.success(request, '¡Cuenta creada con éxito! Por favor, completa tu email en el perfil.')
             return redirect('profile')
@@ -213,40 +304,6 @@ def crear_producto(request):
         form = ProductoForm()
     return render(request, 'snake_shop/crear_producto.html', {'form': form})
 
-@login_required
-@user_passes_test(es_vendedor, login_url='/login/')
-def gestion_pedidos(request):
-
-    # Muestra los pedidos. Si es staff ve todos, si es vendedor solo los suyos.
-    if request.user.is_staff:
-        pedidos = Pedido.objects.all().order_by('-creado')
-    else:
-        pedidos = Pedido.objects.filter(items__producto__vendedor=request.user).distinct().order_by('-creado')
-    
-    return render(request, 'snake_shop/gestion_pedidos.html', {'pedidos': pedidos})
-
-@login_required
-@user_passes_test(es_vendedor, login_url='/login/')
-@require_POST
-def actualizar_estado_vendedor(request, pedido_id):
-
-    # Permite al vendedor forzar el estado de pago y despacho manualmente.
-    pedido = get_object_or_404(Pedido, id=pedido_id)
-    
-    # Solo staff o el dueño de los productos en el pedido pueden editar
-    nuevo_estado = request.POST.get('estado_despacho')
-    pagado = request.POST.get('pagado') == 'on' 
-
-    if nuevo_estado in dict(Pedido.ESTADOS_DESPACHO):
-        pedido.estado_despacho = nuevo_estado
-        pedido.pagado = pagado
-        pedido.save()
-        messages.success(request, f'Pedido #{pedido.id} actualizado correctamente.')
-    else:
-        messages.error(request, 'Estado de despacho no válido.')
-        
-    return redirect('gestion_pedidos')
-
 # Vistas de Carrito y Checkout
 @require_POST
 def cart_add(request, producto_id):
@@ -266,10 +323,118 @@ def cart_remove(request, producto_id):
     return redirect('cart_detail')
 
 def cart_detail(request):
+    # El formulario de cantidad de cada línea se escribe directo en cart_linea.html (sin un Form por item)
     cart = Cart(request)
+    return render(request, 'snake_shop/cart_detail.html', {
+        'cart': cart,
+        'envio': checkout_quote.calcular_envio(request),
+    })
+
+# API JSON del carrito (la usa static/js/cart_api.js; los formularios de arriba quedan como respaldo sin JS)
+# Todas las respuestas traen las líneas modificadas, subtotal, envío y cart_count.
+# Con fragmentos=1 se agrega el HTML de las filas modificadas para reemplazarlas en la tabla.
+def _validar_cantidad(producto, valor, minimo=0):
+    try:
+        cantidad = int(valor)
+    except (TypeError, ValueError):
+        return None, 'Cantidad inválida.'
+    if cantidad < minimo:
+        return None, 'Cantidad inválida.'
+    if cantidad > producto.stock:
+        return None, f'Solo quedan {producto.stock} unidades de este producto en stock.'
+    return cantidad, None
+
+def _respuesta_carrito(request, cart, modificados=(), errores=None, status=200):
+    modificados = {str(producto_id) for producto_id in modificados}
+    fragmentos = request.GET.get('fragmentos') == '1' or request.POST.get('fragmentos') == '1'
+    lineas, html = {}, {}
     for item in cart:
-        item['update_cantidad_form'] = CartAddProductForm(initial={'cantidad': item['cantidad'], 'override': True})
-    return render(request, 'snake_shop/cart_detail.html', {'cart': cart})
+        producto_id = str(item.producto.id)
+        if producto_id not in modificados:
+            continue
+        lineas[producto_id] = {
+            'cantidad': item.cantidad,
+            'precio': item.precio,
+            'total_precio': item.total_precio,
+        }
+        if fragmentos:
+            html[producto_id] = render_to_string('snake_shop/cart_linea.html', {'item': item}, request=request)
+    envio = checkout_quote.calcular_envio(request)
+    subtotal = cart.get_total_precio()
+    datos = {
+        'ok': not errores,
+        'lineas': lineas,
+        # Modificados que ya no están en el carrito: el cliente borra esas filas
+        'eliminados': sorted(modificados - set(lineas), key=int),
+        'subtotal': subtotal,
+        'envio': envio,
+        'total': subtotal + envio,
+        'cart_count': len(cart),
+        'errores': errores or {},
+    }
+    if fragmentos:
+        datos['html'] = html
+    return JsonResponse(datos, status=status)
+
+@require_POST
+def cart_api_add(request, producto_id):
+    cart = Cart(request)
+    producto = get_object_or_404(Producto, id=producto_id, disponible=True)
+    actual = cart.cart.get(str(producto.id), {}).get('cantidad') or 0
+    cantidad, error = _validar_cantidad(producto, request.POST.get('cantidad', 1), minimo=1)
+    if error is None and actual + cantidad > producto.stock:
+        error = f'Solo quedan {producto.stock} unidades de este producto en stock.'
+    if error:
+        return _respuesta_carrito(request, cart, errores={str(producto.id): error}, status=400)
+    cart.add(producto=producto, cantidad=cantidad)
+    return _respuesta_carrito(request, cart, modificados=[producto.id])
+
+@require_POST
+def cart_api_update(request, producto_id):
+    # Fija la cantidad de una línea; 0 la elimina
+    cart = Cart(request)
+    producto = get_object_or_404(Producto, id=producto_id)
+    cantidad, error = _validar_cantidad(producto, request.POST.get('cantidad'))
+    if error:
+        return _respuesta_carrito(request, cart, errores={str(producto.id): error}, status=400)
+    if cantidad:
+        cart.add(producto=producto, cantidad=cantidad, override_cantidad=True)
+    else:
+        cart.remove(producto)
+    return _respuesta_carrito(request, cart, modificados=[producto.id])
+
+@require_POST
+def cart_api_remove(request, producto_id):
+    cart = Cart(request)
+    producto = get_object_or_404(Producto, id=producto_id)
+    cart.remove(producto)
+    return _respuesta_carrito(request, cart, modificados=[producto.id])
+
+@require_POST
+def cart_api_bulk(request):
+    # Body JSON: {"lineas": [{"producto_id": 1, "cantidad": 3}, ...]} (cantidad 0 = eliminar).
+    # Los productos se cargan con una sola consulta; las líneas válidas se aplican aunque otras fallen.
+    try:
+        lineas = json.loads(request.body or b'{}').get('lineas')
+        cambios = {int(linea['producto_id']): linea.get('cantidad') for linea in lineas}
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'ok': False, 'errores': {'__all__': 'Formato inválido.'}}, status=400)
+    cart = Cart(request)
+    productos = Producto.objects.in_bulk(list(cambios))
+    errores = {}
+    for producto_id, valor in cambios.items():
+        producto = productos.get(producto_id)
+        if producto is None:
+            errores[str(producto_id)] = 'Producto no encontrado.'
+            continue
+        cantidad, error = _validar_cantidad(producto, valor)
+        if error:
+            errores[str(producto_id)] = error
+        elif cantidad:
+            cart.add(producto=producto, cantidad=cantidad, override_cantidad=True)
+        else:
+            cart.remove(producto)
+    return _respuesta_carrito(request, cart, modificados=cambios, errores=errores)
 
 # @login_required esto es para habilitar el usuario invitado
 def checkout(request):
@@ -277,8 +442,9 @@ def checkout(request):
     if not cart: 
         return redirect('lista_productos')
     
-    # Llamamos a la función de cálculo
-    sub, env, desc, total = obtener_totales_finales(request, cart)
+    # Cotización firmada en la sesión: crear_pedido cobra estos mismos montos si siguen vigentes
+    cotizacion = checkout_quote.cotizar(request, cart)
+    sub, env, desc, total = checkout_quote.montos(cotizacion)
     
     return render(request, 'snake_shop/checkout.html', {
         'cart': cart,
@@ -290,19 +456,8 @@ def checkout(request):
 
 def obtener_totales_finales(request, cart):
 
-    # Calcula montos exactos para evitar discrepancias con Flow.
-    subtotal = cart.get_total_precio()
-    tipo_envio = request.session.get("tipo_envio", "despacho")
-    envio = 3990 if tipo_envio == "despacho" else 0
-    # envio = 3990
-    descuento = 0
-    
-    # Aplicar 15% de descuento solo si es usuario administrativo (staff)
-    if request.user.is_staff:
-        descuento = int(subtotal * 0.15)
-    
-    total_final = (subtotal + envio) - descuento
-    return subtotal, envio, descuento, total_final
+    # Calcula montos exactos para evitar discrepancias con Flow (mismo cálculo que la cotización).
+    return checkout_quote.montos(checkout_quote.calcular(request, cart))
 
 # INTEGRACIÓN DE PAGOS FLOW (RF-06, RF-07, RF-08)
 # @login_required, tambien debe ser para invitados
@@ -348,27 +503,21 @@ def crear_pedido(request):
     # tipo_envio = request.POST.get('tipo_envio', 'despacho')
     tipo_envio = request.session.get("tipo_envio", "despacho")
     if tipo_envio == 'retiro':
-        costo_envio = 0
         direccion = None
         ciudad = None
         codigo_postal = None
     else:
-        costo_envio = 3990
         direccion = request.POST.get('direccion')
         ciudad = request.POST.get('ciudad')
         codigo_postal = request.POST.get('codigo_postal') or None
 
-    # 2. CREACIÓN DEL PEDIDO
+    # Montos: los de la cotización mostrada en checkout si sigue vigente; si no, se recalculan
+    cotizacion = checkout_quote.obtener_cotizacion(request, cart)
+    subtotal, costo_envio, descuento, total = checkout_quote.montos(cotizacion)
+
+    # 2. CREACIÓN DEL PEDIDO (se confirma antes de hablar con Flow: no se mantienen bloqueos durante la llamada)
     try:
         with transaction.atomic():
-            subtotal = cart.get_total_precio()
-            # costo_envio = 3990
-            descuento = 0
-
-            if usuario and usuario.is_staff:
-                descuento = int(subtotal * 0.15)
-
-            total = subtotal + costo_envio - descuento
 
             pedido = Pedido.objects.create(
                 usuario=usuario,
@@ -383,80 +532,66 @@ def crear_pedido(request):
                 total=total
             )
 
-            # 3. ITEMS + STOCK
-            for item in cart:
-                producto = item['producto']
-
-                if producto.stock < item['cantidad']:
-                    raise ValueError(f"Stock insuficiente para {producto.nombre}")
-
-                ItemPedido.objects.create(
-                    pedido=pedido,
-                    producto=producto,
-                    precio=item['precio'],
-                    cantidad=item['cantidad']
-                )
-
-                producto.stock -= item['cantidad']
-                producto.save()
-
-            # 4. FLOW
-            url_api = f"{settings.FLOW_URL_BASE}/payment/create"
-
-            params = {
-                "apiKey": settings.FLOW_API_KEY,
-                "commerceOrder": str(pedido.id),
-                "subject": f"Compra Snake Shop - Pedido #{pedido.id}",
-                "currency": "CLP",
-                "amount": int(total),
-                "email": email,
-                "urlReturn": request.build_absolute_uri(
-                    reverse('order_complete', args=[pedido.id])
-                ),
-                "urlConfirmation": request.build_absolute_uri(
-                    reverse('confirmacion_flow')
-                ),
-            }
-
-            params["s"] = generar_firma_flow(params)
-            response = requests.post(url_api, data=params)
-            data = response.json()
-
-            if response.status_code == 200 and 'url' in data:
-                request.session['pedido_id'] = pedido.id
-                cart.clear()
-                return redirect(f"{data['url']}?token={data['token']}")
-
-            raise Exception(data.get('message', 'Error desconocido en Flow'))
+            # 3. ITEMS + STOCK: bloqueo de los productos en orden, un UPDATE condicional y bulk_create
+            stock.reservar_stock(pedido, {
+                producto_id: (cantidad, Decimal(precio))
+                for producto_id, (cantidad, precio) in cotizacion['lineas'].items()
+            })
 
+    except stock.StockInsuficiente as e:
+        for nombre, cantidad, disponible in e.faltantes:
+            messages.error(request, f"Stock insuficiente para {nombre}: pediste {cantidad}, quedan {disponible}.")
+        return redirect('cart_detail')
     except Exception as e:
+        messages.error(request, f"Error al procesar el pedido: {e}")
+        return redirect('cart_detail')
+
+    # 4. FLOW (fuera de la transacción, con timeouts, reintentos y circuit breaker)
+    try:
+        data = flow.get_client().crear_pago(
+            commerce_order=pedido.id,
+            subject=f"Compra Snake Shop - Pedido #{pedido.id}",
+            amount=total,
+            email=email,
+            url_return=request.build_absolute_uri(reverse('order_complete', args=[pedido.id])),
+            url_confirmation=request.build_absolute_uri(reverse('confirmacion_flow')),
+        )
+    except flow.FlowError as e:
+        if e.incierto:
+            # El POST pudo llegar a Flow (timeout de lectura, 5xx): el pago quizás existe y el cliente podría
+            # pagarlo. El pedido queda pendiente y sin link; reconcile_payments o expirar_pedidos lo resuelven.
+            logger.warning("crear_pago sin respuesta para el pedido %s, queda pendiente: %s", pedido.id, e)
+            messages.error(
+                request,
+                f"No pudimos confirmar el pago del pedido #{pedido.id} con Flow. "
+                "Si se realizó lo veremos en unos minutos; si no, el pedido se anulará solo.",
+            )
+            return redirect('cart_detail')
+        # La petición no llegó a Flow o fue rechazada: se anula el pedido y se devuelve el stock
+        with transaction.atomic():
+            stock.liberar_stock([pedido.id])
+            pedido.delete()
         messages.error(request, f"Error al procesar el pago: {e}")
         return redirect('cart_detail')
 
+    payments.registrar_pago_creado(pedido, data, total)
+    request.session['pedido_id'] = pedido.id
+    cart.clear()
+    checkout_quote.descartar(request)
+    return redirect(f"{data['url']}?token={data['token']}")
+
 @csrf_exempt
 @require_POST
 def confirmacion_flow(request):
 
     # Webhook: Recibe la confirmación asíncrona de Flow.
+    # Responde 200 de inmediato; el estado se consulta a Flow en segundo plano (ver payments.py).
     token = request.POST.get('token')
-    url_status = f"{settings.FLOW_URL_BASE}/payment/getStatus"
-    params = {"apiKey": settings.FLOW_API_KEY, "token": token}
-    params["s"] = generar_firma_flow(params)
-    
-    response = requests.get(url_status, params=params)
-    data = response.json()
-    
-    if data.get('status') == 2: # 2 = Pagado
-        pedido = Pedido.objects.get(id=data.get('commerceOrder'))
-        if not pedido.pagado:
-            pedido.pagado = True
-            pedido.save()
-            Transaccion.objects.create(
-                pedido=pedido, 
-                id_transaccion=token,
-                monto=data.get('amount'), 
-                estado='aprobado'
-            )
+    if not token:
+        return HttpResponse(status=400)
+    payload = request.POST.dict()
+    if payments.registrar_notificacion(token, payload):
+        payments.encolar_resolucion(token, payload)
     return HttpResponse(status=200)
 
 @csrf_exempt
@@ -475,14 +610,39 @@ def pago_fallido(request):
     return redirect('cart_detail')
 
 # Vistas de Cliente (Historial)
+ORDEN_PEDIDOS = ('-creado', '-id')
+PEDIDOS_POR_PAGINA = 20
+
 @login_required
 def mis_pedidos_view(request):
-    pedidos = Pedido.objects.filter(usuario=request.user).order_by('-creado')
-    return render(request, 'snake_shop/mis_pedidos.html', {'pedidos': pedidos})
+    # Historial paginado por cursor (índice pedido_usuario_creado_idx). Conteo y total de ítems se
+    # calculan en SQL y los ítems de la página llegan en una consulta más: costo fijo por página.
+    pedidos = (
+        Pedido.objects.filter(usuario=request.user)
+        .annotate(
+            cantidad_items=Coalesce(Sum('items__cantidad'), 0),
+            total_items=Sum(F('items__precio') * F('items__cantidad')),
+        )
+        .prefetch_related(Prefetch('items', queryset=ItemPedido.objects.select_related('producto').only(
+            'id', 'pedido_id', 'cantidad', 'precio', 'producto__id', 'producto__nombre',
+        )))
+    )
+    try:
+        pagina = paginar_keyset(pedidos, ORDEN_PEDIDOS, request.GET.get('cursor'), PEDIDOS_POR_PAGINA)
+    except CursorInvalido:
+        pagina = paginar_keyset(pedidos, ORDEN_PEDIDOS, None, PEDIDOS_POR_PAGINA)
+    return render(request, 'snake_shop/mis_pedidos.html', {'pedidos': pagina})
 
 @login_required
 def detalle_pedido_view(request, pedido_id):
-    pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
+    pedido = get_object_or_404(
+        Pedido.objects.prefetch_related(
+            Prefetch('items', queryset=ItemPedido.objects.select_related('producto').only(
+                'id', 'pedido_id', 'cantidad', 'precio', 'producto__id', 'producto__nombre',
+            ))
+        ),
+        id=pedido_id, usuario=request.user,
+    )
     return render(request, 'snake_shop/detalle_pedido.html', {
         'pedido': pedido, 
         'items': pedido.items.all()
@@ -493,15 +653,18 @@ def detalle_pedido_view(request, pedido_id):
 def eliminar_pedido(request, pedido_id):
 
     # Permite al usuario eliminar un pedido solo si NO ha sido pagado.
-    pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
-    
-    if not pedido.pagado:
-        # Devolvemos el stock al inventario antes de borrar
-        for item in pedido.items.all():
-            item.producto.stock += item.cantidad
-            item.producto.save()
-            
-        pedido.delete()
+    with transaction.atomic():
+        # Bloqueado: ni un pago ni el barrido de expirados pueden colarse entre la revisión y el borrado
+        pedido = get_object_or_404(Pedido.objects.select_for_update(), id=pedido_id, usuario=request.user)
+        eliminado = not pedido.pagado
+        if eliminado:
+            # Devolvemos el stock al inventario antes de borrar (si expiró ya se devolvió: liberar_stock no lo repite)
+            stock.liberar_stock([pedido.id])
+            # Sus transacciones (pendientes) se borran en cascada: se descuentan del resumen diario
+            rollups.sumar_transacciones(Transaccion.objects.filter(pedido=pedido), -1)
+            pedido.delete()
+
+    if eliminado:
         messages.success(request, f'Pedido #{pedido_id} eliminado correctamente.')
     else:
         messages.error(request, 'No puedes eliminar un pedido que ya ha sido pagado.')
@@ -528,45 +691,109 @@ def crear_producto(request):
         form = ProductoForm()
     return render(request, 'snake_shop/crear_producto.html', {'form': form})
 
+ORDEN_GESTION = ('-creado', '-id')
+# Vendedores: orden por la copia de `creado` en PedidoVendedor (índice vendedor, -creado)
+ORDEN_GESTION_VENDEDOR = ('-creado_vendedor', '-id')
+PEDIDOS_GESTION_POR_PAGINA = 25
+# Valores válidos de estado_despacho (los del campo; Pedido.ESTADO_CHOICES es otra lista)
+ESTADOS_DESPACHO = Pedido._meta.get_field('estado_despacho').choices
+
+def _pedidos_gestionables(user):
+    # Staff: todos los pedidos. Vendedor: solo los que tienen productos suyos.
+    if user.is_staff:
+        return Pedido.objects.all()
+    return Pedido.objects.filter(vendedores__vendedor=user)
+
+def _filtrar_pedidos(pedidos, params):
+    # Filtros de gestion_pedidos: ?pagado=si|no&estado=<estado_despacho>&desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    filtros = {'pagado': params.get('pagado', ''), 'estado': params.get('estado', ''), 'desde': '', 'hasta': ''}
+    if filtros['pagado'] in ('si', 'no'):
+        pedidos = pedidos.filter(pagado=filtros['pagado'] == 'si')
+    if filtros['estado'] in dict(ESTADOS_DESPACHO):
+        pedidos = pedidos.filter(estado_despacho=filtros['estado'])
+    for clave, lookup in (('desde', 'creado__date__gte'), ('hasta', 'creado__date__lte')):
+        try:
+            fecha = date.fromisoformat(params.get(clave, ''))
+        except ValueError:
+            continue
+        pedidos = pedidos.filter(**{lookup: fecha})
+        filtros[clave] = fecha.isoformat()
+    return pedidos, filtros
+
 @login_required
 @user_passes_test(es_vendedor, login_url='/login/')
 def gestion_pedidos(request):
+    # Página por cursor con filtros: una consulta de pedidos (cliente con select_related) por página
+    pedidos, filtros = _filtrar_pedidos(_pedidos_gestionables(request.user), request.GET)
+    pedidos = pedidos.select_related('usuario')
     if request.user.is_staff:
-        pedidos = Pedido.objects.all().order_by('-creado')
+        orden = ORDEN_GESTION
     else:
-        pedidos = Pedido.objects.filter(items__producto__vendedor=request.user).distinct().order_by('-creado')
-    return render(request, 'snake_shop/gestion_pedidos.html', {'pedidos': pedidos})
+        # Con su parte de cada pedido, desde PedidoVendedor (sin DISTINCT: una fila por pedido y vendedor)
+        orden = ORDEN_GESTION_VENDEDOR
+        pedidos = pedidos.annotate(
+            creado_vendedor=F('vendedores__creado'),
+            subtotal_vendedor=F('vendedores__subtotal'),
+            items_vendedor=F('vendedores__cantidad_items'),
+        )
+    try:
+        pagina = paginar_keyset(pedidos, orden, request.GET.get('cursor'), PEDIDOS_GESTION_POR_PAGINA)
+    except CursorInvalido:
+        pagina = paginar_keyset(pedidos, orden, None, PEDIDOS_GESTION_POR_PAGINA)
+
+    consulta = request.GET.copy()
+    consulta.pop('cursor', None)
+    return render(request, 'snake_shop/gestion_pedidos.html', {
+        'pedidos': pagina,
+        'filtros': filtros,
+        'consulta': consulta.urlencode(),
+        'estados': ESTADOS_DESPACHO,
+    })
+
+def _volver_a_gestion(request):
+    # Vuelve a la lista con los mismos filtros (solo se agrega la query string a una URL fija)
+    consulta = request.POST.get('consulta', '')
+    return redirect(f"{reverse('gestion_pedidos')}?{consulta}" if consulta else 'gestion_pedidos')
 
 @login_required
 @user_passes_test(es_vendedor, login_url='/login/')
 @require_POST
 def actualizar_estado_vendedor(request, pedido_id):
-    pedido = get_object_or_404(Pedido, id=pedido_id)
     nuevo_estado = request.POST.get('estado_despacho')
     pagado = request.POST.get('pagado') == 'on' 
 
-    if nuevo_estado in dict(Pedido.ESTADO_CHOICES):
-        pedido.estado_despacho = nuevo_estado
-        pedido.pagado = pagado
-        pedido.save()
-
-        # LOGICA PARA REFLEJAR EN EL PANEL DE TRANSACCIONES
-        if pedido.pagado:
-            # Creamos o actualizamos la transacción para que aparezca en el admin
-            Transaccion.objects.get_or_create(
-                pedido=pedido,
-                defaults={
-                    'monto': pedido.get_total_cost(), # O el campo de total que uses
-                    'estado': 'aprobado'
-                }
-            )
+    if nuevo_estado in dict(ESTADOS_DESPACHO):
+        pedidos = _pedidos_gestionables(request.user).filter(pk=pedido_id)
+        if payments.actualizar_pedidos(pedidos, estado_despacho=nuevo_estado, pagado=pagado):
+            messages.success(request, f'Pedido #{pedido_id} actualizado correctamente.')
         else:
-            # Si el vendedor quita el pago, opcionalmente eliminamos o marcamos la transacción
-            Transaccion.objects.filter(pedido=pedido).delete()
-
-        messages.success(request, f'Pedido #{pedido.id} actualizado correctamente.')
+            raise Http404('Pedido no encontrado')
+    else:
+        messages.error(request, 'Estado de despacho no válido.')
     
-    return redirect('gestion_pedidos')
+    return _volver_a_gestion(request)
+
+@login_required
+@user_passes_test(es_vendedor, login_url='/login/')
+@require_POST
+def actualizar_pedidos_masivo(request):
+    # Acción masiva: mismo estado de despacho y/o de pago para todos los pedidos marcados
+    ids = [int(pk) for pk in request.POST.getlist('pedido_ids') if pk.isdigit()]
+    nuevo_estado = request.POST.get('estado_despacho') or None
+    pago = request.POST.get('pago')
+    pagado = {'pagado': True, 'pendiente': False}.get(pago)
+
+    if not ids:
+        messages.error(request, 'Selecciona al menos un pedido.')
+    elif nuevo_estado is not None and nuevo_estado not in dict(ESTADOS_DESPACHO):
+        messages.error(request, 'Estado de despacho no válido.')
+    elif nuevo_estado is None and pagado is None:
+        messages.error(request, 'Elige un estado de despacho o de pago para aplicar.')
+    else:
+        pedidos = _pedidos_gestionables(request.user).filter(pk__in=ids)
+        actualizados = payments.actualizar_pedidos(pedidos, estado_despacho=nuevo_estado, pagado=pagado)
+        messages.success(request, f'{actualizados} pedido{pluralize(actualizados)} actualizado{pluralize(actualizados)}.')
+    return _volver_a_gestion(request)
 
 # gestión de tickets de soporte técnico
 @login_required
@@ -596,35 +823,122 @@ def actualizar_ticket(request, ticket_id):
     return redirect('gestion_tickets')
 
 # Reporte de ventas por vendedor
+DIAS_SERIE = 30
+MESES_SERIE = 12
+
 @login_required
 @user_passes_test(es_vendedor)
 def estadisticas_vendedor(request):
+    # Todo sale de los resúmenes diarios (rollups.py) y de PedidoVendedor: el costo no crece con el
+    # historial de pedidos. El staff ve la tienda completa; un vendedor, solo lo suyo.
+    if request.user.is_staff:
+        context = _estadisticas_tienda()
+    else:
+        context = _estadisticas_vendedor(request.user)
+
+    # Series: últimos DIAS_SERIE días y MESES_SERIE meses (días/meses sin ventas en 0)
+    serie = context.pop('serie')
+    hoy = timezone.localdate()
+    desde_dia = hoy - timedelta(days=DIAS_SERIE - 1)
+    por_dia = {
+        fila['fecha']: fila
+        for fila in serie.filter(fecha__gte=desde_dia).values('fecha')
+        .annotate(total_cantidad=Sum('cantidad'), total_monto=Sum('monto'))
+    }
+    context['serie_diaria'] = _serie([
+        (dia, por_dia.get(dia, {}).get('total_cantidad', 0), por_dia.get(dia, {}).get('total_monto', 0))
+        for dia in (desde_dia + timedelta(days=n) for n in range(DIAS_SERIE))
+    ])
+
+    meses = [_restar_meses(hoy.replace(day=1), n) for n in range(MESES_SERIE - 1, -1, -1)]
+    por_mes = {
+        fila['mes']: fila
+        for fila in serie.filter(fecha__gte=meses[0])
+        .annotate(mes=TruncMonth('fecha')).values('mes')
+        .annotate(total_cantidad=Sum('cantidad'), total_monto=Sum('monto'))
+    }
+    context['serie_mensual'] = _serie([
+        (mes, por_mes.get(mes, {}).get('total_cantidad', 0), por_mes.get(mes, {}).get('total_monto', 0))
+        for mes in meses
+    ])
+    return render(request, 'snake_shop/estadisticas.html', context)
+
+def _estadisticas_tienda():
+    aprobadas = TransaccionDiaria.objects.filter(estado='aprobado')
+    metricas = dashboard_metrics.obtener()
+
     # 1. Ventas totales y Ticket Promedio
-    total_recaudado = Transaccion.objects.filter(estado='aprobado').aggregate(Sum('monto'))['monto__sum'] or 0
-    cantidad_pagados = Transaccion.objects.filter(estado='aprobado').count()
-    ticket_promedio = total_recaudado / cantidad_pagados if cantidad_pagados > 0 else 0
+    totales = aprobadas.aggregate(monto=Sum('monto'), cantidad=Sum('cantidad'))
+    total_recaudado = totales['monto'] or 0
+    cantidad_pagados = totales['cantidad'] or 0
     
     # 2. Top 3 Productos 
-    productos_top = Pedido.objects.filter(pagado=True) \
-        .values('items__producto__nombre') \
-        .annotate(total_vendido=Sum('items__cantidad')) \
+    productos_top = VentaDiaria.objects.values('producto_id', 'producto__nombre') \
+        .annotate(total_vendido=Sum('unidades')) \
+        .filter(total_vendido__gt=0) \
         .order_by('-total_vendido')[:3]
 
-    # 3. DEFINICIÓN DE VARIABLES FALTANTES 
-    resumen_transacciones = Transaccion.objects.values('estado').annotate(cantidad=Count('id'))
-    pedidos_pendientes = Pedido.objects.filter(estado_despacho='pendiente').count()
-    total_pedidos = Pedido.objects.count()
+    # 3. Transacciones por estado y pedidos
+    resumen_transacciones = TransaccionDiaria.objects.values('estado') \
+        .annotate(cantidad=Sum('cantidad')).filter(cantidad__gt=0).order_by('estado')
+    return {
+        'total_recaudado': total_recaudado,
+        'ticket_promedio': total_recaudado / cantidad_pagados if cantidad_pagados > 0 else 0,
+        'productos_top': productos_top,
+        'resumen_transacciones': resumen_transacciones,
+        # Contadores cacheados del dashboard: el costo no crece con el historial de pedidos
+        'pedidos_pendientes': metricas['por_despachar'],
+        'total_pedidos': metricas['pedidos'],
+        'serie': aprobadas,
+        'unidad_serie': 'ventas',
+    }
 
-    # 4. Diccionario de contexto corregido
-    context = {
+def _estadisticas_vendedor(vendedor):
+    ventas = VentaDiaria.objects.filter(vendedor=vendedor)
+
+    # 1. Lo recaudado por sus productos y su ticket promedio por pedido pagado
+    total_recaudado = ventas.aggregate(monto=Sum('monto'))['monto'] or 0
+    suyos = PedidoVendedor.objects.filter(vendedor=vendedor)
+    conteo = suyos.aggregate(
+        total=Count('id'),
+        pagados=Count('id', filter=Q(pagado=True)),
+        pendientes_envio=Count('id', filter=Q(pagado=True, pedido__estado_despacho=dashboard_metrics.POR_DESPACHAR)),
+    )
+
+    # 2. Top 3 de sus productos
+    productos_top = ventas.values('producto_id', 'producto__nombre') \
+        .annotate(total_vendido=Sum('unidades')) \
+        .filter(total_vendido__gt=0) \
+        .order_by('-total_vendido')[:3]
+
+    # 3. Sus pedidos pagados / pendientes (las transacciones son de la tienda, no por vendedor)
+    resumen_transacciones = [
+        {'estado': 'aprobado', 'cantidad': conteo['pagados']},
+        {'estado': 'pendiente', 'cantidad': conteo['total'] - conteo['pagados']},
+    ]
+    return {
         'total_recaudado': total_recaudado,
-        'ticket_promedio': ticket_promedio,
+        'ticket_promedio': total_recaudado / conteo['pagados'] if conteo['pagados'] > 0 else 0,
         'productos_top': productos_top,
         'resumen_transacciones': resumen_transacciones,
-        'pedidos_pendientes': pedidos_pendientes,
-        'total_pedidos': total_pedidos,
+        'pedidos_pendientes': conteo['pendientes_envio'],
+        'total_pedidos': conteo['total'],
+        # En la serie del vendedor la cantidad son unidades vendidas
+        'serie': ventas.annotate(cantidad=F('unidades')),
+        'unidad_serie': 'unidades',
     }
-    return render(request, 'snake_shop/estadisticas.html', context)
+
+def _restar_meses(fecha, meses):
+    total = fecha.year * 12 + fecha.month - 1 - meses
+    return fecha.replace(year=total // 12, month=total % 12 + 1)
+
+def _serie(puntos):
+    # [(fecha, cantidad, monto)] -> dicts con el % respecto del máximo (alto de la barra en la plantilla)
+    maximo = max((monto for _, _, monto in puntos), default=0) or 1
+    return [
+        {'fecha': fecha, 'cantidad': cantidad, 'monto': monto, 'porcentaje': int(monto * 100 / maximo)}
+        for fecha, cantidad, monto in puntos
+    ]
 
 @require_POST
 def seleccionar_envio(request):
@@ -705,36 +1019,56 @@ def es_admin(user):
 @login_required
 @user_passes_test(es_admin)
 def dashboard_admin(request):
+    # Contadores en una consulta y cacheados unos segundos (ver snake_shop/dashboard_metrics.py)
+    metricas = dashboard_metrics.obtener()
+    aproximados = set(metricas['aproximados'])
+
+    def seccion(name, url, icon, contador=None):
+        return {
+            'name': name, 'url': url, 'icon': icon,
+            'count': metricas[contador] if contador else None,
+            'aproximado': contador in aproximados,
+        }
+
     # Secciones para admin
     context = {
         'secciones_crud': [
-            {'name': 'Adm Prod Rapido', 'url': 'producto', 'icon': 'bi-box', 'count': Producto.objects.count()},
-            {'name': 'Categorías', 'url': 'categoria', 'icon': 'bi-tags', 'count': Categoria.objects.count()},
-            {'name': 'Pedidos', 'url': 'pedido', 'icon': 'bi-cart', 'count': Pedido.objects.count()},
-            {'name': 'Usuarios', 'url': 'user', 'icon': 'bi-people', 'count': User.objects.count()},
-            {'name': 'Grupos', 'url': 'group', 'icon': 'bi-diagram-3', 'count': Group.objects.count()},
+            seccion('Adm Prod Rapido', 'producto', 'bi-box', 'productos'),
+            seccion('Categorías', 'categoria', 'bi-tags', 'categorias'),
+            seccion('Pedidos', 'pedido', 'bi-cart', 'pedidos'),
+            seccion('Usuarios', 'user', 'bi-people', 'usuarios'),
+            seccion('Grupos', 'group', 'bi-diagram-3', 'grupos'),
         ],
         # Operaciones / Ventas
         'secciones_ventas': [
-            {'name': 'Estadísticas de Ventas', 'url': 'estadisticas_vendedor', 'icon': 'bi-graph-up-arrow', 'count': None},
-            {'name': 'Tickets de Soporte', 'url': 'gestion_tickets', 'icon': 'bi-headset', 'count': TicketSoporte.objects.count()},
-            {'name': 'Gestión de Pedidos', 'url': 'gestion_pedidos', 'icon': 'bi-cart-check', 'count': Pedido.objects.count()},
+            seccion('Estadísticas de Ventas', 'estadisticas_vendedor', 'bi-graph-up-arrow'),
+            seccion('Tickets de Soporte', 'gestion_tickets', 'bi-headset', 'tickets'),
+            seccion('Gestión de Pedidos', 'gestion_pedidos', 'bi-cart-check', 'pedidos'),
         ],
 
-        'total_pedidos': Pedido.objects.count(),
-        'total_ventas': Pedido.objects.filter(pagado=True).aggregate(Sum('total'))['total__sum'] or 0,
+        'total_pedidos': metricas['pedidos'],
+        'total_ventas': metricas['total_ventas'],
     }
     return render(request, 'snake_shop/dashboard_admin.html', context)
 
+@login_required
+@user_passes_test(es_admin)
+def estadisticas_cache_catalogo(request):
+    # Contadores de la caché del catálogo (hits/misses compartidos entre workers si se usa Redis)
+    return JsonResponse(catalog_cache.estadisticas())
+
 MODELS_MAP = {
-    'user': {'model': User, 'fields': ['first_name', 'last_name','username', 'email', 'is_active', 'is_staff'], 'can_create': True, 'can_delete': False,}, # MUY IMPORTANTE
-    'group': {'model': Group, 'fields': ['name'], 'can_create': True, 'can_delete': False,},
-    'categoria': {'model': Categoria, 'fields': ['nombre'], 'can_create': True,},
-    'producto': {'model': Producto, 'fields': ['nombre', 'precio', 'stock'], 'can_create': False,},
-    'pedido': {'model': Pedido, 'fields': ['usuario', 'total', 'pagado'], 'can_create': False,},
+    'user': {'model': User, 'fields': ['first_name', 'last_name','username', 'email', 'is_active', 'is_staff'], 'search': ['username', 'email', 'first_name', 'last_name'], 'can_create': True, 'can_delete': False,}, # MUY IMPORTANTE
+    'group': {'model': Group, 'fields': ['name'], 'search': ['name'], 'can_create': True, 'can_delete': False,},
+    'categoria': {'model': Categoria, 'fields': ['nombre'], 'search': ['nombre'], 'can_create': True,},
+    'producto': {'model': Producto, 'fields': ['nombre', 'precio', 'stock'], 'search': ['nombre'], 'can_create': False,},
+    'pedido': {'model': Pedido, 'fields': ['usuario', 'total', 'pagado'], 'search': ['folio', 'usuario__username'], 'can_create': False,},
     # 'ticketsoporte': {TicketSoporte, ['asunto', 'estado'], 'can_create': False,},
 }
 
+ORDEN_CRUD = ('-id',)
+CRUD_POR_PAGINA = 50
+
 FIELD_LABELS = {
     'user': {
         'first_name': 'Nombre',
@@ -763,16 +1097,48 @@ def crud_modelo(request, model_name):
     can_create = model_data.get('can_create', False)
     can_delete = model_data.get('can_delete', False)
 
-    objects = model_class.objects.all().order_by('-id')[:50]  # Paginación simple
+    # Solo las columnas mostradas (más la PK); las FK de la lista llegan en el mismo JOIN
+    relacionados = [f for f in fields if model_class._meta.get_field(f).many_to_one]
+    objects = model_class.objects.only('id', *fields)
+    if relacionados:
+        objects = objects.select_related(*relacionados)  # sin argumentos seguiría todas las FK
+    busqueda = request.GET.get('q', '').strip()
+    if busqueda:
+        filtro = Q()
+        for campo in model_data.get('search', []):
+            filtro |= Q(**{f'{campo}__icontains': busqueda})
+        if busqueda.isdigit():
+            filtro |= Q(id=int(busqueda))
+        objects = objects.filter(filtro)
+    try:
+        pagina = paginar_keyset(objects, ORDEN_CRUD, request.GET.get('cursor'), CRUD_POR_PAGINA)
+    except CursorInvalido:
+        pagina = paginar_keyset(objects, ORDEN_CRUD, None, CRUD_POR_PAGINA)
+
+    consulta = request.GET.copy()
+    consulta.pop('cursor', None)
     return render(request, 'snake_shop/crud/crud_list.html', {
         'model_name': model_name,
-        'objects': objects,
+        'objects': pagina,
         'fields': fields,
+        'busqueda': busqueda,
+        'puede_buscar': bool(model_data.get('search')),
+        'consulta': consulta.urlencode(),
         'can_create': can_create,
         'can_delete': can_delete,
         'field_labels': FIELD_LABELS.get(model_name.lower(), {}),
     })
 
+# Clases de formulario por modelo: se arman una vez por proceso, no en cada request
+_formularios_crud = {}
+
+def _formulario_crud(model_name):
+    FormClass = _formularios_crud.get(model_name)
+    if FormClass is None:
+        model_data = MODELS_MAP[model_name]
+        FormClass = _formularios_crud[model_name] = modelform_factory(model_data['model'], fields=model_data['fields'])
+    return FormClass
+
 @login_required
 @user_passes_test(es_admin)
 def crud_modelo_create(request, model_name):
@@ -780,12 +1146,7 @@ def crud_modelo_create(request, model_name):
     if not model_data:
         return redirect('dashboard_admin')
     
-    model_class = model_data['model']
-    fields = model_data['fields']
-    FormClass = modelform_factory(model_class, fields=fields)
-    
-
-    FormClass = modelform_factory(model_class, fields=fields)
+    FormClass = _formulario_crud(model_name.lower())
 
     if request.method == 'POST':
         form = FormClass(request.POST)
@@ -806,7 +1167,6 @@ def crud_modelo_update(request, model_name, pk):
         return redirect('dashboard_admin')
     
     model_class = model_data['model']
-    fields = model_data['fields']
     
     obj = get_object_or_404(model_class, pk=pk)
 
@@ -815,7 +1175,7 @@ def crud_modelo_update(request, model_name, pk):
         messages.error(request, "No puedes modificar tu propio usuario.")
         return redirect('crud_modelo', model_name=model_name)
 
-    FormClass = modelform_factory(model_class, fields=fields)
+    FormClass = _formulario_crud(model_name.lower())
     if request.method == 'POST':
         form = FormClass(request.POST, instance=obj)
         if form.is_valid():